@@ -0,0 +1,76 @@
+''' PooledDB专用连接的取出/归还吞吐量（次/秒）随线程数的变化。
+    驱动的rollback和ping模拟50微秒的网络往返
+--
+    python benchmarks/bench_pool_checkout.py [秒数]
+'''
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pyormx.PooledDB import PooledDB  # noqa: E402
+
+ROUND_TRIP = 0.00005
+THREADS = (1, 8, 64, 256)
+
+
+class _Connection(object):
+    def cursor(self):
+        return None
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        time.sleep(ROUND_TRIP)
+
+    def ping(self, *args):
+        time.sleep(ROUND_TRIP)
+        return True
+
+    def close(self):
+        pass
+
+
+class _Driver(object):
+    threadsafety = 1
+    OperationalError = OSError
+    InternalError = RuntimeError
+
+    @staticmethod
+    def connect(*args, **kw):
+        return _Connection()
+
+
+def checkoutRate(threads, maxconnections, seconds):
+    pool = PooledDB(_Driver, maxconnections=maxconnections, blocking=True)
+    stop = time.perf_counter() + seconds
+    counts = [0] * threads
+
+    def work(i):
+        n = 0
+        while time.perf_counter() < stop:
+            pool.connection(False).close()
+            n += 1
+        counts[i] = n
+
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    pool.close()
+    return sum(counts) / seconds
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+    for maxconnections in (0, 32):
+        rates = ('{}:{:.0f}'.format(t, checkoutRate(t, maxconnections, seconds)) for t in THREADS)
+        print('maxconnections={:<3}'.format(maxconnections), ' '.join(rates))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+''' 按列转换（rowsToStr）与逐个值转换（dataToStr）的对比，100k行
+--
+    python benchmarks/bench_row_conversion.py
+'''
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pyormx.sql_utils import rowsToStr, dataToStr  # noqa: E402
+
+ROWS = 100000
+
+
+def batches():
+    mixed = [[i, 'name%d' % i, i * 1.5, None if i % 3 else 'x', datetime.date(2020, 1, 1 + i % 28),
+              {'k': i} if i % 10 == 0 else [i]] for i in range(ROWS)]
+    plain = [[i, 'name%d' % i, i * 1.5, True, 'y'] for i in range(ROWS)]
+    return (('mixed', mixed), ('plain', plain))
+
+
+def main():
+    for name, rows in batches():
+        start = time.perf_counter()
+        expected = [list(map(dataToStr, row)) for row in rows]
+        perValue = time.perf_counter() - start
+
+        start = time.perf_counter()
+        converted = rowsToStr(rows)
+        column = time.perf_counter() - start
+
+        assert [list(row) for row in converted] == expected
+        print('{:6} per-value {:.3f}s  column {:.3f}s  x{:.1f}'.format(name, perValue, column, perValue / column))
+
+
+if __name__ == '__main__':
+    main()
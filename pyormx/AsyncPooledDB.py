@@ -0,0 +1,248 @@
+"""AsyncPooledDB - pooling for asyncio DB-API style connections.
+
+Implements a bounded pool of connections for asyncio database drivers
+that follow the DB-API 2 method names with awaitable methods, such as
+aiomysql.  It is the asyncio counterpart of PooledDB and is meant to be
+used together with AsyncOrm.
+
+Usage:
+
+    import aiomysql
+    from pyormx.AsyncPooledDB import AsyncPooledDB
+    pool = AsyncPooledDB(aiomysql, mincached=2, maxconnections=10,
+        host=..., user=..., password=..., db=...)
+    await pool.open()  # optional, creates the mincached connections
+
+    db = await pool.connection()
+    ...
+    await db.close()  # give the connection back to the pool
+
+Connections can also be used as asynchronous context managers:
+
+    async with await pool.connection() as db:
+        ...
+
+When maxconnections is reached, connection() waits (or raises
+TooManyConnections if blocking is false).  Waiters are served strictly
+in FIFO order: a returned connection is handed over directly to the
+longest waiting task, so new requests cannot overtake queued ones.
+
+"""
+
+import asyncio
+from collections import deque
+from time import perf_counter
+
+from .PooledDB import InvalidConnection, TooManyConnections
+
+__version__ = '1.3'
+
+
+async def _maybe_await(value):
+    """Await the value if it is awaitable, otherwise return it."""
+    if hasattr(value, '__await__'):
+        return await value
+    return value
+
+
+class AsyncPooledDB:
+    """Pool for asyncio DB-API style connections.
+
+    After you have created the connection pool, you can use
+    await connection() to get pooled connections.
+
+    """
+
+    version = __version__
+
+    def __init__(
+            self, creator, mincached=0, maxcached=0,
+            maxconnections=0, blocking=True, reset=True,
+            *args, **kwargs):
+        """Set up the asyncio connection pool.
+
+        creator: either a coroutine function returning new connections
+            or a module with such a connect() function (e.g. aiomysql)
+        mincached: initial number of idle connections in the pool,
+            created by open() (0 means no connections are made at startup)
+        maxcached: maximum number of idle connections in the pool
+            (0 or None means unlimited pool size)
+        maxconnections: maximum number of connections generally allowed
+            (0 or None means an arbitrary number of connections)
+        blocking: determines behavior when exceeding the maximum
+            (if this is set to true, wait in FIFO order until a connection
+            is returned, otherwise an error will be reported)
+        reset: whether connections should be rolled back
+            when they are returned to the pool
+        args, kwargs: the parameters that shall be passed to the creator
+
+        """
+        self._creator = creator
+        self._connect = getattr(creator, 'connect', creator)
+        if not callable(self._connect):
+            raise TypeError("%r is not a connection provider." % (creator,))
+        self._args, self._kwargs = args, kwargs
+        self._mincached = mincached or 0
+        self._maxcached = maxcached or 0
+        if self._maxcached and self._maxcached < self._mincached:
+            self._maxcached = self._mincached
+        self._maxconnections = maxconnections or 0
+        if self._maxconnections and self._maxconnections < self._maxcached:
+            self._maxconnections = self._maxcached
+        self._blocking = blocking
+        self._reset = reset
+        self._idle_cache = deque()  # the actual pool of idle connections
+        self._waiters = deque()  # futures of tasks waiting for a connection
+        self._connections = 0
+        self._closed = False
+
+    async def open(self):
+        """Establish the initial number of idle connections."""
+        while len(self._idle_cache) < self._mincached:
+            self._idle_cache.append(await self._connect(
+                *self._args, **self._kwargs))
+
+    async def connection(self, timeout=None):
+        """Get a connection from the pool.
+
+        timeout: maximum number of seconds to wait for a connection
+            when the pool is exhausted (None means wait forever)
+
+        """
+        if self._closed:
+            raise InvalidConnection
+        start = perf_counter()
+        if (self._maxconnections and (
+                self._waiters or self._connections >= self._maxconnections)):
+            if not self._blocking:
+                raise TooManyConnections
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                # the slot is handed over when the future is resolved
+                con = await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                raise TooManyConnections
+            except BaseException:
+                if waiter.done() and not waiter.cancelled() \
+                        and waiter.exception() is None:
+                    # a slot was handed over, give it back
+                    con = waiter.result()
+                    if con is None:  # a bare slot from _release_slot()
+                        self._release_slot()
+                    else:
+                        await self.cache(con)
+                raise
+            finally:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+        else:
+            self._connections += 1
+            con = None
+        wait_time = perf_counter() - start
+        if con is None:
+            try:
+                con = self._idle_cache.pop()
+            except IndexError:
+                try:
+                    con = await self._connect(*self._args, **self._kwargs)
+                except BaseException:
+                    self._release_slot()
+                    raise
+        con = AsyncPooledConnection(self, con)
+        con.wait_time = wait_time
+        return con
+
+    async def cache(self, con):
+        """Put a connection back into the idle cache."""
+        if self._reset:
+            try:
+                await _maybe_await(con.rollback())
+            except Exception:
+                pass
+            except BaseException:
+                # cancelled during the rollback: the connection is in an
+                # unknown state, so free its slot first and then close it
+                self._release_slot()
+                await self._close_con(con)
+                raise
+        # hand the connection over to the longest waiting task
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(con)
+                return
+        # free the slot before closing, which may be interrupted as well
+        self._connections -= 1
+        if self._closed or (
+                self._maxcached and len(self._idle_cache) >= self._maxcached):
+            await self._close_con(con)
+        else:
+            self._idle_cache.append(con)
+
+    def _release_slot(self):
+        """Give a reserved but unused slot to the next waiter or free it."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._connections -= 1
+
+    async def _close_con(self, con):
+        """Close an underlying connection, ignoring errors."""
+        try:
+            await _maybe_await(con.close())
+        except Exception:
+            pass
+
+    async def close(self):
+        """Close all idle connections in the pool."""
+        self._closed = True
+        while self._idle_cache:
+            await self._close_con(self._idle_cache.pop())
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(InvalidConnection())
+
+    def waiting(self):
+        """Return the number of tasks waiting for a connection."""
+        return len(self._waiters)
+
+
+class AsyncPooledConnection:
+    """Auxiliary proxy class for pooled asyncio connections."""
+
+    def __init__(self, pool, con):
+        """Create a pooled connection.
+
+        pool: the corresponding AsyncPooledDB instance
+        con: the underlying connection
+
+        """
+        self._pool = pool
+        self._con = con
+        # seconds spent waiting for a free connection in connection()
+        self.wait_time = 0.0
+
+    async def close(self):
+        """Give the connection back to the pool."""
+        if self._con:
+            con, self._con = self._con, None
+            await self._pool.cache(con)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def __getattr__(self, name):
+        """Proxy all members of the class."""
+        if self._con:
+            return getattr(self._con, name)
+        else:
+            raise InvalidConnection
@@ -63,6 +63,11 @@ an instance of PooledDB, passing the following parameters:
         (0 = None = never, 1 = default = whenever fetched from the pool,
         2 = when a cursor is created, 4 = when a query is executed,
         7 = always, and all other bit combinations of these values)
+    ping_idle: skip these pings for connections that have been used
+        successfully during the last ping_idle seconds (keyword only)
+    maintenance_interval, max_idle_time, max_lifetime, lifetime_jitter:
+        optional background maintenance of the idle connections
+        (keyword only, see the PooledDB constructor for details)
 
     The creator function or the connect function of the DB-API 2 compliant
     database module specified as the creator will receive any additional
@@ -123,8 +128,6 @@ back before being given back to the connection pool.
 
 Ideas for improvement:
 
-* Add a thread for monitoring, restarting (or closing) bad or expired
-  connections (similar to DBConnectionPool/ResourcePool by Warren Smith).
 * Optionally log usage, bad connections and exceeding of limits.
 
 
@@ -139,12 +142,24 @@ Licensed under the MIT license.
 
 """
 
-from threading import Condition
+from bisect import bisect_left
+from collections import deque
+from random import random
+from threading import Condition, Event, RLock, Thread
+from time import monotonic, perf_counter
+from weakref import ref
 
 from .SteadyDB import connect
 
 __version__ = '1.3'
 
+# counters of SteadyDB connections that are collected by the pool
+_CONNECTION_COUNTERS = (
+    'pings', 'pings_skipped', 'failures', 'reconnects', 'usage_resets')
+
+# upper bounds in seconds of the wait time histogram
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+
 
 class PooledDBError(Exception):
     """General PooledDB error."""
@@ -177,7 +192,10 @@ class PooledDB:
             maxshared=0, maxconnections=0, blocking=False,
             maxusage=None, setsession=None, reset=True,
             failures=None, ping=1,
-            *args, **kwargs):
+            *args, ping_idle=None, maintenance_interval=None,
+            max_idle_time=None, max_lifetime=None, lifetime_jitter=0.1,
+            metrics_callback=None, metrics_interval=60, checkout_timeout=None,
+            **kwargs):
         """Set up the DB-API 2 connection pool.
 
         creator: either an arbitrary function returning new DB-API 2
@@ -211,6 +229,28 @@ class PooledDB:
             (0 = None = never, 1 = default = whenever fetched from the pool,
             2 = when a cursor is created, 4 = when a query is executed,
             7 = always, and all other bit combinations of these values)
+        ping_idle: only send these pings when the connection has been idle
+            for more than ping_idle seconds or its last operation failed
+            (None means always ping as requested by the ping parameter)
+        maintenance_interval: if set, a background thread runs every
+            maintenance_interval seconds to keep mincached idle connections
+            open, close expired ones and ping idle connections so that
+            they are validated outside of the request path
+            (0 or None means no maintenance thread)
+        max_idle_time: idle connections beyond mincached that have not
+            been used for more than max_idle_time seconds are closed by
+            the maintenance thread (0 or None means no idle timeout)
+        max_lifetime: connections older than max_lifetime seconds are
+            closed instead of being reused (0 or None means no limit)
+        lifetime_jitter: the lifetime of each connection is shortened by
+            a random fraction up to lifetime_jitter, so that connections
+            created together do not all expire at the same time
+        metrics_callback: an optional function that is called from a
+            background thread with the result of stats() every
+            metrics_interval seconds
+        checkout_timeout: default number of seconds a blocking checkout
+            waits before TooManyConnections is raised (None means wait
+            forever); waiting callers are served in FIFO order
         args, kwargs: the parameters that shall be passed to the creator
             function or the connection constructor of the DB-API 2 module
 
@@ -235,8 +275,29 @@ class PooledDB:
         self._reset = reset
         self._failures = failures
         self._ping = ping
+        self._ping_idle = ping_idle
+        self._maintenance_interval = maintenance_interval
+        self._max_idle_time = max_idle_time
+        self._max_lifetime = max_lifetime
+        self._lifetime_jitter = lifetime_jitter
+        self._metrics_callback = metrics_callback
+        self._checkout_timeout = checkout_timeout
+        # counters of connections returned to the pool
+        self._counters = dict.fromkeys(_CONNECTION_COUNTERS, 0)
+        self._created = 0  # connections opened by the pool
+        self._create_failures = 0
+        self._checkouts = 0
+        self._rejected = 0  # checkouts refused by TooManyConnections
+        self._timeouts = 0  # rejected checkouts that timed out waiting
+        self._waiting = 0  # threads currently waiting for a connection
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)
+        self._stats_time = monotonic()
+        self._stats_checkouts = 0
         if mincached is None:
             mincached = 0
+        self._mincached = mincached
         if maxcached is None:
             maxcached = 0
         if maxconnections is None:
@@ -260,37 +321,79 @@ class PooledDB:
             self._maxconnections = maxconnections
         else:
             self._maxconnections = 0
-        self._idle_cache = []  # the actual pool of idle connections
-        self._lock = Condition()
+        # the actual pool of idle connections, used as a LIFO stack
+        # so that the most recently used (warm) connection is reused first
+        self._idle_cache = deque()
+        self._mutex = RLock()
+        self._lock = Condition(self._mutex)
+        # callers waiting for a dedicated connection, served in FIFO order,
+        # priority callers before all others
+        self._waiters = deque()
+        self._priority_waiters = deque()
         self._connections = 0
         # Establish an initial number of idle database connections:
         idle = [self.dedicated_connection() for i in range(mincached)]
         while idle:
             idle.pop().close()
+        self._maintenance = None
+        tasks = []
+        if maintenance_interval:
+            tasks.append((maintenance_interval, 'maintain'))
+        if metrics_callback and metrics_interval:
+            tasks.append((metrics_interval, '_report_metrics'))
+        if tasks:
+            self._maintenance = Event()  # set to stop the thread
+            Thread(target=_maintain,
+                   args=(ref(self), self._maintenance, tasks),
+                   name='PooledDB-maintenance', daemon=True).start()
 
     def steady_connection(self):
         """Get a steady, unpooled DB-API 2 connection."""
-        return connect(
-            self._creator, self._maxusage, self._setsession,
-            self._failures, self._ping, True, *self._args, **self._kwargs)
+        try:
+            con = connect(
+                self._creator, self._maxusage, self._setsession,
+                self._failures, self._ping, True, *self._args,
+                ping_idle=self._ping_idle, **self._kwargs)
+        except Exception:
+            with self._lock:
+                self._create_failures += 1
+            raise
+        with self._lock:
+            self._created += 1
+        if self._max_lifetime:
+            con._lifetime = self._max_lifetime * (
+                1 - random() * self._lifetime_jitter)
+        return con
 
-    def connection(self, shareable=True):
+    def connection(self, shareable=True, timeout=None, priority=False):
         """Get a steady, cached DB-API 2 connection from the pool.
 
         If shareable is set and the underlying DB-API 2 allows it,
         then the connection may be shared with other threads.
 
+        If the pool is blocking and all connections are in use, the
+        caller waits at most timeout seconds (default: checkout_timeout)
+        and then TooManyConnections is raised.  Callers waiting for a
+        dedicated connection are served in the order they arrived; with
+        priority set (e.g. for health checks), the caller is served
+        before all callers waiting without priority.
+
         """
+        start = perf_counter()
+        if timeout is None:
+            timeout = self._checkout_timeout
+        deadline = None if timeout is None else start + timeout
         if shareable and self._maxshared:
             self._lock.acquire()
             try:
                 while (not self._shared_cache and self._maxconnections
                         and self._connections >= self._maxconnections):
-                    self._wait_lock()
+                    self._wait_lock(deadline)
+                wait_time = perf_counter() - start
                 if len(self._shared_cache) < self._maxshared:
                     # shared cache is not full, get a dedicated connection
                     try:  # first try to get it from the idle cache
-                        con = self._idle_cache.pop(0)
+                        con = self._idle_cache.pop()
                     except IndexError:  # else get a fresh connection
                         con = self.steady_connection()
                     else:
@@ -303,13 +406,15 @@ class PooledDB:
                     while con.con._transaction:
                         # do not share connections which are in a transaction
                         self._shared_cache.insert(0, con)
-                        self._wait_lock()
+                        self._wait_lock(deadline)
                         self._shared_cache.sort()
                         con = self._shared_cache.pop(0)
+                    wait_time = perf_counter() - start
                     con.con._ping_check()  # check the underlying connection
                     con.share()  # increase share of this connection
                 # put the connection (back) into the shared cache
                 self._shared_cache.append(con)
+                self._record_checkout(wait_time)
                 self._lock.notify()
             finally:
                 self._lock.release()
@@ -317,25 +422,41 @@ class PooledDB:
         else:  # try to get a dedicated connection
             self._lock.acquire()
             try:
-                while (self._maxconnections
-                        and self._connections >= self._maxconnections):
-                    self._wait_lock()
-                # connection limit not reached, get a dedicated connection
-                try:  # first try to get it from the idle cache
-                    con = self._idle_cache.pop(0)
-                except IndexError:  # else get a fresh connection
-                    con = self.steady_connection()
+                if self._maxconnections and (
+                        self._connections >= self._maxconnections
+                        or self._priority_waiters
+                        or (self._waiters and not priority)):
+                    # no free slot, or others are already waiting for one:
+                    # queue up until a returned slot is handed over
+                    self._wait_slot(deadline, priority)
                 else:
-                    con._ping_check()  # check connection
-                con = PooledDedicatedDBConnection(self, con)
-                self._connections += 1
+                    # connection limit not reached, reserve a slot
+                    self._connections += 1
+                wait_time = perf_counter() - start
+                # take the most recently used idle connection if any
+                self._record_checkout(wait_time)
+                con = self._idle_cache.pop() if self._idle_cache else None
             finally:
                 self._lock.release()
+            # opening and pinging are round trips, do not hold the lock
+            try:
+                if con is not None and self._max_lifetime and self._expired(con):
+                    con.close()  # recycle the connection
+                    con = None
+                if con is None:
+                    con = self.steady_connection()
+                else:
+                    con._ping_check()  # check connection
+            except BaseException:
+                self._release_slot()
+                raise
+            con = PooledDedicatedDBConnection(self, con)
+        con.wait_time = wait_time
         return con
 
-    def dedicated_connection(self):
+    def dedicated_connection(self, timeout=None, priority=False):
         """Alias for connection(shareable=False)."""
-        return self.connection(False)
+        return self.connection(False, timeout, priority)
 
     def unshare(self, con):
         """Decrease the share of a connection in the shared cache."""
@@ -355,25 +476,325 @@ class PooledDB:
 
     def cache(self, con):
         """Put a dedicated connection back into the idle cache."""
+        # the rollback is a round trip, so it is done before taking the lock;
+        # the connection still holds its slot until it is in the idle cache
+        keep = (not self._maxcached
+                or len(self._idle_cache) < self._maxcached) and not (
+            self._max_lifetime and self._expired(con))
+        if keep:
+            try:
+                con._reset(force=self._reset)  # rollback possible transaction
+            except Exception:
+                keep = False
         self._lock.acquire()
         try:
-            if not self._maxcached or len(self._idle_cache) < self._maxcached:
-                con._reset(force=self._reset)  # rollback possible transaction
+            self._collect_counters(con)
+            if keep and (not self._maxcached
+                         or len(self._idle_cache) < self._maxcached):
                 # the idle cache is not full, so put it there
+                con._idle_since = monotonic()
                 self._idle_cache.append(con)  # append it to the idle cache
-            else:  # if the idle cache is already full,
+                con = None
+            self._free_slot()
+        finally:
+            self._lock.release()
+        if con is not None:  # if the idle cache is already full,
+            try:
                 con.close()  # then close the connection
+            except Exception:
+                pass
+
+    def _expired(self, con):
+        """Check whether the connection has exceeded its lifetime."""
+        lifetime = getattr(con, '_lifetime', self._max_lifetime)
+        return monotonic() - con._created >= lifetime
+
+    def maintain(self):
+        """Run one maintenance pass over the idle connections.
+
+        Closes idle connections that exceeded max_lifetime, closes
+        connections beyond mincached that were idle for longer than
+        max_idle_time, pings the remaining connections that have not been
+        used since the last pass, and opens new connections until there
+        are mincached idle ones again.  Only bookkeeping is done while
+        holding the lock.  This is called by the maintenance thread,
+        but can also be called directly.
+
+        """
+        now = monotonic()
+        # idle connections unused for longer than this are pinged
+        check_age = self._ping_idle or self._maintenance_interval or 0
+        expired, check = [], []
+        self._lock.acquire()
+        try:
+            keep = deque()
+            idle = len(self._idle_cache)
+            # the oldest idle connections are at the left end
+            for con in self._idle_cache:
+                idle_time = now - getattr(con, '_idle_since', now)
+                if self._max_lifetime and self._expired(con):
+                    expired.append(con)
+                    idle -= 1
+                elif (self._max_idle_time and idle > self._mincached
+                        and idle_time > self._max_idle_time):
+                    expired.append(con)
+                    idle -= 1
+                elif now - con._last_used > check_age:
+                    check.append(con)
+                else:
+                    keep.append(con)
+            self._idle_cache = keep
+            # connections being pinged are out of the idle cache, so they
+            # hold a slot like connections in use until they are put back
+            self._connections += len(check)
+            for con in expired:
+                self._collect_counters(con)
+        finally:
+            self._lock.release()
+        for con in expired:
+            try:
+                con.close()
+            except Exception:
+                pass
+        # validate connections without holding the lock
+        for con in check:
+            try:
+                alive = con.ping()
+            except (AttributeError, IndexError, TypeError, ValueError):
+                alive = None  # ping() is not available
+            except Exception:
+                alive = False
+            if alive is None or alive:
+                con._last_used = monotonic()
+                con._failed = False
+                self._put_idle(con, checked=True)
+            else:
+                try:
+                    con.close()
+                except Exception:
+                    pass
+                self._release_slot()
+        self._lock.acquire()
+        try:
+            missing = self._warm_room()
+        finally:
+            self._lock.release()
+        for i in range(missing):
+            if not self._put_idle(self.steady_connection(), warm=True):
+                break
+
+    def _warm_room(self):
+        """Return how many idle connections warmup may still open.
+
+        Warmup never lets the connections in use and the idle ones
+        together exceed maxconnections (with the lock held).
+
+        """
+        room = self._mincached - len(self._idle_cache)
+        if self._maxconnections:
+            room = min(room, self._maxconnections
+                       - self._connections - len(self._idle_cache))
+        return room
+
+    def _put_idle(self, con, warm=False, checked=False):
+        """Put a checked or new connection into the idle cache.
+
+        A checked connection has held a slot while it was pinged,
+        this slot is freed once the connection is back in the cache.
+
+        """
+        put = False
+        self._lock.acquire()
+        try:
+            if warm and self._warm_room() <= 0:
+                pass  # enough idle connections or no free slot
+            elif not self._maxcached or len(self._idle_cache) < self._maxcached:
+                if not hasattr(con, '_idle_since'):
+                    con._idle_since = monotonic()
+                # put it at the cold end, behind recently used connections
+                self._idle_cache.appendleft(con)
+                self._lock.notify()
+                put = True
+            if checked:
+                self._free_slot()
+        finally:
+            self._lock.release()
+        if not put:
+            try:
+                con.close()
+            except Exception:
+                pass
+        return put
+
+    def ping_stats(self):
+        """Return the number of sent and skipped pings.
+
+        The counters of a connection are added when it is returned
+        to the pool, so connections in use are not yet included.
+
+        """
+        self._lock.acquire()
+        try:
+            return {'pings': self._counters['pings'],
+                    'pings_skipped': self._counters['pings_skipped']}
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """Return a snapshot of the pool statistics as a dictionary.
+
+        in_use: connections currently checked out (shared connections
+            count once, connections being pinged by maintain() count
+            as well), idle: connections in the idle cache,
+        shared: connections in the shared cache, waiting: threads
+            waiting for a connection (priority_waiting of them in the
+            priority lane), max_connections and saturation
+            (in_use / max_connections, 0.0 when unlimited),
+        checkouts: total checkouts, checkout_rate: checkouts per second
+            since the previous call of stats(), rejected: checkouts that
+            raised TooManyConnections (timeouts of them after waiting),
+        wait: count, total and max wait time in seconds and a histogram
+            as a list of (upper bound, count) pairs, the last bound is None,
+        created and create_failures: connections opened by the pool,
+        pings, pings_skipped, failures, reconnects and usage_resets:
+            counters of the SteadyDB connections (failed operations,
+            transparent reconnects and resets caused by maxusage),
+            collected when the connections are returned to the pool
+
+        """
+        self._lock.acquire()
+        try:
+            now = monotonic()
+            elapsed = now - self._stats_time
+            rate = (self._checkouts - self._stats_checkouts) / elapsed \
+                if elapsed > 0 else 0.0
+            self._stats_time, self._stats_checkouts = now, self._checkouts
+            stats = {
+                'in_use': self._connections,
+                'idle': len(self._idle_cache),
+                'shared': len(self._shared_cache) if self._maxshared else 0,
+                'waiting': self._waiting,
+                'priority_waiting': len(self._priority_waiters),
+                'max_connections': self._maxconnections,
+                'saturation': self._connections / self._maxconnections
+                if self._maxconnections else 0.0,
+                'checkouts': self._checkouts,
+                'checkout_rate': rate,
+                'rejected': self._rejected,
+                'timeouts': self._timeouts,
+                'wait': {
+                    'count': self._checkouts,
+                    'total': self._wait_total,
+                    'max': self._wait_max,
+                    'buckets': list(zip(
+                        WAIT_BUCKETS + (None,), self._wait_buckets))},
+                'created': self._created,
+                'create_failures': self._create_failures}
+            stats.update(self._counters)
+            return stats
+        finally:
+            self._lock.release()
+
+    def _report_metrics(self):
+        """Pass the current statistics to the metrics callback."""
+        self._metrics_callback(self.stats())
+
+    def _record_checkout(self, wait_time):
+        """Count a checkout and its wait time (with the lock held)."""
+        self._checkouts += 1
+        self._wait_total += wait_time
+        if wait_time > self._wait_max:
+            self._wait_max = wait_time
+        self._wait_buckets[bisect_left(WAIT_BUCKETS, wait_time)] += 1
+
+    def _collect_counters(self, con):
+        """Add the counters of a connection (with the lock held)."""
+        counters = self._counters
+        if con.pings:
+            counters['pings'] += con.pings
+            con.pings = 0
+        if con.pings_skipped:
+            counters['pings_skipped'] += con.pings_skipped
+            con.pings_skipped = 0
+        if con.failures or con.reconnects or con.usage_resets:
+            counters['failures'] += con.failures
+            counters['reconnects'] += con.reconnects
+            counters['usage_resets'] += con.usage_resets
+            con.failures = con.reconnects = con.usage_resets = 0
+
+    def _release_slot(self):
+        """Give back a slot that was reserved for a failed checkout."""
+        self._lock.acquire()
+        try:
+            self._free_slot()
+        finally:
+            self._lock.release()
+
+    def _free_slot(self):
+        """Free a connection slot (with the lock held).
+
+        If callers are waiting for a dedicated connection, the slot is
+        handed over to the first of them instead, so that callers that
+        arrive later cannot take it away.
+
+        """
+        waiters = self._priority_waiters or self._waiters
+        if waiters:
+            waiter = waiters.popleft()
+            waiter.granted = True
+            waiter.cond.notify()
+        else:
             self._connections -= 1
             self._lock.notify()
+
+    def _wait_slot(self, deadline, priority=False):
+        """Wait until a slot is handed over (with the lock held).
+
+        Raises InvalidConnection if the pool is closed while waiting.
+
+        """
+        if not self._blocking:
+            self._rejected += 1
+            raise TooManyConnections
+        waiter = _Waiter(Condition(self._mutex))
+        waiters = self._priority_waiters if priority else self._waiters
+        waiters.append(waiter)
+        self._waiting += 1
+        try:
+            while not (waiter.granted or waiter.closed):
+                if deadline is None:
+                    waiter.cond.wait()
+                else:
+                    remaining = deadline - perf_counter()
+                    if remaining <= 0:
+                        break
+                    waiter.cond.wait(remaining)
+        except BaseException:
+            # interrupted (e.g. KeyboardInterrupt or a signal handler):
+            # leave the queue, or pass on a slot already handed over
+            if waiter.granted:
+                self._free_slot()
+            elif not waiter.closed:
+                waiters.remove(waiter)
+            raise
         finally:
-            self._lock.release()
+            self._waiting -= 1
+        if waiter.closed:
+            raise InvalidConnection
+        if not waiter.granted:
+            waiters.remove(waiter)
+            self._rejected += 1
+            self._timeouts += 1
+            raise TooManyConnections
 
     def close(self):
         """Close all connections in the pool."""
+        if self._maintenance is not None:
+            self._maintenance.set()
         self._lock.acquire()
         try:
             while self._idle_cache:  # close all idle connections
-                con = self._idle_cache.pop(0)
+                con = self._idle_cache.popleft()
                 try:
                     con.close()
                 except Exception:
@@ -386,6 +807,12 @@ class PooledDB:
                     except Exception:
                         pass
                     self._connections -= 1
+            # wake up callers waiting for a slot, they will get an error
+            for waiters in (self._priority_waiters, self._waiters):
+                while waiters:
+                    waiter = waiters.popleft()
+                    waiter.closed = True
+                    waiter.cond.notify()
             self._lock.notifyAll()
         finally:
             self._lock.release()
@@ -397,15 +824,37 @@ class PooledDB:
         except Exception:
             pass
 
-    def _wait_lock(self):
+    def _wait_lock(self, deadline=None):
         """Wait until notified or report an error."""
         if not self._blocking:
+            self._rejected += 1
             raise TooManyConnections
-        self._lock.wait()
+        if deadline is not None:
+            remaining = deadline - perf_counter()
+            if remaining <= 0:
+                self._rejected += 1
+                self._timeouts += 1
+                raise TooManyConnections
+        self._waiting += 1
+        try:
+            self._lock.wait(None if deadline is None else remaining)
+        finally:
+            self._waiting -= 1
 
 
 # Auxiliary classes for pooled connections
 
+class _Waiter:
+    """A caller waiting for a dedicated connection slot."""
+
+    __slots__ = ('cond', 'granted', 'closed')
+
+    def __init__(self, cond):
+        self.cond = cond
+        self.granted = False
+        self.closed = False
+
+
 class PooledDedicatedDBConnection:
     """Auxiliary proxy class for pooled dedicated connections."""
 
@@ -423,6 +872,8 @@ class PooledDedicatedDBConnection:
             raise NotSupportedError("Database module is not thread-safe.")
         self._pool = pool
         self._con = con
+        # seconds spent waiting for a free connection in connection()
+        self.wait_time = 0.0
 
     def close(self):
         """Close the pooled dedicated connection."""
@@ -512,6 +963,8 @@ class PooledSharedDBConnection:
         self._pool = pool
         self._shared_con = shared_con
         self._con = con
+        # seconds spent waiting for a free connection in connection()
+        self.wait_time = 0.0
 
     def close(self):
         """Close the pooled shared connection."""
@@ -534,3 +987,25 @@ class PooledSharedDBConnection:
             self.close()
         except Exception:
             pass
+
+
+def _maintain(pool_ref, stop, tasks):
+    """Run the periodic tasks of a pool until it is closed or deleted.
+
+    tasks is a list of (interval, method name) pairs.
+
+    """
+    due = [monotonic() + interval for interval, name in tasks]
+    while not stop.wait(max(0, min(due) - monotonic())):
+        pool = pool_ref()
+        if pool is None:
+            break
+        now = monotonic()
+        for i, (interval, name) in enumerate(tasks):
+            if due[i] <= now:
+                due[i] = now + interval
+                try:
+                    getattr(pool, name)()
+                except Exception:
+                    pass  # e.g. the database is down, try again next time
+        del pool
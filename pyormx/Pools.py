@@ -25,6 +25,8 @@ class Pool(object):
                 maxusage:一个链接最多被重复使用的次数，None表示无限制
                 setsession:开始会话前执行的命令列表。如：["set datestyle to ...", "set time zone ..."]
                 ping:MySQL服务端，检查是否服务可用。# 如：0 = None = never, 1 = default = whenever it is requested, 2 = when a cursor is created, 4 = when a query is executed, 7 = always
+                ping_idle:连接在ping_idle秒内成功使用过（且上次操作没有出错）时跳过ping，None表示按ping的设置每次都ping
+                checkout_timeout:blocking为True时获取连接最多等待的秒数，超时抛出TooManyConnections，None表示一直等待；等待的请求按先后顺序获得连接
                 host:服务器地址
                 port：端口
                 user：账户
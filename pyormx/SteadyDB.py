@@ -91,6 +91,7 @@ Licensed under the MIT license.
 """
 
 import sys
+from time import monotonic
 
 __version__ = '1.3'
 
@@ -110,7 +111,7 @@ class InvalidCursor(SteadyDBError):
 
 def connect(
         creator, maxusage=None, setsession=None,
-        failures=None, ping=1, closeable=True, *args, **kwargs):
+        failures=None, ping=1, closeable=True, *args, ping_idle=None, **kwargs):
     """A tough version of the connection constructor of a DB-API 2 module.
 
     creator: either an arbitrary function returning new DB-API 2 compliant
@@ -130,13 +131,17 @@ def connect(
         7 = always, and all other bit combinations of these values)
     closeable: if this is set to false, then closing the connection will
         be silently ignored, but by default the connection can be closed
+    ping_idle: if set, a ping requested by the ping parameter is only sent
+        when the connection has not been used successfully during the last
+        ping_idle seconds or when its last operation failed; skipped pings
+        are counted in the pings_skipped attribute (None means always ping)
     args, kwargs: the parameters that shall be passed to the creator
         function or the connection constructor of the DB-API 2 module
 
     """
     return SteadyDBConnection(
         creator, maxusage, setsession,
-        failures, ping, closeable, *args, **kwargs)
+        failures, ping, closeable, *args, ping_idle=ping_idle, **kwargs)
 
 
 class SteadyDBConnection:
@@ -146,7 +151,8 @@ class SteadyDBConnection:
 
     def __init__(
             self, creator, maxusage=None, setsession=None,
-            failures=None, ping=1, closeable=True, *args, **kwargs):
+            failures=None, ping=1, closeable=True, *args, ping_idle=None,
+            **kwargs):
         """Create a "tough" DB-API 2 connection."""
         # basic initialization to make finalizer work
         self._con = None
@@ -187,6 +193,12 @@ class SteadyDBConnection:
             raise TypeError("'failures' must be a tuple of exceptions.")
         self._failures = failures
         self._ping = ping if isinstance(ping, int) else 0
+        self._ping_idle = ping_idle
+        self.pings = 0  # number of pings sent
+        self.pings_skipped = 0  # number of pings skipped by ping_idle
+        self.failures = 0  # number of failed database operations
+        self.reconnects = 0  # number of times the connection was reopened
+        self.usage_resets = 0  # number of resets caused by maxusage
         self._closeable = closeable
         self._args, self._kwargs = args, kwargs
         self._store(self._create())
@@ -307,10 +319,21 @@ class SteadyDBConnection:
 
     def _store(self, con):
         """Store a database connection for subsequent use."""
+        if self._con is not None:
+            self.reconnects += 1
         self._con = con
         self._transaction = False
         self._closed = False
         self._usage = 0
+        self._created = monotonic()
+        self._last_used = self._created
+        self._failed = False
+
+    def _used(self):
+        """Remember a successful database operation."""
+        self._usage += 1
+        self._last_used = monotonic()
+        self._failed = False
 
     def _close(self):
         """Close the tough connection.
@@ -348,6 +371,12 @@ class SteadyDBConnection:
 
         """
         if ping & self._ping:
+            if (self._ping_idle is not None and not self._failed
+                    and monotonic() - self._last_used < self._ping_idle):
+                # the connection has been used recently, trust it
+                self.pings_skipped += 1
+                return True
+            self.pings += 1
             try:  # if possible, ping the connection
                 alive = self._con.ping()
             except (AttributeError, IndexError, TypeError, ValueError):
@@ -361,6 +390,8 @@ class SteadyDBConnection:
                     alive = True
                 if alive:
                     reconnect = False
+                    self._last_used = monotonic()
+                    self._failed = False
             if reconnect and not self._transaction:
                 try:  # try to reopen the connection
                     con = self._create()
@@ -483,9 +514,13 @@ class SteadyDBConnection:
             if self._maxusage:
                 if self._usage >= self._maxusage:
                     # the connection was used too often
+                    self.usage_resets += 1
                     raise self._failure
             cursor = self._con.cursor(*args, **kwargs)  # try to get a cursor
         except self._failures as error:  # error in getting cursor
+            if not (self._maxusage and self._usage >= self._maxusage):
+                self._failed = True
+                self.failures += 1
             try:  # try to reopen the connection
                 con = self._create()
             except Exception:
@@ -598,6 +633,7 @@ class SteadyDBCursor:
                 if con._maxusage:
                     if con._usage >= con._maxusage:
                         # the connection was used too often
+                        con.usage_resets += 1
                         raise con._failure
                 if execute:
                     self._setsizes()
@@ -606,6 +642,9 @@ class SteadyDBCursor:
                 if execute:
                     self._clearsizes()
             except con._failures as error:  # execution error
+                if not (con._maxusage and con._usage >= con._maxusage):
+                    con._failed = True
+                    con.failures += 1
                 if not transaction:
                     try:
                         cursor2 = con._cursor(
@@ -625,7 +664,7 @@ class SteadyDBCursor:
                         else:
                             self.close()
                             self._cursor = cursor2
-                            con._usage += 1
+                            con._used()
                             return result
                         try:
                             cursor2.close()
@@ -669,7 +708,7 @@ class SteadyDBCursor:
                             con._close()
                             con._store(con2)
                             self._cursor = cursor2
-                            con._usage += 1
+                            con._used()
                             if error2:
                                 raise error2  # raise the other error
                             return result
@@ -685,7 +724,7 @@ class SteadyDBCursor:
                     self._transaction = False
                 raise error  # re-raise the original error again
             else:
-                con._usage += 1
+                con._used()
                 return result
         return tough_method
 
@@ -7,3 +7,19 @@ from .example import Example
 from .Pools import Pool
 
 from .PooledDB import PooledDB
+
+from .async_orm import AsyncOrm
+
+from .AsyncPooledDB import AsyncPooledDB
+
+from .executor import OrmExecutor
+
+from .query import Query
+
+from .hooks import QueryHook, QueryStats, SlowQueryLog
+
+from .query_cache import QueryCache, CacheBackend
+
+from .loader import DataLoader, AsyncDataLoader, Loaders
+
+from .transaction import Transaction, AsyncTransaction
@@ -0,0 +1,580 @@
+import asyncio
+import logging
+import os
+import time
+from .constant import BULK_MAX_PARAMS, BULK_MAX_BYTES, PRIMARY_KEY, IN_CHUNK_SIZE, ITER_BATCH_SIZE
+from .hooks import _hooks, startEvent, finishEvent, resultRows
+from .sqllog import sqlLog
+from .orm import Orm, _POSTGRE, _chunks, _decodeToken, _copyBatches, _writeInfile
+
+__all__ = ['AsyncOrm']
+
+_log = logging.getLogger()
+
+
+async def _maybeAwait(value):
+    ''' 兼容不同驱动：返回值可等待则等待，否则直接返回
+    --
+    '''
+    if hasattr(value, '__await__'):
+        return await value
+    return value
+
+
+class AsyncOrm(Orm):
+    def __init__(self, conn, tableName, keyProperty=PRIMARY_KEY, auto_commit=True):
+        ''' Orm的异步版本，方法与Orm相同，都需要await。适用于aiomysql等方法可等待的DB-API风格驱动
+            （aiopg只能自动提交，不能commit/rollback，不支持），连接可以来自AsyncPooledDB。sql语句的生成与Orm共用
+        --
+            @example
+                pool = AsyncPooledDB(aiomysql, maxconnections=10, host=..., db=...)
+                conn = await pool.connection()
+                stuOrm = AsyncOrm(conn, 'student', 'sid')
+                res = await stuOrm.selectByExample(Example().andLike('name', '张%'))
+                await conn.close()
+
+            @param conn: 数据库连接
+            @param tableName: 表名
+            @param keyProperty: 主键字段名。可以不填，不填默认主键名为id
+            @param auto_commit: 自动提交
+        '''
+        super().__init__(conn, tableName, keyProperty, auto_commit)
+
+    #################################### 新增操作 ####################################
+    async def insertData(self, *args, **kw):
+        ''' 向数据库中写入数据，参数同Orm.insertData
+        --
+        '''
+        n = len(args)
+        if n == 1:
+            if isinstance(args[0], list):
+                return await self.insertDictList(args[0], **kw)
+            elif isinstance(args[0], dict):
+                return await self.insertOne(args[0], **kw)
+        elif n == 2:
+            return await self.insertMany(args[0], args[1], **kw)
+        return -1
+
+    async def insertOne(self, data, ignore=False, replace=False, update=False):
+        ''' 向数据库写入一条数据，参数同Orm.insertOne
+        --
+        '''
+        sql, values = self._insertOneSql(data, ignore, replace, update)
+        try:
+            return await self._execute(sql, values, 'insertid', 'insertOne error; values:{}', data)
+        finally:
+            self._invalidate(None if replace or update else [])
+
+    async def insertMany(self, keys, data, **kw):
+        ''' 插入一组数据，参数同Orm.insertMany
+        --
+        '''
+        if not data:
+            raise Exception('数据为空！')
+
+        if isinstance(data, list):
+            columns, dataList = self._manyRows(keys, data)
+            return await self.insertBulk(columns, dataList, **kw)
+
+        sql, values = self._insertDictSql(keys, data)
+        return await self._execute(sql, values, 'insertid', 'insertList error; values:{}', values)
+
+    async def insertDictList(self, dataList, **kw):
+        ''' 插入一组数据，参数同Orm.insertDictList
+        --
+        '''
+        if not dataList or not dataList[0]:
+            raise Exception('数据为空！')
+
+        groups = self._dictListGroups(dataList)
+        autoCommit = self.auto_commit
+        self.auto_commit = False
+        try:
+            affectedRows = 0
+            for columns, values in groups.items():
+                affectedRows += await self.insertBulk(list(columns), values, **kw)
+            if autoCommit:
+                await _maybeAwait(self.conn.commit())
+            return affectedRows
+        finally:
+            self.auto_commit = autoCommit
+
+    async def insertBulk(self, keys, dataList, ignore=False, replace=False, update=False,
+                         maxParams=BULK_MAX_PARAMS, maxBytes=BULK_MAX_BYTES, onChunk=None):
+        ''' 多行VALUES批量写入，参数同Orm.insertBulk
+        --
+        '''
+        chunks = self._bulkChunks(keys, dataList, ignore, replace, update, maxParams, maxBytes)
+        try:
+            return await self._executeChunks(chunks, 'insertBulk', onChunk,
+                                             'insertBulk error; keys:{} rows:{}', keys, len(dataList))
+        finally:
+            self._invalidate(None if replace or update else [])
+
+    async def _executeChunks(self, chunks, name, onChunk, error, *errorArgs):
+        ''' 在同一个游标上逐块执行，全部执行完再提交一次，参数同Orm._executeChunks
+        --
+        '''
+        cursor = await _maybeAwait(self.conn.cursor())
+        try:
+            affectedRows = 0
+            for i, (sql, values, n) in enumerate(chunks):
+                event = startEvent(self, sql, values, name) if _hooks else None
+                logStart = sqlLog.before(sql, values)
+                start = time.perf_counter()
+                try:
+                    res = await cursor.execute(sql, values)
+                    sqlLog.after(logStart, sql, values)
+                except Exception as e:
+                    if event:
+                        finishEvent(event, None, e)
+                    raise
+                cost = time.perf_counter() - start
+                res = res if res is not None else cursor.rowcount
+                if event:
+                    finishEvent(event, res)
+                affectedRows += res
+                _log.debug('%s第%s块：%s行，耗时%.3f秒', name, i, n, cost)
+                if onChunk:
+                    onChunk(i, n, cost)
+            if self.auto_commit:
+                await _maybeAwait(self.conn.commit())
+            return affectedRows
+        except Exception as e:
+            _log.error(e)
+            await self._rollback()
+            raise Exception(error.format(*errorArgs))
+        finally:
+            await _maybeAwait(cursor.close())
+
+    async def upsertMany(self, dataList, conflictKeys=None, updateKeys=None,
+                         maxParams=BULK_MAX_PARAMS, maxBytes=BULK_MAX_BYTES, onChunk=None):
+        ''' 批量写入，存在则更新，参数同Orm.upsertMany
+        --
+        '''
+        chunks = self._upsertChunks(dataList, conflictKeys, updateKeys, maxParams, maxBytes)
+        try:
+            return await self._executeChunks(chunks, 'upsertMany', onChunk,
+                                             'upsertMany error; rows:{}', len(dataList))
+        finally:
+            self._invalidate()
+
+    #################################### 更新操作 ####################################
+    async def updateByPrimaryKey(self, data, primaryValue=None, keys=None):
+        ''' 根据主键更新数据，参数同Orm.updateByPrimaryKey
+        --
+        '''
+        sql, values = self._updateByPrimaryKeySql(data, primaryValue, keys)
+        try:
+            return await self._execute(sql, values, None, 'updateByPrimaryKey error; values:{}', data)
+        finally:
+            self._invalidate([values[-1], data.get(self.keyProperty)])
+
+    async def updateManyByPrimaryKey(self, dataList, keys=None, maxParams=BULK_MAX_PARAMS,
+                                     maxBytes=BULK_MAX_BYTES, onChunk=None):
+        ''' 根据主键批量更新，参数同Orm.updateManyByPrimaryKey
+        --
+        '''
+        groups, primaryValues = self._updateManyGroups(dataList, keys)
+        try:
+            return await self._executeChunks(self._updateManyChunks(groups, maxParams, maxBytes),
+                                             'updateManyByPrimaryKey', onChunk,
+                                             'updateManyByPrimaryKey error; rows:{}', len(dataList))
+        finally:
+            self._invalidate(primaryValues)
+
+    async def updateByExample(self, data, example, keys=None):
+        ''' 根据Example条件更新，参数同Orm.updateByExample
+        --
+        '''
+        sql, values = self._updateByExampleSql(data, example, keys)
+        try:
+            return await self._execute(sql, values, None, 'updateByExample error; values:{}', data)
+        finally:
+            self._invalidate()
+
+    #################################### 查询操作 ####################################
+    async def selectAll(self, query=None):
+        ''' 查询所有
+        --
+        '''
+        return await self._execute(self._selectAllSql(query), None, 'all', 'selectAll error; ')
+
+    async def selectByPrimaeyKey(self, primaryValue, query=None):
+        ''' 根据主键查询，开启enablePrimaryKeyCache后先从缓存读取
+        --
+        '''
+        cache, shape = self._pkCacheFor(query)
+        if cache is not None:
+            key = (str(primaryValue), shape)
+            row = cache.get(key)
+            if row is not None:
+                return dict(row)
+            version = cache.version
+        res = await self._execute(self._selectByPrimaryKeySql(query), [primaryValue], 'one',
+                                  'selectByPrimaeyKey error; values:{}', primaryValue)
+        if cache is not None and res:
+            cache.put(key, dict(res), version)
+            cache.shapes.add(shape)
+        return res
+
+    async def selectByPrimaryKeys(self, primaryValues, query=None, chunkSize=IN_CHUNK_SIZE):
+        ''' 根据一组主键批量查询，参数同Orm.selectByPrimaryKeys
+        --
+        '''
+        res, misses, cache, shape = self._primaryKeysFromCache(primaryValues, query)
+        version = cache.version if cache is not None else None
+        for chunk in _chunks(misses, chunkSize):
+            rows = await self._execute(self._selectByPrimaryKeysSql(len(chunk), query), chunk, 'all',
+                                       'selectByPrimaryKeys error; values:{}', chunk)
+            self._collectPrimaryKeys(res, chunk, rows, cache, shape, version)
+        return res
+
+    async def selectByExample(self, example, query=None):
+        ''' 根据Example条件进行查询
+        --
+        '''
+        sql, values = self._selectByExampleSql(example, query)
+        return await self._execute(sql, values, 'all', 'selectByExample error; values:{}', example)
+
+    async def selectTransactByExample(self, transactProperties, example, transactName='', transact='COUNT', query=None):
+        ''' 根据Example条件聚合查询，参数同Orm.selectTransactByExample
+        --
+        '''
+        sql, values = self._selectTransactSql(transactProperties, example, transactName, transact, False, query)
+        return await self._execute(sql, values, 'all',
+                                   'selectTransactByExample error; values:{}', transactProperties)
+
+    async def selectGroupHavingByExample(self, transactProperties, example, transactName='', transact='COUNT', query=None):
+        ''' 根据Example条件分组聚合查询，参数同Orm.selectGroupHavingByExample
+        --
+        '''
+        if not (query or self).groupByStr:
+            return False
+
+        sql, values = self._selectTransactSql(transactProperties, example, transactName, transact, True, query)
+        return await self._execute(sql, values, 'all',
+                                   'selectGroupHavingByExample error; values:{}', transactProperties)
+
+    async def selectPageAll(self, page=1, pageNum=10, query=None):
+        ''' 分页查询
+        --
+        '''
+        return await self.selectPageByExample(None, page, pageNum, query)
+
+    async def selectPageByExample(self, example, page=1, pageNum=10, query=None):
+        ''' 根据Example条件分页查询，example为None则查询所有
+        --
+        '''
+        startId = (page - 1) * pageNum
+        sql, values = self._countSql(example, query)
+        numRes = await self._execute(sql, values, 'one', 'selectPageByExample error; values:{}', example)
+        num = numRes['num']
+
+        if num == 0 or num < startId:
+            return num, []
+
+        sql, values = self._selectPageSql(example, startId, pageNum, query)
+        res = await self._execute(sql, values, 'all', 'selectPageByExample error; values:{}', example)
+        return num, res
+
+    async def selectSeekAll(self, token=None, pageNum=10, seekKey=None, clause='ASC', count=False, query=None):
+        ''' 游标（keyset）分页查询，参数同Orm.selectSeekAll
+        --
+        '''
+        return await self.selectSeekByExample(None, token, pageNum, seekKey, clause, count, query)
+
+    async def selectSeekByExample(self, example=None, token=None, pageNum=10, seekKey=None, clause='ASC', count=False, query=None):
+        ''' 根据Example条件进行游标（keyset）分页查询，参数同Orm.selectSeekByExample
+        --
+        '''
+        seek = _decodeToken(token)
+        num = seek.get('n')
+        if count and num is None:
+            sql, values = self._countSql(example, query)
+            numRes = await self._execute(sql, values, 'one', 'selectSeekByExample error; values:{}', example)
+            num = numRes['num']
+
+        sql, values = self._seekSql(example, seek, pageNum, seekKey, clause, query)
+        res = await self._execute(sql, values, 'all', 'selectSeekByExample error; values:{}', example)
+        return self._seekResult(res, pageNum, seekKey, num, count)
+
+    #################################### 流式查询 ####################################
+    def iterAll(self, batchSize=ITER_BATCH_SIZE, query=None):
+        ''' 使用服务端游标逐行读取所有数据，返回异步迭代器，参数同Orm.iterAll
+        --
+            @example
+                async for row in orm.iterAll(5000):
+                    ...
+        '''
+        return self._iterSql(self._selectAllSql(query), None, batchSize, 'iterAll')
+
+    def iterByExample(self, example, batchSize=ITER_BATCH_SIZE, query=None):
+        ''' 根据Example条件使用服务端游标逐行读取数据，返回异步迭代器
+        --
+        '''
+        sql, values = self._selectByExampleSql(example, query)
+        return self._iterSql(sql, values, batchSize, 'iterByExample')
+
+    def iterAllBySQL(self, sql, values=None, batchSize=ITER_BATCH_SIZE):
+        ''' 使用服务端游标逐行读取原生sql的查询结果，返回异步迭代器
+        --
+        '''
+        return self._iterSql(self._encodeSql(sql), values, batchSize, 'iterAllBySQL')
+
+    async def _iterSql(self, sql, values, batchSize, name):
+        ''' 流式查询异步生成器，参数同Orm._iterSql。读取完毕或aclose()之前会一直占用当前连接
+        --
+        '''
+        error = name + ' error; sql:{} values:{}'
+        event = startEvent(self, sql, values, error) if _hooks else None
+        cursor = await _maybeAwait(self._serverCursor(batchSize))
+        count = 0
+        try:
+            try:
+                logStart = sqlLog.before(sql, values)
+                if values:
+                    await cursor.execute(sql, values)
+                else:
+                    await cursor.execute(sql)
+                sqlLog.after(logStart, sql, values)
+                while True:
+                    rows = await cursor.fetchmany(batchSize)
+                    if not rows:
+                        break
+                    count += len(rows)
+                    for row in rows:
+                        yield row
+            finally:
+                # 先关闭服务端游标再提交
+                await _maybeAwait(cursor.close())
+            if self.auto_commit:
+                await _maybeAwait(self.conn.commit())
+            if event:
+                finishEvent(event, count)
+        except GeneratorExit:
+            # 提前关闭生成器，结束服务端游标所在的事务
+            if self.auto_commit:
+                await _maybeAwait(self.conn.commit())
+            if event:
+                finishEvent(event, count)
+            raise
+        except Exception as e:
+            _log.error(e)
+            if event:
+                finishEvent(event, None, e)
+            await self._rollback()
+            raise Exception(error.format(sql, values))
+
+    def _serverCursor(self, batchSize):
+        ''' 创建服务端游标：aiomysql使用SSDictCursor
+        --
+        '''
+        try:
+            from aiomysql import SSDictCursor
+        except ImportError:
+            return self.conn.cursor()
+        return self.conn.cursor(SSDictCursor)
+
+    async def copyIn(self, rows, columns, localInfile=False, batchSize=ITER_BATCH_SIZE):
+        ''' 流式导入大量数据，返回写入的行数，参数同Orm.copyIn。
+            localInfile为True时使用LOAD DATA LOCAL INFILE（需要连接开启local_infile），否则按batchSize分批调用insertBulk
+        --
+        '''
+        if localInfile:
+            return await self._loadDataInfile(rows, columns)
+
+        autoCommit = self.auto_commit
+        self.auto_commit = False
+        try:
+            count = 0
+            for batch in _copyBatches(rows, columns, batchSize):
+                await self.insertBulk(columns, batch)
+                count += len(batch)
+            if autoCommit:
+                await _maybeAwait(self.conn.commit())
+            return count
+        finally:
+            self.auto_commit = autoCommit
+
+    async def _loadDataInfile(self, rows, columns):
+        ''' mysql LOAD DATA LOCAL INFILE，参数同Orm._loadDataInfile
+        --
+        '''
+        path, lines = _writeInfile(rows, columns)
+        sql = self._loadDataSql(columns)
+        cursor = None
+        try:
+            cursor = await _maybeAwait(self.conn.cursor())
+            logStart = sqlLog.before(sql, [path])
+            await cursor.execute(sql, [path])
+            sqlLog.after(logStart, sql, [path])
+            if self.auto_commit:
+                await _maybeAwait(self.conn.commit())
+            return lines
+        except Exception as e:
+            _log.error(e)
+            await self._rollback()
+            raise Exception('copyIn error; file:{}'.format(path))
+        finally:
+            if cursor:
+                await _maybeAwait(cursor.close())
+            os.remove(path)
+            self._invalidate([])
+
+    #################################### 删除操作 ####################################
+    async def deleteByPrimaryKey(self, primaryValue):
+        ''' 根据主键删除
+        --
+        '''
+        sql, values = self._deleteByPrimaryKeySql(primaryValue)
+        try:
+            return await self._execute(sql, values, None, 'deleteByPrimaryKey error; values:{}', primaryValue)
+        finally:
+            self._invalidate([primaryValue])
+
+    async def deleteByExample(self, example):
+        ''' 根据Example条件删除数据
+        --
+        '''
+        sql, values = self._deleteByExampleSql(example)
+        try:
+            return await self._execute(sql, values, None, 'deleteByExample error; values:{}', example)
+        finally:
+            self._invalidate()
+
+    #################################### 原生SQL操作 ####################################
+    async def selectOneBySQL(self, sql, values=None):
+        ''' 查询单个
+        --
+        '''
+        return await self._execute(self._encodeSql(sql), values, 'one',
+                                   'selectOneBySQL error; sql:{} values:{}', sql, values)
+
+    async def selectAllBySQL(self, sql, values=None):
+        ''' 查询所有
+        --
+        '''
+        return await self._execute(self._encodeSql(sql), values, 'all',
+                                   'selectAllBySQL error; sql:{} values:{}', sql, values)
+
+    async def executeBySQL(self, sql, values=None):
+        ''' 根据sql进行更新删除或者新增操作
+        --
+        '''
+        return await self._execute(self._encodeSql(sql), values, 'lastrowid',
+                                   'executeBySQL error; sql:{} values:{}', sql, values)
+
+    async def truncateTable(self):
+        ''' 清空表
+        --
+        '''
+        sql = self._encodeSql('TRUNCATE TABLE {}'.format(self.tableName))
+        try:
+            return await self._execute(sql, None, None, 'truncateTable error; sql:{}', sql)
+        finally:
+            self._invalidate()
+
+    #################################### 事务 ####################################
+    def transaction(self, *orms):
+        ''' 开启事务，使用async with，参数同Orm.transaction
+        --
+            @example
+                async with stuOrm.transaction(studyOrm):
+                    await stuOrm.insertOne({'name': '王五', 'age': 20})
+                    await studyOrm.insertOne({'sid': 3, 'cid': 1})
+        '''
+        from .transaction import AsyncTransaction
+
+        return AsyncTransaction(self.conn, self, *orms)
+
+    #################################### 并发执行 ####################################
+    def submit(self, method, *args, **kw):
+        ''' Orm.submit的异步版本：在新的任务中执行当前Orm的操作，返回asyncio.Task。
+            任务从AsyncPooledDB连接池取一个独立连接（用完归还），并复制当前的查询状态，提交后再修改当前Orm不影响任务。
+            当前Orm自己占用连接池的一个连接，并发的任务数超过剩下的连接数时在连接池中排队（blocking=False时抛出TooManyConnections）
+        --
+            @example
+                conn = await pool.connection()
+                stuOrm = AsyncOrm(conn, 'student', 'sid')
+                tasks = [stuOrm.submit('selectByPrimaeyKey', i) for i in range(1, 100)]
+                res = await asyncio.gather(*tasks)
+
+            @param method: 方法名或者当前Orm的方法
+            @param args: 方法参数
+            @param kw: 方法的关键字参数
+        '''
+        from .AsyncPooledDB import AsyncPooledDB
+        from .executor import ormState
+
+        pool = getattr(self.conn, '_pool', None)
+        if not isinstance(pool, AsyncPooledDB):
+            # 线程池中的Orm需要同步连接，异步连接不能使用OrmExecutor
+            raise Exception('AsyncOrm的submit只支持AsyncPooledDB连接池中的连接！')
+        if callable(method):
+            method = method.__name__
+        return asyncio.get_running_loop().create_task(self._run(pool, ormState(self), method, args, kw))
+
+    async def _run(self, pool, state, method, args, kw):
+        ''' 在独立的任务中执行，使用自己的连接和AsyncOrm对象
+        --
+        '''
+        conn = await pool.connection()
+        try:
+            orm = type(self)(conn, self.tableName, self.keyProperty)
+            orm.__dict__.update(state)
+            res = getattr(orm, method)(*args, **kw)
+            if hasattr(res, '__aiter__'):
+                # 流式查询在归还连接前读完
+                return [row async for row in res]
+            return await res
+        finally:
+            await conn.close()
+
+    #################################### 清除关闭 ####################################
+    async def close(self):
+        ''' 关闭数据库连接（来自AsyncPooledDB的连接会还回连接池）
+        --
+        '''
+        await _maybeAwait(self.conn.close())
+
+    #################################### 执行语句 ####################################
+    async def _rollback(self):
+        if self._tx is None:
+            await _maybeAwait(self.conn.rollback())
+
+    async def _execute(self, sql, values=None, fetch=None, error='', *errorArgs):
+        ''' 执行sql语句并取回结果，参数同Orm._execute
+        --
+        '''
+        event = startEvent(self, sql, values, error) if _hooks else None
+        cursor = await _maybeAwait(self.conn.cursor())
+        try:
+            logStart = sqlLog.before(sql, values)
+            if values:
+                res = await cursor.execute(sql, values)
+            else:
+                res = await cursor.execute(sql)
+            sqlLog.after(logStart, sql, values)
+            if fetch == 'all':
+                res = await cursor.fetchall()
+            elif fetch == 'one':
+                res = await cursor.fetchone()
+            elif fetch == 'lastrowid':
+                res = cursor.lastrowid
+            elif fetch == 'insertid' and self.keyProperty == PRIMARY_KEY:
+                idRow = await cursor.fetchone() if self.dbType == _POSTGRE else None
+                res = self._lastId(cursor, idRow)
+            if self.auto_commit:
+                await _maybeAwait(self.conn.commit())
+            if event:
+                finishEvent(event, resultRows(res, fetch, cursor))
+            return res
+        except Exception as e:
+            _log.error(e)
+            if event:
+                finishEvent(event, None, e)
+            await self._rollback()
+            raise Exception(error.format(*errorArgs))
+        finally:
+            await _maybeAwait(cursor.close())
@@ -0,0 +1,181 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+__all__ = ['LRUCache', 'TTLCache']
+
+
+class LRUCache(object):
+    def __init__(self, maxsize=1024):
+        ''' 线程安全的LRU缓存，超出容量时淘汰最久未使用的条目
+        --
+            @param maxsize: 最大条目数，0或None表示不缓存
+        '''
+        self.maxsize = maxsize or 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        ''' 读取缓存，命中时把条目移到队尾
+        --
+        '''
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        ''' 写入缓存
+        --
+        '''
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        ''' 删除并返回一个条目
+        --
+        '''
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def resize(self, maxsize):
+        ''' 修改最大容量，多出的条目按LRU顺序淘汰
+        --
+        '''
+        with self._lock:
+            self.maxsize = maxsize or 0
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        ''' 清空缓存和命中计数
+        --
+        '''
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        ''' 缓存统计信息
+        --
+            @return: {'hits': 命中次数, 'misses': 未命中次数, 'size': 当前条目数, 'maxsize': 最大条目数}
+        '''
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._data), 'maxsize': self.maxsize}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+
+class TTLCache(LRUCache):
+    def __init__(self, maxsize=1024, ttl=None):
+        ''' 带过期时间的LRU缓存。每次失效（pop/invalidate）都会增加version，
+            读库前记下version，写缓存时version已变化则放弃写入，避免把失效前读到的旧数据写回缓存
+        --
+            @param maxsize: 最大条目数，0或None表示不缓存
+            @param ttl: 过期秒数，None表示不过期
+        '''
+        super().__init__(maxsize)
+        self.ttl = ttl
+        self.expired = 0
+        self.version = 0
+
+    def get(self, key, default=None):
+        ''' 读取缓存，过期的条目视为未命中并删除
+        --
+        '''
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            if item[0] is not None and item[0] <= time.monotonic():
+                del self._data[key]
+                self.expired += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value, version=None):
+        ''' 写入缓存
+        --
+            @param version: 读库前记下的version，和当前version不一致时不写入
+        '''
+        if not self.maxsize:
+            return
+        expireAt = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._data[key] = (expireAt, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        ''' 删除并返回一个条目
+        --
+        '''
+        with self._lock:
+            self.version += 1
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def invalidate(self):
+        ''' 删除所有条目，保留命中统计
+        --
+        '''
+        with self._lock:
+            self.version += 1
+            self._data.clear()
+
+    def memory(self):
+        ''' 估算占用的内存（字节），只统计条目本身和一层内部元素
+        --
+        '''
+        with self._lock:
+            items = list(self._data.items())
+        size = sys.getsizeof(self._data)
+        for key, (_, value) in items:
+            size += _sizeof(key) + _sizeof(value)
+        return size
+
+    def info(self):
+        ''' 缓存统计信息
+        --
+            @return: {'hits', 'misses', 'hitRatio': 命中率, 'expired': 过期次数, 'size', 'maxsize', 'ttl', 'memory': 估算字节数}
+        '''
+        info = super().info()
+        total = info['hits'] + info['misses']
+        info.update(hitRatio=info['hits'] / total if total else 0.0, expired=self.expired,
+                    ttl=self.ttl, memory=self.memory())
+        return info
+
+
+def _sizeof(obj):
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(sys.getsizeof(v) for v in obj)
+    return size
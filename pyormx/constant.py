@@ -1,4 +1,16 @@
 # 自增主键
 AUTO_INCREMENT_KEYS = 'AUTO_INCREMENT'
 # 默认主键名
-PRIMARY_KEY = 'id'
\ No newline at end of file
+PRIMARY_KEY = 'id'
+# sql语句缓存的最大条数
+SQL_CACHE_SIZE = 1024
+# where条件模板缓存的最大条数
+WHERE_CACHE_SIZE = 1024
+# 流式查询每次读取的行数
+ITER_BATCH_SIZE = 1000
+# 批量写入时每条语句最多的参数个数
+BULK_MAX_PARAMS = 60000
+# 批量写入时每条语句参数的最大字节数
+BULK_MAX_BYTES = 4 * 1024 * 1024
+# 按主键批量查询时每条IN语句最多的主键个数
+IN_CHUNK_SIZE = 1000
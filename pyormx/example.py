@@ -1,7 +1,12 @@
+from .cache import LRUCache
+from .constant import WHERE_CACHE_SIZE
 from .sql_utils import pers
 
 __all__ = ['Example']
 
+# where条件模板缓存，key为Example的结构指纹，所有Example共享
+_whereCache = LRUCache(WHERE_CACHE_SIZE)
+
 
 class Example(object):
     def __init__(self):
@@ -385,35 +390,28 @@ class Example(object):
                     k = '`' + kSplit[0] + '`.`' + kSplit[1] + '`'
             else:
                 k = '`' + k + '`'
-            if p.upper() == 'IN' or p.upper() == 'NOT IN':
-                whereStr = ' ' + k + ' ' + p.upper() + ' (' + pers(len(v)) + ') '
+            p = p.upper()
+            if p == 'IN' or p == 'NOT IN':
+                whereStr = ' ' + k + ' ' + p + ' (' + pers(len(v)) + ') '
                 return whereStr, v
-            elif p.upper() == 'BETWEEN' or p.upper() == 'NOT BETWEEN':
-                whereStr = ' ' + k + ' ' + p.upper() + ' %s AND %s '
+            elif p == 'BETWEEN' or p == 'NOT BETWEEN':
+                whereStr = ' ' + k + ' ' + p + ' %s AND %s '
                 return whereStr, v
-            elif p.upper() == 'IS NULL' or p.upper() == 'IS NOT NULL':
-                whereStr = ' ' + k + ' ' + p.upper() + ' '
+            elif p == 'IS NULL' or p == 'IS NOT NULL':
+                whereStr = ' ' + k + ' ' + p + ' '
                 return whereStr, v
             else:
-                whereStr = ' ' + k + ' ' + p.upper() + ' %s '
+                whereStr = ' ' + k + ' ' + p + ' %s '
                 return whereStr, v
         elif isinstance(w, Example):
             s, v = w.whereBuilder()
             whereStr = ' (' + s + ') '
             return whereStr, v
 
-    def whereBuilder(self):
-        ''' 编译生成where后面的语句
-        --
-            @example
-                Example().andEqualTo({'name':'张三', 'age':18}).andInValues('id', [1, 2, 3]).orLike('title', '%a%').whereBuilder()
-                @print (' name = %s  AND  age = %s  AND  id IN (%s, %s, %s)  OR  title LIKE %s ', ['张三', 18, 1, 2, 3, '%a%'])
+    def _whereStrBuilder(self):
+        ''' 编译where语句，不收集参数
         '''
-        if len(self.where) == 0:
-            raise Exception('你还没有设置查询条件！')
-
         whereStr = ''
-        values = []
         for i, w in enumerate(self.where):
             s, v = self._builder(w)
 
@@ -421,13 +419,65 @@ class Example(object):
                 whereStr += s
             else:
                 whereStr += (' ' + self.orAnd[i - 1] + ' ' + s)
-            if v is not None:
-                if isinstance(v, list):
+        return whereStr
+
+    def _shape(self, values):
+        ''' 遍历一次条件，返回结构指纹，同时把参数按顺序收集到values中
+        --
+            指纹包含连接符、字段名、操作符、嵌套结构以及IN列表的长度，不包含参数值
+        '''
+        if len(self.where) == 0:
+            raise Exception('你还没有设置查询条件！')
+
+        shape = []
+        for w in self.where:
+            if isinstance(w, tuple):
+                k, v, p = w
+                if v is None:
+                    shape.append((k, p, None))
+                elif isinstance(v, list):
+                    shape.append((k, p, len(v)))
                     values.extend(v)
                 else:
+                    shape.append((k, p, len(v) if isinstance(v, tuple) else None))
                     values.append(v)
+            elif isinstance(w, Example):
+                shape.append(w._shape(values))
+        return tuple(self.orAnd), tuple(shape)
 
+    def fingerprint(self):
+        ''' 条件的结构指纹，结构相同（参数值可以不同）的Example指纹相同
+        --
+        '''
+        return self._shape([])
+
+    def whereShape(self):
+        ''' 遍历一次条件，返回 (结构指纹, 参数)，不拼接where语句。Orm以指纹作为sql语句缓存的键
+        --
+        '''
+        values = []
+        return self._shape(values), values
+
+    def whereBuilder(self):
+        ''' 编译生成where后面的语句，结构相同的条件直接复用缓存的语句，只重新收集参数
+        --
+            @example
+                Example().andEqualTo({'name':'张三', 'age':18}).andInValues('id', [1, 2, 3]).orLike('title', '%a%').whereBuilder()
+                @print (' name = %s  AND  age = %s  AND  id IN (%s, %s, %s)  OR  title LIKE %s ', ['张三', 18, 1, 2, 3, '%a%'])
+        '''
+        shape, values = self.whereShape()
+        whereStr = _whereCache.get(shape)
+        if whereStr is None:
+            whereStr = self._whereStrBuilder()
+            _whereCache.put(shape, whereStr)
         return whereStr, values
 
+    @staticmethod
+    def whereCacheInfo():
+        ''' 查看where条件模板缓存的命中情况
+        --
+        '''
+        return _whereCache.info()
+
     def __str__(self):
         return str(self.whereBuilder())
@@ -0,0 +1,164 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import GeneratorType
+from .constant import PRIMARY_KEY
+from .orm import Orm
+
+__all__ = ['OrmExecutor', 'getExecutor', 'ormState']
+
+# Orm上会被查询方法读取的状态，提交任务时复制一份给工作线程
+_ORM_STATE = ('generator', 'joinStr', 'properties', 'orderByStr', 'groupByStr',
+              'havingStr', 'havingValues', 'distinct', 'auto_commit')
+
+# 共享的OrmExecutor保存在连接池的_ormExecutor属性上，随连接池一起回收
+_executorsLock = threading.Lock()
+
+
+class OrmExecutor(object):
+    def __init__(self, pool, maxWorkers=None):
+        ''' 在线程池中并发执行Orm操作，每个任务从连接池取一个独立连接，用完归还
+        --
+            @example
+                executor = OrmExecutor(pool)
+                f1 = executor.submit('student', 'selectAll', keyProperty='sid')
+                f2 = executor.submit('course', 'selectByPrimaeyKey', 1, keyProperty='cid')
+                print(f1.result(), f2.result())
+
+            @param pool: PooledDB连接池或者Pool对象
+            @param maxWorkers: 最大线程数。连接池的maxconnections限制的是所有连接，线程池之外还占用着连接时
+                        （如调用Orm.submit的Orm自己的连接），线程数超过剩下的连接数后，多出来的任务在阻塞的连接池中等待连接，
+                        在非阻塞的连接池（blocking=False）中抛出TooManyConnections。
+                        不填则为maxconnections-1（给调用方留一个连接，至少为1），连接池不限制时为ThreadPoolExecutor的默认值；
+                        线程池之外还有更多连接在使用时请传入更小的值
+        '''
+        self.pool = pool
+        self.maxWorkers = maxWorkers or _defaultWorkers(pool)
+        self._executor = ThreadPoolExecutor(self.maxWorkers, thread_name_prefix='pyormx')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+
+    def submit(self, tableName, method, *args, keyProperty=PRIMARY_KEY, state=None, **kw):
+        ''' 提交一个Orm操作，返回concurrent.futures.Future
+        --
+            @param tableName: 表名
+            @param method: Orm的方法名，如'selectByExample'
+            @param args: 方法参数
+            @param keyProperty: 主键字段名
+            @param state: 查询状态（连接、排序、分组、查询字段等），一般由Orm.submit传入
+            @param kw: 方法的关键字参数
+        '''
+        with self._lock:
+            self._pending += 1
+        try:
+            return self._executor.submit(self._run, tableName, keyProperty, state, method, args, kw)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+    async def run(self, tableName, method, *args, keyProperty=PRIMARY_KEY, state=None, **kw):
+        ''' submit的asyncio版本，在事件循环中await结果
+        --
+            @example
+                res = await executor.run('student', 'selectByExample', example, keyProperty='sid')
+        '''
+        future = self.submit(tableName, method, *args, keyProperty=keyProperty, state=state, **kw)
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        ''' 队列统计信息
+        --
+            @return: {'maxWorkers': 最大线程数, 'pending': 排队中, 'running': 执行中, 'completed': 已完成, 'failed': 失败}
+        '''
+        with self._lock:
+            return {'maxWorkers': self.maxWorkers, 'pending': self._pending, 'running': self._running,
+                    'completed': self._completed, 'failed': self._failed}
+
+    def shutdown(self, wait=True):
+        ''' 关闭线程池
+        --
+        '''
+        self._executor.shutdown(wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def _run(self, tableName, keyProperty, state, method, args, kw):
+        ''' 在工作线程中执行，每个任务使用自己的连接和Orm对象
+        --
+        '''
+        with self._lock:
+            self._pending -= 1
+            self._running += 1
+        ok = False
+        try:
+            conn = _connection(self.pool)
+            try:
+                orm = Orm(conn, tableName, keyProperty)
+                if state:
+                    orm.__dict__.update(state)
+                res = getattr(orm, method)(*args, **kw)
+                if isinstance(res, GeneratorType):
+                    # 流式查询在归还连接前读完
+                    res = list(res)
+            finally:
+                conn.close()
+            ok = True
+            return res
+        finally:
+            with self._lock:
+                self._running -= 1
+                if ok:
+                    self._completed += 1
+                else:
+                    self._failed += 1
+
+
+def getExecutor(pool):
+    ''' 获取连接池对应的共享OrmExecutor，不存在则创建
+    --
+    '''
+    with _executorsLock:
+        executor = getattr(pool, '_ormExecutor', None)
+        if executor is None:
+            executor = pool._ormExecutor = OrmExecutor(pool)
+        return executor
+
+
+def ormState(orm):
+    ''' 复制Orm的查询状态，工作线程之间互不影响
+    --
+    '''
+    state = {k: getattr(orm, k) for k in _ORM_STATE}
+    state['havingValues'] = list(state['havingValues'])
+    if orm._tx is not None:
+        # 任务使用独立连接，不在事务中
+        state['auto_commit'] = orm._tx.autoCommitOf(orm)
+    return state
+
+
+def _defaultWorkers(pool):
+    maxconnections = _maxConnections(pool)
+    if not maxconnections:
+        return None
+    return max(maxconnections - 1, 1)
+
+
+def _maxConnections(pool):
+    maxconnections = getattr(pool, '_maxconnections', None)
+    if maxconnections is None and hasattr(pool, '_kw'):
+        maxconnections = pool._kw.get('maxconnections')
+    return maxconnections
+
+
+def _connection(pool):
+    if hasattr(pool, 'connection'):
+        return pool.connection(False)
+    return pool.conn()
@@ -0,0 +1,369 @@
+import bisect
+import collections
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .cache import LRUCache
+from .constant import SQL_CACHE_SIZE
+
+__all__ = ['QueryEvent', 'QueryHook', 'QueryStats', 'SlowQueryLog', 'addHook', 'removeHook', 'clearHooks']
+
+_log = logging.getLogger()
+
+# 已注册的钩子 [(before, after), ...]，没有钩子时Orm不会创建任何事件对象
+_hooks = []
+_hooksLock = threading.Lock()
+
+# sql语句对应的指纹，sql语句来自编译缓存，种类有限
+_fingerprints = LRUCache(SQL_CACHE_SIZE)
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER = re.compile(r'(?<![\w`".])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDERS = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+_ROWS = re.compile(r'\(%s\.\.\.\)(?:\s*,\s*\(%s\.\.\.\))+')
+# 可以EXPLAIN的语句
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|UPDATE|DELETE|INSERT|REPLACE)\b', re.I)
+
+
+def fingerprint(sql):
+    ''' sql语句的指纹：去掉多余空白，常量替换成?，IN列表和多行VALUES合并成一项，
+        只有参数个数不同的语句指纹相同
+    --
+        @example
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s) LIMIT 0, 10")
+        return: SELECT * FROM t WHERE id IN (%s...) LIMIT ?, ?
+    '''
+    fp = _fingerprints.get(sql)
+    if fp is None:
+        fp = _STRING.sub('?', sql)
+        fp = _NUMBER.sub('?', fp)
+        fp = _WHITESPACE.sub(' ', fp).strip()
+        fp = _PLACEHOLDERS.sub('(%s...)', fp)
+        fp = _ROWS.sub('(%s...)...', fp)
+        _fingerprints.put(sql, fp)
+    return fp
+
+
+class QueryEvent(object):
+    __slots__ = ('tableName', 'dbType', 'method', 'sql', 'values', 'start', 'duration',
+                 'rows', 'poolWait', 'error', 'exception', '_fingerprint')
+
+    def __init__(self, tableName, dbType, method, sql, values, poolWait=0.0):
+        ''' 一次sql执行的信息，before钩子中duration、rows、error还没有值
+        --
+            @param tableName: 表名
+            @param dbType: 数据库类型
+            @param method: 执行语句的Orm方法名
+            @param sql: sql语句
+            @param values: 参数
+            @param poolWait: 从连接池获取连接时等待的秒数，连接不是来自连接池或者已经统计过时为0
+        '''
+        self.tableName = tableName
+        self.dbType = dbType
+        self.method = method
+        self.sql = sql
+        self.values = values
+        self.start = time.perf_counter()
+        self.duration = None
+        self.rows = None
+        self.poolWait = poolWait
+        self.error = None
+        self.exception = None
+        self._fingerprint = None
+
+    @property
+    def fingerprint(self):
+        ''' 语句指纹，第一次读取时计算
+        --
+        '''
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint(self.sql)
+        return self._fingerprint
+
+    def __repr__(self):
+        return '<QueryEvent {} {} {:.6f}s rows={} error={}>'.format(
+            self.method, self.fingerprint, self.duration or 0, self.rows, self.error)
+
+
+class QueryHook(object):
+    ''' 钩子基类，按需重写before和after
+    --
+    '''
+
+    def before(self, event):
+        pass
+
+    def after(self, event):
+        pass
+
+
+class QueryStats(QueryHook):
+    # 直方图的桶（秒），最后一个桶统计超过最大值的语句
+    BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10)
+
+    def __init__(self, buckets=None, maxFingerprints=1000):
+        ''' 内置的统计钩子，按语句指纹统计次数、错误数、耗时直方图、返回/影响的行数和连接池等待时间
+        --
+            @example
+                stats = QueryStats()
+                Orm.addHook(stats)
+                ...
+                for fp, s in stats.snapshot().items():
+                    print(fp, s['count'], s['avg'], s['p95'])
+
+            @param buckets: 直方图的桶（秒），从小到大排列
+            @param maxFingerprints: 最多统计的指纹数，超出的语句合并到'<other>'
+        '''
+        self.buckets = tuple(buckets or self.BUCKETS)
+        self.maxFingerprints = maxFingerprints
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def after(self, event):
+        fp = event.fingerprint
+        duration = event.duration
+        i = bisect.bisect_left(self.buckets, duration)
+        with self._lock:
+            s = self._stats.get(fp)
+            if s is None:
+                if len(self._stats) >= self.maxFingerprints:
+                    fp = '<other>'
+                    s = self._stats.get(fp)
+                if s is None:
+                    s = self._stats[fp] = {'count': 0, 'errors': 0, 'total': 0.0, 'min': duration,
+                                           'max': duration, 'rows': 0, 'poolWait': 0.0,
+                                           'histogram': [0] * (len(self.buckets) + 1)}
+            s['count'] += 1
+            s['total'] += duration
+            if duration < s['min']:
+                s['min'] = duration
+            if duration > s['max']:
+                s['max'] = duration
+            if event.error:
+                s['errors'] += 1
+            if event.rows and event.rows > 0:
+                s['rows'] += event.rows
+            s['poolWait'] += event.poolWait
+            s['histogram'][i] += 1
+
+    def snapshot(self):
+        ''' 当前的统计结果
+        --
+            @return: {指纹: {'count', 'errors', 'total', 'avg', 'min', 'max', 'rows', 'poolWait',
+                            'histogram': [(桶上限, 次数), ...], 'p50', 'p95', 'p99'}}
+                     百分位数为所在桶的上限，超过最大桶时为max
+        '''
+        with self._lock:
+            stats = {fp: dict(s, histogram=list(s['histogram'])) for fp, s in self._stats.items()}
+        bounds = self.buckets + (None,)
+        for s in stats.values():
+            counts = s['histogram']
+            s['avg'] = s['total'] / s['count']
+            for name, p in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+                s[name] = self._percentile(counts, s['count'] * p, s['max'])
+            s['histogram'] = list(zip(bounds, counts))
+        return stats
+
+    def reset(self):
+        ''' 清空统计
+        --
+        '''
+        with self._lock:
+            self._stats.clear()
+
+    def _percentile(self, counts, rank, maxDuration):
+        n = 0
+        for bound, count in zip(self.buckets, counts):
+            n += count
+            if n >= rank:
+                return min(bound, maxDuration)
+        return maxDuration
+
+
+class SlowQueryLog(QueryHook):
+    def __init__(self, threshold=1.0, maxSize=100, explainPool=None, redact=None, maxValues=20):
+        ''' 慢查询记录：执行时间超过阈值的语句记录到固定大小的环形缓冲区，旧记录自动丢弃。
+            可选在连接池的另一个连接上执行EXPLAIN（postgresql为EXPLAIN (FORMAT JSON)），把执行计划附在记录上
+        --
+            @example
+                slow = SlowQueryLog(0.2, explainPool=pool)
+                Orm.addHook(slow)
+                ...
+                for entry in slow.entries():
+                    print(entry['duration'], entry['fingerprint'], entry['plan'])
+
+            @param threshold: 阈值（秒）
+            @param maxSize: 最多保留的记录数
+            @param explainPool: 执行EXPLAIN的连接池（PooledDB或者Pool），不传则不执行。EXPLAIN在后台线程中执行，不会阻塞慢查询的调用方
+            @param redact: 参数脱敏函数，传入参数列表返回脱敏后的列表。默认只保留None/bool/数字，其他值替换成类型名
+            @param maxValues: 最多记录的参数个数
+        '''
+        self.threshold = threshold
+        self.explainPool = explainPool
+        self.redact = redact or _redact
+        self.maxValues = maxValues
+        self._entries = collections.deque(maxlen=maxSize)
+        self._lock = threading.Lock()
+        self._explainer = None
+
+    def after(self, event):
+        if event.duration < self.threshold:
+            return
+        values = event.values
+        if isinstance(values, (list, tuple)):
+            values = self.redact(list(values[:self.maxValues]))
+        elif values is not None:
+            values = self.redact([values])
+        entry = {'time': time.time(), 'tableName': event.tableName, 'method': event.method,
+                 'fingerprint': event.fingerprint, 'sql': event.sql, 'values': values,
+                 'valueCount': len(event.values) if isinstance(event.values, (list, tuple)) else None,
+                 'duration': event.duration, 'rows': event.rows, 'error': event.error, 'plan': None}
+        with self._lock:
+            self._entries.append(entry)
+            if self.explainPool is not None and not event.error and _EXPLAINABLE.match(event.sql):
+                if self._explainer is None:
+                    self._explainer = ThreadPoolExecutor(1, thread_name_prefix='pyormx-explain')
+                self._explainer.submit(self._explain, entry, event.dbType, event.sql, event.values)
+
+    def entries(self):
+        ''' 所有记录，最新的在最后
+        --
+            @return: [{'time', 'tableName', 'method', 'fingerprint', 'sql', 'values', 'valueCount',
+                       'duration', 'rows', 'error', 'plan'}, ...]
+        '''
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        ''' 清空记录
+        --
+        '''
+        with self._lock:
+            self._entries.clear()
+
+    def _explain(self, entry, dbType, sql, values):
+        ''' 在连接池的另一个连接上执行EXPLAIN，只读取执行计划不执行语句本身
+        --
+        '''
+        if dbType == 'psycopg2':
+            explainSql = 'EXPLAIN (FORMAT JSON) ' + sql
+        else:
+            explainSql = 'EXPLAIN ' + sql
+        try:
+            pool = self.explainPool
+            conn = pool.connection() if hasattr(pool, 'connection') else pool.conn()
+        except Exception as e:
+            entry['plan'] = 'EXPLAIN error: {}'.format(e)
+            return
+        try:
+            cursor = conn.cursor()
+            try:
+                if values:
+                    cursor.execute(explainSql, values)
+                else:
+                    cursor.execute(explainSql)
+                entry['plan'] = cursor.fetchall()
+            finally:
+                cursor.close()
+            conn.rollback()
+        except Exception as e:
+            entry['plan'] = 'EXPLAIN error: {}'.format(e)
+        finally:
+            conn.close()
+
+
+def _redact(values):
+    ''' 默认的参数脱敏：保留None/bool/数字，其他值替换成<类型名>
+    --
+    '''
+    return [v if v is None or isinstance(v, (bool, int, float)) else '<{}>'.format(type(v).__name__)
+            for v in values]
+
+
+def addHook(hook):
+    ''' 注册钩子
+    --
+        @param hook: QueryHook对象（before在执行前调用，after在执行后调用），或者函数（执行后调用，参数为QueryEvent）
+    '''
+    if isinstance(hook, QueryHook):
+        pair = (hook, hook.before, hook.after)
+    elif callable(hook):
+        pair = (hook, None, hook)
+    else:
+        raise TypeError('钩子必须是QueryHook或者函数')
+    with _hooksLock:
+        _hooks.append(pair)
+
+
+def removeHook(hook):
+    ''' 移除钩子
+    --
+    '''
+    with _hooksLock:
+        _hooks[:] = [pair for pair in _hooks if pair[0] is not hook]
+
+
+def clearHooks():
+    ''' 移除所有钩子
+    --
+    '''
+    with _hooksLock:
+        del _hooks[:]
+
+
+def startEvent(orm, sql, values, error):
+    ''' 创建事件并调用before钩子，只在有钩子时调用
+    --
+        @param error: Orm方法的出错信息，第一个单词为方法名
+    '''
+    event = QueryEvent(orm.tableName, orm.dbType, error.split(' ', 1)[0], sql, values, _poolWait(orm.conn))
+    for _, before, _ in tuple(_hooks):
+        if before is not None:
+            try:
+                before(event)
+            except Exception as e:
+                _log.error('QueryHook error: {}'.format(e))
+    return event
+
+
+def finishEvent(event, rows, exception=None):
+    ''' 记录耗时、行数和错误，调用after钩子
+    --
+    '''
+    event.duration = time.perf_counter() - event.start
+    event.rows = rows
+    if exception is not None:
+        event.error = type(exception).__name__
+        event.exception = exception
+    for _, _, after in tuple(_hooks):
+        try:
+            after(event)
+        except Exception as e:
+            _log.error('QueryHook error: {}'.format(e))
+
+
+def resultRows(res, fetch, cursor):
+    ''' 返回或影响的行数
+    --
+    '''
+    if fetch == 'all':
+        return len(res)
+    if fetch == 'one':
+        return 1 if res else 0
+    return getattr(cursor, 'rowcount', None)
+
+
+def _poolWait(conn):
+    ''' 读取连接池连接的等待时间并清零，同一次获取连接只统计一次
+    --
+    '''
+    try:
+        wait = conn.wait_time
+    except Exception:
+        return 0.0
+    if wait:
+        conn.wait_time = 0.0
+    return wait or 0.0
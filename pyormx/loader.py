@@ -0,0 +1,293 @@
+import asyncio
+from .constant import PRIMARY_KEY, IN_CHUNK_SIZE
+from .example import Example
+from .orm import Orm, _chunks
+from .async_orm import AsyncOrm
+
+__all__ = ['DataLoader', 'AsyncDataLoader', 'Loaders']
+
+
+class DataLoader(object):
+    def __init__(self, orm, query=None, chunkSize=IN_CHUNK_SIZE):
+        ''' 请求级别的批量查询：先收集同一张表的主键查询和等值查询，取结果时合并成 IN (...) 语句，
+            相同的键只查一次，结果在本loader内复用。每个请求新建一个，不要跨请求共享
+        --
+            @example
+                loader = DataLoader(Orm(db, 'student', 'sid'))
+                a, b = loader.load(1), loader.load(2)
+                print(a.result(), b.result())
+                # 只执行一条 SELECT ... WHERE sid IN (1, 2)
+
+            @param orm: Orm对象
+            @param query: 查询条件Query，不传则使用orm当前的查询状态。查询字段中必须包含用到的列
+            @param chunkSize: 每条语句最多的键个数
+        '''
+        self.orm = orm
+        self.query = query
+        self.chunkSize = chunkSize
+        self.batches = 0
+        self.loads = 0
+        self.hits = 0
+        # {(列名, str(键)): 结果}
+        self._results = {}
+        # {列名: {str(键): 键}}，等待查询的键
+        self._pending = {}
+
+    def load(self, primaryValue):
+        ''' 按主键查询，返回_Pending对象，调用result()时把所有等待中的键合并查询
+        --
+            @return: _Pending，result()为一行或None
+        '''
+        return self.loadBy(self.orm.keyProperty, primaryValue)
+
+    def loadBy(self, column, value):
+        ''' 按 column=value 查询（Example.andEqualTo的批量版本）
+        --
+            @param column: 列名，为主键时结果为一行或None，否则为行列表
+            @param value: 值
+
+            @return: _Pending
+        '''
+        key = (column, str(value))
+        self.loads += 1
+        if key in self._results:
+            self.hits += 1
+        else:
+            self._pending.setdefault(column, {}).setdefault(key[1], value)
+        return _Pending(self, key, value)
+
+    def loadMany(self, primaryValues):
+        ''' 按一组主键查询，只执行一次合并查询
+        --
+            @return: 行列表，与primaryValues一一对应，不存在的为None
+        '''
+        pendings = [self.load(v) for v in primaryValues]
+        return [p.result() for p in pendings]
+
+    def prime(self, primaryValue, row):
+        ''' 把已知的行放入loader，之后的load不再查询
+        --
+        '''
+        self._results[(self.orm.keyProperty, str(primaryValue))] = row
+
+    def clear(self, column=None, value=None):
+        ''' 清除已查询的结果，不传参数清除全部
+        --
+        '''
+        if column is None:
+            self._results.clear()
+        else:
+            self._results.pop((column, str(value)), None)
+
+    def dispatch(self):
+        ''' 立即查询所有等待中的键
+        --
+        '''
+        pending, self._pending = self._pending, {}
+        for column, keys in pending.items():
+            self._results.update(self._fetch(column, list(keys.values())))
+
+    def _result(self, key, value):
+        if key not in self._results:
+            # 之前的查询失败时重新加入等待
+            self._pending.setdefault(key[0], {}).setdefault(key[1], value)
+            self.dispatch()
+        return self._results.get(key)
+
+    def _fetch(self, column, values):
+        ''' 查询一列的一组值，返回 {(列名, str(值)): 结果}
+        --
+        '''
+        self.batches += 1
+        if column == self.orm.keyProperty:
+            rows = self.orm.selectByPrimaryKeys(values, self.query, self.chunkSize)
+            return _fanOutPrimaryKeys(column, values, rows)
+        rows = []
+        for chunk in _chunks(values, self.chunkSize):
+            rows.extend(self.orm.selectByExample(Example().andInValues(column, chunk), self.query))
+        return _fanOutColumn(column, values, rows)
+
+    def stats(self):
+        ''' 统计信息
+        --
+            @return: {'loads': load次数, 'hits': 直接复用结果的次数, 'batches': 合并查询次数}
+        '''
+        return {'loads': self.loads, 'hits': self.hits, 'batches': self.batches}
+
+
+class AsyncDataLoader(DataLoader):
+    def __init__(self, orm, query=None, chunkSize=IN_CHUNK_SIZE, batchWindow=0, lock=None):
+        ''' DataLoader的异步版本，同一轮事件循环（或batchWindow秒）内的load合并成一次查询
+        --
+            @example
+                loader = AsyncDataLoader(AsyncOrm(conn, 'student', 'sid'))
+                a, b = await asyncio.gather(loader.load(1), loader.load(2))
+
+            @param orm: AsyncOrm对象
+            @param batchWindow: 收集等待时间（秒），0表示只等到下一轮事件循环
+            @param lock: asyncio.Lock，同一个连接不能同时执行多条语句，共用连接的loader传入同一个锁，查询依次执行。
+                        不传则只保证本loader的查询依次执行
+        '''
+        super().__init__(orm, query, chunkSize)
+        self.batchWindow = batchWindow
+        self._lock = lock
+        self._scheduled = False
+        # 正在进行的查询任务，保留引用避免被垃圾回收
+        self._tasks = set()
+
+    def loadBy(self, column, value):
+        ''' 按 column=value 查询，返回asyncio.Future
+        --
+        '''
+        key = (column, str(value))
+        self.loads += 1
+        future = self._results.get(key)
+        if future is not None:
+            self.hits += 1
+            return future
+        loop = asyncio.get_running_loop()
+        future = self._results[key] = loop.create_future()
+        self._pending.setdefault(column, {}).setdefault(key[1], value)
+        if not self._scheduled:
+            self._scheduled = True
+            if self.batchWindow:
+                loop.call_later(self.batchWindow, self._startDispatch)
+            else:
+                loop.call_soon(self._startDispatch)
+        return future
+
+    async def loadMany(self, primaryValues):
+        return list(await asyncio.gather(*[self.load(v) for v in primaryValues]))
+
+    def prime(self, primaryValue, row):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(row)
+        self._results[(self.orm.keyProperty, str(primaryValue))] = future
+
+    def _startDispatch(self):
+        self._scheduled = False
+        task = asyncio.ensure_future(self.dispatch())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def dispatch(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # 等待锁期间加入的键一起查询
+            pending, self._pending = self._pending, {}
+            for column, keys in pending.items():
+                await self._dispatchColumn(column, keys)
+
+    async def _dispatchColumn(self, column, keys):
+        values = list(keys.values())
+        try:
+            results = await self._fetch(column, values)
+        except Exception as e:
+            for k in keys:
+                future = self._results.pop((column, k), None)
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            return
+        for key, res in results.items():
+            future = self._results.get(key)
+            if future is not None and not future.done():
+                future.set_result(res)
+
+    async def _fetch(self, column, values):
+        self.batches += 1
+        if column == self.orm.keyProperty:
+            rows = await self.orm.selectByPrimaryKeys(values, self.query, self.chunkSize)
+            return _fanOutPrimaryKeys(column, values, rows)
+        rows = []
+        for chunk in _chunks(values, self.chunkSize):
+            rows.extend(await self.orm.selectByExample(Example().andInValues(column, chunk), self.query))
+        return _fanOutColumn(column, values, rows)
+
+
+class Loaders(object):
+    def __init__(self, conn, asyncMode=False, query=None, chunkSize=IN_CHUNK_SIZE, batchWindow=0):
+        ''' 一个请求内所有表的loader，每张表一个，按表名取用
+        --
+            @example
+                loaders = Loaders(db)
+                student = loaders.get('student', 'sid').load(1)
+                studies = loaders.get('study').loadBy('sid', 1)
+                print(student.result(), studies.result())
+
+            @param conn: 数据库连接
+            @param asyncMode: 异步连接（aiomysql），为True时创建AsyncDataLoader
+            @param query: 所有loader使用的查询条件Query
+            @param chunkSize: 每条语句最多的键个数
+            @param batchWindow: 异步loader的收集等待时间（秒）
+        '''
+        self.conn = conn
+        self.asyncMode = asyncMode
+        self.query = query
+        self.chunkSize = chunkSize
+        self.batchWindow = batchWindow
+        self._loaders = {}
+        # 异步loader共用一个连接，查询依次执行
+        self._lock = None
+
+    def get(self, tableName, keyProperty=PRIMARY_KEY):
+        ''' 取表的loader，不存在则创建
+        --
+            @param tableName: 表名
+            @param keyProperty: 主键字段名
+        '''
+        key = (tableName, keyProperty)
+        loader = self._loaders.get(key)
+        if loader is None:
+            if self.asyncMode:
+                if self._lock is None:
+                    self._lock = asyncio.Lock()
+                loader = AsyncDataLoader(AsyncOrm(self.conn, tableName, keyProperty),
+                                         self.query, self.chunkSize, self.batchWindow, self._lock)
+            else:
+                loader = DataLoader(Orm(self.conn, tableName, keyProperty), self.query, self.chunkSize)
+            self._loaders[key] = loader
+        return loader
+
+    def dispatch(self):
+        ''' 立即查询所有同步loader中等待的键
+        --
+        '''
+        for loader in self._loaders.values():
+            if not isinstance(loader, AsyncDataLoader):
+                loader.dispatch()
+
+    def stats(self):
+        ''' 每张表loader的统计信息
+        --
+        '''
+        return {k[0]: loader.stats() for k, loader in self._loaders.items()}
+
+
+class _Pending(object):
+    ''' 同步load的返回值，result()时才执行合并查询
+    --
+    '''
+    __slots__ = ('loader', 'key', 'value')
+
+    def __init__(self, loader, key, value):
+        self.loader = loader
+        self.key = key
+        self.value = value
+
+    def result(self):
+        return self.loader._result(self.key, self.value)
+
+
+def _fanOutPrimaryKeys(column, values, rows):
+    byKey = {str(k): row for k, row in rows.items()}
+    return {(column, str(v)): byKey.get(str(v)) for v in values}
+
+
+def _fanOutColumn(column, values, rows):
+    res = {(column, str(v)): [] for v in values}
+    for row in rows:
+        if column not in row:
+            raise Exception('查询字段中没有{}！'.format(column))
+        res.setdefault((column, str(row[column])), []).append(row)
+    return res
@@ -1,6 +1,21 @@
+import base64
+import datetime
+import itertools
+import json
 import logging
-from .constant import AUTO_INCREMENT_KEYS, PRIMARY_KEY
-from .sql_utils import fieldStrAndPer, fieldSplit, joinList, pers, dataToStr
+import os
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from .cache import LRUCache, TTLCache
+from .hooks import _hooks, addHook, removeHook, clearHooks, startEvent, finishEvent, resultRows
+from .sqllog import sqlLog
+from .query_cache import QueryCache, tableNames
+from .constant import AUTO_INCREMENT_KEYS, PRIMARY_KEY, SQL_CACHE_SIZE, ITER_BATCH_SIZE, BULK_MAX_PARAMS, BULK_MAX_BYTES, \
+    IN_CHUNK_SIZE
+from .sql_utils import fieldShapeAndPer, fieldStrFromShape, fieldColumns, joinList, pers, dataToStr, dataToJson, \
+    copyLines, rowsToStr, quoteKey, propertiesStr
 
 __all__ = ['Orm']
 
@@ -9,6 +24,48 @@ _log = logging.getLogger()
 _POSTGRE = 'psycopg2'
 _MYSQL = 'mysql'
 
+# 服务端游标名称序号（postgresql命名游标需要唯一的名字）
+_cursorIds = itertools.count()
+
+# 连接类型对应的数据库类型，避免每次创建Orm都重新判断
+_dbTypes = {}
+
+# 主键查询结果缓存 {(数据库类型, 表名): TTLCache}，同一张表的所有Orm实例共享
+_pkCaches = {}
+_pkCachesLock = threading.Lock()
+
+# 查询结果缓存，enableQueryCache后生效；default为True时所有支持的查询默认使用缓存
+_queryCache = None
+_queryCacheDefault = False
+
+# 编译好的sql语句缓存，所有Orm实例共享
+_sqlCache = LRUCache(SQL_CACHE_SIZE)
+
+_INSERT_SQL = '{replace} INSERT {ignore} INTO {tableName}({keys}) VALUES({ps}){updateStr}{returningStr}'
+_INSERT_MANY_SQL = 'INSERT  INTO {tableName}({keys}) VALUES({ps})'
+_UPDATE_BY_KEY_SQL = 'UPDATE {tableName} SET {fieldStr} WHERE `{keyProperty}`=%s'
+_UPDATE_BY_EXAMPLE_SQL = 'UPDATE {tableName} SET {fieldStr} WHERE {whereStr}'
+_SELECT_ALL_SQL = 'SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} {groupByStr} {orderByStr}'
+_SELECT_BY_KEY_SQL = '''SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} 
+                WHERE {tableName}.`{keyProperty}`=%s {groupByStr} {orderByStr}'''
+_SELECT_BY_KEYS_SQL = '''SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} 
+                WHERE {tableName}.`{keyProperty}` IN ({ps}) {groupByStr} {orderByStr}'''
+_SELECT_BY_EXAMPLE_SQL = '''SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} 
+                WHERE {whereStr} {groupByStr} {orderByStr}'''
+_SELECT_TRANSACT_SQL = '''SELECT {distinctStr} {propertiesStr} , {transact}({transactProperties}) {transactName} FROM {tableName} {joinStr} 
+                WHERE {whereStr} {groupByStr} {havingStr} {orderByStr}'''
+_COUNT_ALL_SQL = 'SELECT COUNT({tableName}.`{keyProperty}`) num FROM {tableName} {joinStr}'
+_COUNT_BY_EXAMPLE_SQL = '''SELECT COUNT({tableName}.`{keyProperty}`) num FROM {tableName} {joinStr} 
+                    WHERE {whereStr}'''
+_SELECT_PAGE_ALL_SQL = '''SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} 
+                    {groupByStr} {orderByStr} {limitStr}'''
+_SELECT_PAGE_BY_EXAMPLE_SQL = '''SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} 
+                    WHERE {whereStr} {groupByStr} {orderByStr} {limitStr}'''
+_SELECT_SEEK_SQL = '''SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} 
+                    WHERE {whereStr} {groupByStr} ORDER BY {seekKey} {clause} LIMIT %s'''
+_DELETE_BY_KEY_SQL = 'DELETE FROM {tableName} WHERE `{keyProperty}`=%s'
+_DELETE_BY_EXAMPLE_SQL = 'DELETE FROM {tableName} WHERE {whereStr}'
+
 
 class Orm(object):
     def __init__(self, conn, tableName, keyProperty=PRIMARY_KEY, auto_commit=True):
@@ -19,20 +76,7 @@ class Orm(object):
             @param keyProperty: 主键字段名。可以不填，不填默认主键名为id
             @param auto_commit: 自动提交
         '''
-        if 'psycopg2' in str(type(conn)):
-            self.dbType = _POSTGRE
-        elif 'mysql' in str(type(conn)):
-            self.dbType = _MYSQL
-        else:
-            try:
-                if 'psycopg2' in conn._pool._creator.__name__:
-                    self.dbType = _POSTGRE
-                elif 'mysql' in conn._pool._creator.__name__:
-                    self.dbType = _MYSQL
-                else:
-                    raise Exception('数据库类型暂不支持！')
-            except Exception as e:
-                raise Exception('数据库类型暂不支持！')
+        self.dbType = _dbType(conn)
         # 数据库连接
         self.conn = conn
         # 表名
@@ -63,6 +107,8 @@ class Orm(object):
         self.distinct = ''
         # 自动提交
         self.auto_commit = auto_commit
+        # 所在的事务，见transaction()
+        self._tx = None
 
     def setPrimaryGenerator(self, generator):
         ''' 设置表的主键生成策略，不设置则默认使用数据库自增主键
@@ -90,7 +136,7 @@ class Orm(object):
                         2. list, list: 两个数组形式。第一个数据传入数据库中对应的字段。第二个数组传入需要写入的数据，可以是单条数据（一维数组），也可以是多条数据（二维数组）
                         3. list: 多条数据，数组里面是多个字典，每个字典代表一条数据
             
-            以下参数仅在插入单条数据时有效：
+            以下参数对单条和多条数据都有效，多条数据时还可以传入insertBulk的其他参数：
             @param kw.ignore: 不存在则新增，存在则不改变
             @param kw.replace: 不存在则新增，存在则删除并新增
             @param kw.update: 不存在则新增，存在则更新
@@ -100,13 +146,13 @@ class Orm(object):
             return -1
         elif n == 1:
             if isinstance(args[0], list):
-                return self.insertDictList(args[0])
+                return self.insertDictList(args[0], **kw)
             elif isinstance(args[0], dict):
                 return self.insertOne(args[0], **kw)
             else:
                 return -1
         elif n == 2:
-            return self.insertMany(args[0], args[1])
+            return self.insertMany(args[0], args[1], **kw)
         else:
             return -1
 
@@ -118,68 +164,65 @@ class Orm(object):
 
             @param data: 要插入的数据 字典格式
             @param ignore: 不存在则新增，存在则不改变
-            @param replace: 不存在则新增，存在则删除并新增
-            @param update: 不存在则新增，存在则更新
+            @param replace: 不存在则新增，存在则删除并新增（postgresql按update处理）
+            @param update: 不存在则新增，存在则更新（postgresql以主键作为冲突字段）
+        '''
+        sql, values = self._insertOneSql(data, ignore, replace, update)
+        try:
+            return self._execute(sql, values, 'insertid', 'insertOne error; values:{}', data)
+        finally:
+            # 冲突可能发生在其他唯一键上，无法确定被替换/更新的主键
+            self._invalidate(None if replace or update else [])
+
+    def _insertOneSql(self, data, ignore=False, replace=False, update=False):
+        ''' 生成insertOne的sql语句和参数
+        --
         '''
         if not data:
             raise Exception('数据为空！')
 
-        if ignore and replace and update:
+        if sum(map(bool, (ignore, replace, update))) > 1:
             raise Exception('ignore,replace和update只能有一个为true')
 
-        if ignore:
-            ignore = 'IGNORE'
-        else:
-            ignore = ''
-
-        if replace:
-            replace = 'REPLACE'
-        else:
-            replace = ''
+        # 如果主键不是自增，则生成主键
+        if self.generator != AUTO_INCREMENT_KEYS:
+            # 传入的data里面没有主键或者主键值为0
+            if self.keyProperty not in data or data[self.keyProperty] == 0:
+                data[self.keyProperty] = self.generator()
 
-        cursor = self.conn.cursor()
-        try:
-            # 如果主键不是自增，则生成主键
-            if self.generator != AUTO_INCREMENT_KEYS:
-                # 传入的data里面没有主键或者主键值为0
-                if self.keyProperty not in data or data[self.keyProperty] == 0:
-                    data[self.keyProperty] = self.generator()
-
-            keys, ps, values = fieldSplit(data)
-            sql = '{} INSERT {} INTO {}({}) VALUES({})'.format(replace, ignore,
-                                                               self.tableName, keys, ps)
+        columns, values = fieldColumns(data)
+        if self.dbType == _POSTGRE:
+            # postgresql没有IGNORE/REPLACE/ON DUPLICATE KEY，使用ON CONFLICT
+            def parts():
+                updateStr = ''
+                if ignore:
+                    updateStr = ' ON CONFLICT DO NOTHING'
+                elif update or replace:
+                    updateStr = self._onConflictStr(list(columns))
+                returningStr = ' RETURNING ' + self.keyProperty if self.keyProperty == PRIMARY_KEY else ''
+                return dict(replace='', ignore='', tableName=self.tableName, keys=joinList(columns),
+                            ps=pers(len(columns)), updateStr=updateStr, returningStr=returningStr)
+
+            shape = (self.tableName, self.keyProperty, columns, bool(ignore), bool(update or replace))
+            return self._compileSql(_INSERT_SQL, shape, parts), values
+
+        updateShape = None
+        if update:
+            updateShape, values2 = fieldShapeAndPer(data)
+            values.extend(values2)
+
+        def parts():
+            updateStr = ''
             if update:
-                fieldStr, values2 = fieldStrAndPer(data)
-                sql += ' ON DUPLICATE KEY UPDATE {}'.format(fieldStr)
-                values.extend(values2)
-
-            if self.dbType == _POSTGRE and self.keyProperty == PRIMARY_KEY:
-                sql += ' RETURNING {}'.format(self.keyProperty)
-            sql = self._encodeSql(sql)
-            _log.info('执行sql语句：{}；值：{}'.format(sql, values))
-            affectedRows = cursor.execute(sql, values)
-            if self.keyProperty == PRIMARY_KEY:
-                lastId = cursor.lastrowid
-                # 获取postgre的自增id
-                if self.dbType == _POSTGRE:
-                    idRow = cursor.fetchone()
-                    if idRow:
-                        lastId = idRow[self.keyProperty]
-                if self.auto_commit:
-                    self.conn.commit()
-                return lastId
-            else:
-                if self.auto_commit:
-                    self.conn.commit()
-                return affectedRows
-        except Exception as e:
-            _log.error(e)
-            self.conn.rollback()
-            raise Exception('insertOne error; values:{}'.format(data))
-        finally:
-            cursor.close()
+                updateStr = ' ON DUPLICATE KEY UPDATE ' + fieldStrFromShape(updateShape)
+            return dict(replace='REPLACE' if replace else '', ignore='IGNORE' if ignore else '',
+                        tableName=self.tableName, keys=joinList(columns), ps=pers(len(columns)),
+                        updateStr=updateStr, returningStr='')
+
+        shape = (self.tableName, columns, bool(ignore), bool(replace), updateShape)
+        return self._compileSql(_INSERT_SQL, shape, parts), values
 
-    def insertMany(self, keys, data):
+    def insertMany(self, keys, data, **kw):
         ''' 插入一组数据，可以指定字段名，返回自增id（单条数据且有自增id）或者受影响的条数
         --
             @example
@@ -189,123 +232,347 @@ class Orm(object):
 
             @param keys: 插入的字段名
             @param data: 插入的数据, 字典格式（单条）， 列表（列表里包含字典）格式（多条）
+            @param kw: 多条数据时传给insertBulk的参数，如ignore，replace，update，maxParams，maxBytes，onChunk
         '''
         if not data:
             raise Exception('数据为空！')
 
-        cursor = self.conn.cursor()
+        if isinstance(data, list):
+            columns, dataList = self._manyRows(keys, data)
+            return self.insertBulk(columns, dataList, **kw)
+
+        sql, values = self._insertDictSql(keys, data)
+        return self._execute(sql, values, 'insertid', 'insertList error; values:{}', values)
+
+    def _manyRows(self, keys, data):
+        ''' 把insertMany的多条数据整理成字段列表和转换好的二维数组
+        --
+        '''
+        columns = list(keys)
+        dataList = data
+        if isinstance(data[0], dict):
+            columns = [k for k in keys if k in data[0]]
+            dataList = [[d.get(k) for k in columns] for d in data]
+
+        if self.generator != AUTO_INCREMENT_KEYS and self.keyProperty not in columns:
+            columns.append(self.keyProperty)
+            dataList = [list(d) + [self.generator()] for d in dataList]
+        return columns, rowsToStr(dataList)
+
+    def _insertDictSql(self, keys, data):
+        ''' 生成insertMany写入单条数据的sql语句和参数
+        --
+        '''
+        dataList = []
+        columns = []
+        for k in keys:
+            if k in data:
+                dataList.append(dataToStr(data[k]))
+                columns.append(k)
+
+        if self.generator != AUTO_INCREMENT_KEYS:
+            if self.keyProperty not in columns:
+                columns.append(self.keyProperty)
+                dataList.append(self.generator())
+
+        sql = self._compileSql(_INSERT_MANY_SQL, (self.tableName, tuple(columns)),
+                               lambda: dict(tableName=self.tableName, keys=joinList(columns),
+                                            ps=pers(len(columns))))
+        if self.dbType == _POSTGRE and self.keyProperty == PRIMARY_KEY:
+            sql += ' RETURNING {}'.format(self.keyProperty)
+        return sql, dataList
+
+    def insertDictList(self, dataList, **kw):
+        ''' 插入一组数据，返回受影响的条数。字段相同（值为None的字段不写入）的数据合并成多行VALUES语句写入
+        --
+            @example
+                orm.insertDictList([{'name':'张三', 'age':18}, {'name':'李四', 'age':19}])
+
+            @param dataList: 插入的数据列表
+            @param kw: 传给insertBulk的参数，如ignore，replace，update，maxParams，maxBytes，onChunk
+        '''
+        if not dataList or not dataList[0]:
+            raise Exception('数据为空！')
+
+        groups = self._dictListGroups(dataList)
+        if len(groups) == 1:
+            columns, values = groups.popitem()
+            return self.insertBulk(list(columns), values, **kw)
+
+        autoCommit = self.auto_commit
+        self.auto_commit = False
         try:
-            dataList = []
+            affectedRows = 0
+            for columns, values in groups.items():
+                affectedRows += self.insertBulk(list(columns), values, **kw)
+            if autoCommit:
+                self.conn.commit()
+            return affectedRows
+        finally:
+            self.auto_commit = autoCommit
+
+    def _dictListGroups(self, dataList):
+        ''' 把字典列表按字段分组，每组字段相同，值为转换好的二维数组
+        --
+        '''
+        groups = {}
+        for data in dataList:
+            # 没有主键
+            if self.keyProperty not in data or data[self.keyProperty] == 0:
+                if self.generator != AUTO_INCREMENT_KEYS:   # 如果主键不是自增，则生成主键
+                    data[self.keyProperty] = self.generator()
             columns = []
-            if isinstance(data, dict):
-                for k in keys:
-                    if k in data:
-                        dataList.append(dataToStr(data[k]))
-                        columns.append(k)
-
-            elif isinstance(data, list):
-                if isinstance(data[0], list):
-                    for l in data:
-                        d = list(map(dataToStr, l))
-                        dataList.append(d)
-                    columns = keys
-                elif isinstance(data[0], dict):
-                    sign = True
-                    for d in data:
-                        dd = []
-                        for k in keys:
-                            if k in d:
-                                dd.append(dataToStr(d[k]))
-                                if sign:
-                                    columns.append(k)
-                        sign = False
-                        if dd:
-                            dataList.append(dd)
-
-            if self.generator != AUTO_INCREMENT_KEYS:
-                if self.keyProperty not in columns:
-                    columns.append(self.keyProperty)
-                    if isinstance(dataList[0], list):
-                        for d in dataList:
-                            d.append(self.generator())
-                    else:
-                        dataList.append(self.generator())
-
-            sql = 'INSERT  INTO {}({}) VALUES({})'.format(
-                self.tableName, joinList(columns), pers(len(columns)))
-
-            sql = self._encodeSql(sql)
-            _log.info('执行sql语句：{}；值：{}'.format(sql, dataList))
+            values = []
+            for k, v in data.items():
+                if v != None:
+                    columns.append(k)
+                    values.append(v)
+            groups.setdefault(tuple(columns), []).append(values)
+        for columns, values in groups.items():
+            groups[columns] = rowsToStr(values)
+        return groups
+
+    def insertBulk(self, keys, dataList, ignore=False, replace=False, update=False,
+                   maxParams=BULK_MAX_PARAMS, maxBytes=BULK_MAX_BYTES, onChunk=None):
+        ''' 批量写入：把多行数据拼成 INSERT ... VALUES (...), (...) 语句分块执行，所有块在同一个事务中提交，返回受影响的条数
+        --
+            @example
+                orm.insertBulk(['name', 'age'], [['张三', 18], ['李四', 19]], update=True)
+
+            @param keys: 字段名列表
+            @param dataList: 二维数组，每一行的值与keys一一对应
+            @param ignore: 不存在则新增，存在则不改变
+            @param replace: 不存在则新增，存在则删除并新增（postgresql按update处理）
+            @param update: 不存在则新增，存在则更新（postgresql以主键作为冲突字段）
+            @param maxParams: 每块最多的参数个数
+            @param maxBytes: 每块参数的最大字节数（按字符串长度估算）
+            @param onChunk: 每块执行后的回调，参数为 (块序号, 行数, 耗时秒数)
+        '''
+        try:
+            chunks = self._bulkChunks(keys, dataList, ignore, replace, update, maxParams, maxBytes)
+            return self._executeChunks(chunks, 'insertBulk', onChunk,
+                                       'insertBulk error; keys:{} rows:{}', keys, len(dataList))
+        finally:
+            self._invalidate(None if replace or update else [])
+
+    def _executeChunks(self, chunks, name, onChunk, error, *errorArgs):
+        ''' 在同一个游标上逐块执行 (sql语句, 参数, 行数)，全部执行完再提交一次，出错回滚，返回受影响的条数
+        --
+            @param chunks: 可迭代对象，元素为 (sql语句, 参数, 行数)
+            @param name: 语句名，用于日志和QueryEvent
+            @param onChunk: 每块执行后的回调，参数为 (块序号, 行数, 耗时秒数)
+            @param error: 出错时的异常信息
+            @param errorArgs: 异常信息的参数
+        '''
+        cursor = self.conn.cursor()
+        try:
             affectedRows = 0
-            if isinstance(dataList[0], list):
-                affectedRows = cursor.executemany(sql, dataList)
-                if self.auto_commit:
-                    self.conn.commit()
-                return affectedRows
-            else:
-                if self.dbType == _POSTGRE and self.keyProperty == PRIMARY_KEY:
-                    sql += ' RETURNING {}'.format(self.keyProperty)
-                affectedRows = cursor.execute(sql, dataList)
-                if self.keyProperty == PRIMARY_KEY:
-                    lastId = cursor.lastrowid
-                    # 获取postgre的自增id
-                    if self.dbType == _POSTGRE:
-                        idRow = cursor.fetchone()
-                        if idRow:
-                            lastId = idRow[self.keyProperty]
-                    if self.auto_commit:
-                        self.conn.commit()
-                    return lastId
-                else:
-                    if self.auto_commit:
-                        self.conn.commit()
-                    return affectedRows
+            for i, (sql, values, n) in enumerate(chunks):
+                event = startEvent(self, sql, values, name) if _hooks else None
+                logStart = sqlLog.before(sql, values)
+                start = time.perf_counter()
+                try:
+                    res = cursor.execute(sql, values)
+                    sqlLog.after(logStart, sql, values)
+                except Exception as e:
+                    if event:
+                        finishEvent(event, None, e)
+                    raise
+                cost = time.perf_counter() - start
+                res = res if res is not None else cursor.rowcount
+                if event:
+                    finishEvent(event, res)
+                affectedRows += res
+                _log.debug('%s第%s块：%s行，耗时%.3f秒', name, i, n, cost)
+                if onChunk:
+                    onChunk(i, n, cost)
+            if self.auto_commit:
+                self.conn.commit()
+            return affectedRows
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception('insertList error; values:{}'.format(dataList))
+            self._rollback()
+            raise Exception(error.format(*errorArgs))
         finally:
             cursor.close()
 
-    def insertDictList(self, dataList):
-        ''' 插入一组数据，返回受影响的条数
+    def _bulkChunks(self, keys, dataList, ignore=False, replace=False, update=False,
+                    maxParams=BULK_MAX_PARAMS, maxBytes=BULK_MAX_BYTES):
+        ''' 检查参数，返回逐块生成 (sql语句, 参数, 行数) 的生成器
+        --
+        '''
+        if not dataList:
+            raise Exception('数据为空！')
+
+        if sum(map(bool, (ignore, replace, update))) > 1:
+            raise Exception('ignore,replace和update只能有一个为true')
+
+        head, tail = self._bulkInsertSql(keys, ignore, replace, update)
+        return _bulkSqlChunks(head, tail, dataList, len(keys), maxParams, maxBytes)
+
+    def _bulkInsertSql(self, keys, ignore=False, replace=False, update=False):
+        ''' 生成批量写入语句VALUES前后的两部分
+        --
+        '''
+        tail = ''
+        if self.dbType == _POSTGRE:
+            head = 'INSERT INTO {}({}) VALUES '.format(self.tableName, joinList(keys))
+            if ignore:
+                tail = ' ON CONFLICT DO NOTHING'
+            elif update or replace:
+                tail = self._onConflictStr(keys)
+        else:
+            head = '{} {} INTO {}({}) VALUES '.format('REPLACE' if replace else 'INSERT',
+                                                     'IGNORE' if ignore else '',
+                                                     self.tableName, joinList(keys))
+            if update:
+                tail = ' ON DUPLICATE KEY UPDATE ' + ', '.join('`{0}`=VALUES(`{0}`)'.format(k) for k in keys)
+        return self._encodeSql(head), self._encodeSql(tail)
+
+    def upsertMany(self, dataList, conflictKeys=None, updateKeys=None,
+                   maxParams=BULK_MAX_PARAMS, maxBytes=BULK_MAX_BYTES, onChunk=None):
+        ''' 批量写入，存在则更新：字段相同（值为None的字段不写入）的数据合并成多行VALUES语句分块执行，
+            postgresql为 ON CONFLICT (...) DO UPDATE SET `c`=EXCLUDED.`c`，mysql为 ON DUPLICATE KEY UPDATE `c`=VALUES(`c`)。
+            所有块在同一个事务中提交，返回受影响的条数
         --
             @example
-                orm.insertDictList([{'name':'张三', 'age':18}, {'name':'李四', 'age':19}])
+                orm.upsertMany([{'code': 'cs', 'name': '计算机'}, {'code': 'ma', 'name': '数学'}], conflictKeys=['code'])
+
+            @param dataList: 字典列表
+            @param conflictKeys: 冲突字段（主键或唯一索引的字段），默认为主键。mysql按表中所有唯一键判断冲突，忽略此项
+            @param updateKeys: 冲突时更新哪些字段，默认为写入的字段中除冲突字段以外的所有字段
+            @param maxParams: 每块最多的参数个数
+            @param maxBytes: 每块参数的最大字节数（按字符串长度估算）
+            @param onChunk: 每块执行后的回调，参数为 (块序号, 行数, 耗时秒数)
+        '''
+        chunks = self._upsertChunks(dataList, conflictKeys, updateKeys, maxParams, maxBytes)
+        try:
+            return self._executeChunks(chunks, 'upsertMany', onChunk, 'upsertMany error; rows:{}', len(dataList))
+        finally:
+            self._invalidate()
 
-            @param dataList: 插入的数据列表
+    def _upsertChunks(self, dataList, conflictKeys=None, updateKeys=None,
+                      maxParams=BULK_MAX_PARAMS, maxBytes=BULK_MAX_BYTES):
+        ''' 检查参数并分组，返回逐块生成 (sql语句, 参数, 行数) 的生成器
+        --
         '''
         if not dataList or not dataList[0]:
             raise Exception('数据为空！')
 
+        groups = self._dictListGroups(dataList)
+        return self._upsertGroupChunks(groups, conflictKeys, updateKeys, maxParams, maxBytes)
+
+    def _upsertGroupChunks(self, groups, conflictKeys, updateKeys, maxParams, maxBytes):
+        for columns, values in groups.items():
+            head = 'INSERT INTO {}({}) VALUES '.format(self.tableName, joinList(columns))
+            if self.dbType == _POSTGRE:
+                tail = self._onConflictStr(columns, conflictKeys, updateKeys)
+            else:
+                tail = self._onDuplicateKeyStr(columns, conflictKeys, updateKeys)
+            yield from _bulkSqlChunks(self._encodeSql(head), self._encodeSql(tail), values,
+                                      len(columns), maxParams, maxBytes)
+
+    def _onConflictStr(self, keys, conflictKeys=None, updateKeys=None):
+        ''' postgresql的 ON CONFLICT (...) DO UPDATE SET ...，没有要更新的字段时为 DO NOTHING
+        --
+        '''
+        conflictKeys = conflictKeys or [self.keyProperty]
+        updateKeys = _upsertUpdateKeys(keys, conflictKeys, updateKeys)
+        if not updateKeys:
+            return ' ON CONFLICT ({}) DO NOTHING'.format(joinList(conflictKeys))
+        return ' ON CONFLICT ({}) DO UPDATE SET {}'.format(
+            joinList(conflictKeys), ', '.join('`{0}`=EXCLUDED.`{0}`'.format(k) for k in updateKeys))
+
+    def _onDuplicateKeyStr(self, keys, conflictKeys=None, updateKeys=None):
+        ''' mysql的 ON DUPLICATE KEY UPDATE ...，没有要更新的字段时把冲突字段赋值为自身，保持原数据不变
+        --
+        '''
+        conflictKeys = conflictKeys or [self.keyProperty]
+        updateKeys = _upsertUpdateKeys(keys, conflictKeys, updateKeys)
+        if not updateKeys:
+            return ' ON DUPLICATE KEY UPDATE `{0}`=`{0}`'.format(conflictKeys[0])
+        return ' ON DUPLICATE KEY UPDATE ' + ', '.join('`{0}`=VALUES(`{0}`)'.format(k) for k in updateKeys)
+
+    def copyIn(self, rows, columns, localInfile=False, batchSize=ITER_BATCH_SIZE):
+        ''' 流式导入大量数据，返回写入的行数。
+            postgresql使用COPY FROM STDIN；mysql在localInfile为True时使用LOAD DATA LOCAL INFILE（需要连接开启local_infile），否则按batchSize分批调用insertBulk
+        --
+            @example
+                orm.copyIn(({'name': n, 'age': 18} for n in names), ['name', 'age'])
+
+            @param rows: 可迭代对象，元素为字典（按columns取值）或者元组、列表（与columns一一对应），不会一次性读入内存
+            @param columns: 字段名列表
+            @param localInfile: mysql是否使用LOAD DATA LOCAL INFILE
+            @param batchSize: mysql分批写入时每批的行数
+        '''
+        if self.dbType == _POSTGRE:
+            return self._copyExpert(rows, columns)
+        elif localInfile:
+            return self._loadDataInfile(rows, columns)
+
+        autoCommit = self.auto_commit
+        self.auto_commit = False
+        try:
+            count = 0
+            for batch in _copyBatches(rows, columns, batchSize):
+                self.insertBulk(columns, batch)
+                count += len(batch)
+            if autoCommit:
+                self.conn.commit()
+            return count
+        finally:
+            self.auto_commit = autoCommit
+
+    def _copyExpert(self, rows, columns):
+        ''' postgresql COPY FROM STDIN
+        --
+        '''
+        stream = _CopyStream(copyLines(rows, columns))
+        sql = self._encodeSql('COPY {}({}) FROM STDIN'.format(self.tableName, joinList(columns)))
         cursor = self.conn.cursor()
         try:
-            values = []
-            keys = ''
-            ps = ''
-
-            for data in dataList:
-                # 没有主键
-                if self.keyProperty not in data or data[self.keyProperty] == 0:
-                    if self.generator != AUTO_INCREMENT_KEYS:   # 如果主键不是自增，则生成主键
-                        data[self.keyProperty] = self.generator
-                keys, ps, vs = fieldSplit(data)
-                values.append(vs)
-
-            sql = ' INSERT INTO {}({}) VALUES({})'.format(
-                self.tableName, keys, ps)
-            sql = self._encodeSql(sql)
-            _log.info('执行sql语句：{}；值：{}'.format(sql, values))
-            affectedRows = cursor.executemany(sql, values)
+            logStart = sqlLog.before(sql)
+            cursor.copy_expert(sql, stream)
+            sqlLog.after(logStart, sql)
             if self.auto_commit:
                 self.conn.commit()
-            return affectedRows
+            return stream.lines
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception('insertDictList error; values:{}'.format(dataList))
+            self._rollback()
+            raise Exception('copyIn error; sql:{}'.format(sql))
         finally:
             cursor.close()
+            self._invalidate([])
+
+    def _loadDataInfile(self, rows, columns):
+        ''' mysql LOAD DATA LOCAL INFILE，先把数据逐行写入临时文件
+        --
+        '''
+        path, lines = _writeInfile(rows, columns)
+        sql = self._loadDataSql(columns)
+        cursor = None
+        try:
+            cursor = self.conn.cursor()
+            logStart = sqlLog.before(sql, [path])
+            cursor.execute(sql, [path])
+            sqlLog.after(logStart, sql, [path])
+            if self.auto_commit:
+                self.conn.commit()
+            return lines
+        except Exception as e:
+            _log.error(e)
+            self._rollback()
+            raise Exception('copyIn error; file:{}'.format(path))
+        finally:
+            if cursor:
+                cursor.close()
+            os.remove(path)
+            self._invalidate([])
+
+    def _loadDataSql(self, columns):
+        return "LOAD DATA LOCAL INFILE %s INTO TABLE {} CHARACTER SET utf8mb4 ({})".format(
+            self.tableName, joinList(columns))
 
     #################################### 更新操作 ####################################
     def updateByPrimaryKey(self, data, primaryValue=None, keys=None):
@@ -315,6 +582,16 @@ class Orm(object):
             @param primaryValue: 主键值，为None则从data中寻找主键
             @param keys: 更新哪些列，如果此项有值则只更新data中指定的列，多余的列不会被更新
         '''
+        sql, values = self._updateByPrimaryKeySql(data, primaryValue, keys)
+        try:
+            return self._execute(sql, values, None, 'updateByPrimaryKey error; values:{}', data)
+        finally:
+            self._invalidate([values[-1], data.get(self.keyProperty)])
+
+    def _updateByPrimaryKeySql(self, data, primaryValue=None, keys=None):
+        ''' 生成updateByPrimaryKey的sql语句和参数
+        --
+        '''
         if not primaryValue:
             primaryValue = data.pop(self.keyProperty, None)
 
@@ -325,30 +602,91 @@ class Orm(object):
             raise Exception('数据为空！')
 
         if keys:
-            data2 = {}
-            for k in keys:
-                if k in data:
-                    data2[k] = data[k]
-            data = data2
+            data = _pick(data, keys)
+
+        fieldShape, values = fieldShapeAndPer(data)
+        values.append(primaryValue)
+        sql = self._compileSql(_UPDATE_BY_KEY_SQL, (self.tableName, self.keyProperty, fieldShape),
+                               lambda: dict(tableName=self.tableName, fieldStr=fieldStrFromShape(fieldShape),
+                                            keyProperty=self.keyProperty))
+        return sql, values
+
+    def updateManyByPrimaryKey(self, dataList, keys=None, maxParams=BULK_MAX_PARAMS, maxBytes=BULK_MAX_BYTES,
+                               onChunk=None):
+        ''' 根据主键批量更新：更新字段相同的行分为一组，每组分块生成语句，
+            mysql为 UPDATE ... SET `c`=CASE `id` WHEN ... END WHERE `id` IN (...)，postgresql为 UPDATE ... FROM (VALUES ...)。
+            所有语句在同一个事务中提交，返回受影响的条数
+        --
+            @example
+                orm.updateManyByPrimaryKey([{'sid': 1, 'age': 19}, {'sid': 2, 'name': '李四2'}])
 
-        cursor = self.conn.cursor()
+            @param dataList: 字典列表，每个字典必须包含主键，值为None的字段不更新；不支持'+1'这样的增量写法。同一主键出现多次时以最后一次为准
+            @param keys: 更新哪些列，如果此项有值则只更新data中指定的列，多余的列不会被更新
+            @param maxParams: 每块最多的参数个数
+            @param maxBytes: 每块参数的最大字节数（按字符串长度估算）
+            @param onChunk: 每块执行后的回调，参数为 (块序号, 行数, 耗时秒数)
+        '''
+        groups, primaryValues = self._updateManyGroups(dataList, keys)
         try:
-            fieldStr, values = fieldStrAndPer(data)
-            values.append(primaryValue)
-            sql = 'UPDATE {} SET {} WHERE `{}`=%s'.format(
-                self.tableName, fieldStr, self.keyProperty)
-            sql = self._encodeSql(sql)
-            _log.info('执行sql语句：{}；值：{}'.format(sql, values))
-            res = cursor.execute(sql, values)
-            if self.auto_commit:
-                self.conn.commit()
-            return res
-        except Exception as e:
-            _log.error(e)
-            self.conn.rollback()
-            raise Exception('updateByPrimaryKey error; values:{}'.format(data))
+            return self._executeChunks(self._updateManyChunks(groups, maxParams, maxBytes),
+                                       'updateManyByPrimaryKey', onChunk,
+                                       'updateManyByPrimaryKey error; rows:{}', len(dataList))
         finally:
-            cursor.close()
+            self._invalidate(primaryValues)
+
+    def _updateManyGroups(self, dataList, keys=None):
+        ''' 把字典列表按更新字段分组，返回 ({字段: [[主键, 值...]]}, 主键列表)
+        --
+        '''
+        if not dataList:
+            raise Exception('数据为空！')
+
+        groups = {}
+        primaryValues = []
+        for data in dataList:
+            primaryValue = data.get(self.keyProperty)
+            if not primaryValue:
+                raise Exception('未传入主键值！')
+            if keys:
+                data = _pick(data, keys)
+            columns = tuple(k for k, v in data.items() if v != None and k != self.keyProperty)
+            if not columns:
+                continue
+            groups.setdefault(columns, {})[str(primaryValue)] = [primaryValue] + [data[k] for k in columns]
+            primaryValues.append(primaryValue)
+
+        if not groups:
+            raise Exception('数据为空！')
+        return {columns: rowsToStr(list(rows.values())) for columns, rows in groups.items()}, primaryValues
+
+    def _updateManyChunks(self, groups, maxParams=BULK_MAX_PARAMS, maxBytes=BULK_MAX_BYTES):
+        ''' 逐块生成批量更新的 (sql语句, 参数, 行数)
+        --
+        '''
+        for columns, rows in groups.items():
+            if self.dbType == _POSTGRE:
+                # 第一行 (NULL::表名).字段 让VALUES中的参数按表中字段的类型转换，它的主键为NULL，不会匹配任何行
+                keys = (self.keyProperty,) + columns
+                head = 'UPDATE {0} SET {1} FROM (SELECT {2} UNION ALL VALUES '.format(
+                    self.tableName, ', '.join('`{0}`=_v.`{0}`'.format(k) for k in columns),
+                    ', '.join('(NULL::{}).`{}`'.format(self.tableName, k) for k in keys))
+                tail = ') AS _v({1}) WHERE {0}.`{2}`=_v.`{2}`'.format(self.tableName, joinList(keys), self.keyProperty)
+                yield from _bulkSqlChunks(self._encodeSql(head), self._encodeSql(tail), rows,
+                                          len(keys), maxParams, maxBytes)
+                continue
+
+            sqls = {}
+            for chunk in _chunkRows(rows, 2 * len(columns) + 1, maxParams, maxBytes):
+                n = len(chunk)
+                sql = sqls.get(n)
+                if sql is None:
+                    case = 'CASE `{}` {} END'.format(self.keyProperty, ' '.join(['WHEN %s THEN %s'] * n))
+                    sql = sqls[n] = 'UPDATE {} SET {} WHERE `{}` IN ({})'.format(
+                        self.tableName, ', '.join('`{}`={}'.format(k, case) for k in columns),
+                        self.keyProperty, pers(n))
+                values = [v for i in range(1, len(columns) + 1) for row in chunk for v in (row[0], row[i])]
+                values.extend(row[0] for row in chunk)
+                yield sql, values, n
 
     def updateByExample(self, data, example, keys=None):
         ''' 根据Example条件更新
@@ -357,6 +695,16 @@ class Orm(object):
             @param example: 更新条件
             @param keys: 更新哪些列，如果此项有值则只更新data中指定的列，多余的列不会被更新
         '''
+        sql, values = self._updateByExampleSql(data, example, keys)
+        try:
+            return self._execute(sql, values, None, 'updateByExample error; values:{}', data)
+        finally:
+            self._invalidate()
+
+    def _updateByExampleSql(self, data, example, keys=None):
+        ''' 生成updateByExample的sql语句和参数
+        --
+        '''
         if not example:
             raise Exception('未传入更新条件！')
 
@@ -364,31 +712,15 @@ class Orm(object):
             raise Exception('数据为空！')
 
         if keys:
-            data2 = {}
-            for k in keys:
-                if k in data:
-                    data2[k] = data[k]
-            data = data2
+            data = _pick(data, keys)
 
-        cursor = self.conn.cursor()
-        try:
-            whereStr, values1 = example.whereBuilder()
-            fieldStr, values2 = fieldStrAndPer(data)
-            values2.extend(values1)
-            sql = 'UPDATE {} SET {} WHERE {}'.format(
-                self.tableName, fieldStr, whereStr)
-            sql = self._encodeSql(sql)
-            _log.info('执行sql语句：{}；值：{}'.format(sql, values2))
-            res = cursor.execute(sql, values2)
-            if self.auto_commit:
-                self.conn.commit()
-            return res
-        except Exception as e:
-            _log.error(e)
-            self.conn.rollback()
-            raise Exception('updateByExample error; values:{}'.format(data))
-        finally:
-            cursor.close()
+        whereShape, values1 = example.whereShape()
+        fieldShape, values2 = fieldShapeAndPer(data)
+        values2.extend(values1)
+        sql = self._compileSql(_UPDATE_BY_EXAMPLE_SQL, (self.tableName, fieldShape, whereShape),
+                               lambda: dict(tableName=self.tableName, fieldStr=fieldStrFromShape(fieldShape),
+                                            whereStr=example.whereBuilder()[0]))
+        return sql, values2
 
     #################################### 查询操作 ####################################
     def orderByClause(self, key, clause='DESC'):
@@ -397,11 +729,7 @@ class Orm(object):
             @param key 排序字段
             @param clause DESC或者ASC
         '''
-        if '.' in key:
-            keys = key.split('.')
-            key = '`' + keys[0] + '`.`' + keys[1] + '`'
-        else:
-            key = '`' + key + '`'
+        key = quoteKey(key)
         if not self.orderByStr:
             self.orderByStr = ' ORDER BY ' + key + ' ' + clause + ' '
         else:
@@ -413,11 +741,7 @@ class Orm(object):
         --
             @param key 分组字段
         '''
-        if '.' in key:
-            keys = key.split('.')
-            key = '`' + keys[0] + '`.`' + keys[1] + '`'
-        else:
-            key = '`' + key + '`'
+        key = quoteKey(key)
         if not self.groupByStr:
             self.groupByStr = ' GROUP BY ' + key + ' '
         else:
@@ -473,439 +797,469 @@ class Orm(object):
                     {'user':['name', 'age'], 'order':['orderId']}  => SELECT `user`.`name`, `user`.`age`, `order`:`orderId` FROM
                     {'user':[('name', 'user_name'), 'age'], 'order':['orderId']}  => SELECT `user`.`name` `user_name`, `user`.`age`, `order`:`orderId` FROM
         '''
-        if isinstance(properties, list):
-            for i, v in enumerate(properties):
-                if isinstance(v, tuple):
-                    vTuple1 = v[0]
-                    vTuple2 = v[1]
-                    if '.' in vTuple1:
-                        vTuple1s = vTuple1.split('.')
-                        vTuple1 = '`' + vTuple1s[0] + '`.`' + vTuple1s[1] + '`'
-                    else:
-                        vTuple1 = '`' + vTuple1 + '`'
-                    vTuple2 = '`' + vTuple2 + '`'
-                    properties[i] = ' {} {} '.format(vTuple1, vTuple2)
-                elif '.' in v:
-                    vs = v.split('.')
-                    properties[i] = '`' + vs[0] + '`.`' + vs[1] + '`'
-                else:
-                    properties[i] = '`' + v + '`'
-            self.properties = joinList(properties, prefix='', suffix='')
-        elif isinstance(properties, dict):
-            arr = []
-            for k, v1 in properties.items():
-                for v2 in v1:
-                    if isinstance(v2, tuple):
-                        arr.append('`{}`.`{}` `{}`'.format(k, v2[0], v2[1]))
-                    else:
-                        arr.append('`{}`.`{}`'.format(k, v2))
-            self.properties = joinList(arr, prefix='', suffix='')
+        properties = propertiesStr(properties)
+        if properties is not None:
+            self.properties = properties
         return self
 
-    def selectAll(self):
+    def selectAll(self, query=None, cache=None):
         ''' 查询所有
         --
+            @param query: 查询条件Query（连接/查询字段/排序/分组/去重），不传则使用当前Orm设置的查询状态。
+                          Query不可变，可以在多个线程之间共享同一个Orm
+            @param cache: 是否使用查询结果缓存（需要先enableQueryCache），None表示按enableQueryCache的default
         '''
-        cursor = self.conn.cursor()
+        return self._select(self._selectAllSql(query), None, 'all', cache, query, 'selectAll error; ')
 
-        try:
-            strDict = {
-                'distinctStr': self.distinct,
-                'propertiesStr': self.properties,
-                'tableName': self.tableName,
-                'joinStr': self.joinStr,
-                'groupByStr': self.groupByStr,
-                'orderByStr': self.orderByStr
-            }
-            sql = '''SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} {groupByStr} {orderByStr}'''.format(
-                **strDict)
-            sql = self._encodeSql(sql)
-            _log.info('执行sql语句：{}'.format(sql))
-            cursor.execute(sql)
-            res = cursor.fetchall()
-            if self.auto_commit:
-                self.conn.commit()
-            return res
-        except Exception as e:
-            _log.error(e)
-            self.conn.rollback()
-            raise Exception('selectAll error; ')
-        finally:
-            cursor.close()
+    def _selectAllSql(self, query=None):
+        q = query or self
+        return self._compileSql(_SELECT_ALL_SQL, (self.tableName, _stateShape(q)),
+                                lambda: self._stateParts(q))
 
-    def selectByPrimaeyKey(self, primaryValue):
+    def selectByPrimaeyKey(self, primaryValue, query=None):
         ''' 根据主键查询
         --
             @param primaryValue: 主键值
+            @param query: 查询条件Query，不传则使用当前Orm设置的查询状态
+
+            开启enablePrimaryKeyCache后先从缓存读取（有多表连接时不使用缓存）
         '''
-        try:
-            import psycopg2
-        except Exception as e:
-            pass
+        cache, shape = self._pkCacheFor(query)
+        if cache is not None:
+            key = (str(primaryValue), shape)
+            row = cache.get(key)
+            if row is not None:
+                return dict(row)
+            version = cache.version
+        res = self._execute(self._selectByPrimaryKeySql(query), [primaryValue], 'one',
+                            'selectByPrimaeyKey error; values:{}', primaryValue)
+        if cache is not None and res:
+            cache.put(key, dict(res), version)
+            cache.shapes.add(shape)
+        return res
+
+    def _selectByPrimaryKeySql(self, query=None):
+        q = query or self
+        return self._compileSql(_SELECT_BY_KEY_SQL, (self.tableName, self.keyProperty, _stateShape(q)),
+                                lambda: self._stateParts(q, keyProperty=self.keyProperty))
+
+    def selectByPrimaryKeys(self, primaryValues, query=None, chunkSize=IN_CHUNK_SIZE):
+        ''' 根据一组主键批量查询，重复的主键只查一次，按chunkSize拆成多条 IN (...) 语句。
+            开启enablePrimaryKeyCache后只查询缓存中没有的主键，查到的行也会写入缓存
+        --
+            @example
+                rows = stuOrm.selectByPrimaryKeys([1, 2, 3])
+                # {1: {'sid': 1, ...}, 2: {'sid': 2, ...}}，不存在的主键不在结果中
 
-        cursor = self.conn.cursor()
+            @param primaryValues: 主键值列表
+            @param query: 查询条件Query，不传则使用当前Orm设置的查询状态。查询字段中必须包含主键
+            @param chunkSize: 每条语句最多的主键个数
 
-        try:
-            strDict = {
-                'distinctStr': self.distinct,
-                'propertiesStr': self.properties,
-                'tableName': self.tableName,
-                'joinStr': self.joinStr,
-                'whereStr': '{}.`{}`=%s'.format(self.tableName, self.keyProperty),
-                'groupByStr': self.groupByStr,
-                'orderByStr': self.orderByStr
-            }
-            sql = '''SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} 
-                WHERE {whereStr} {groupByStr} {orderByStr}
-                '''.format(**strDict)
-            sql = self._encodeSql(sql)
-            _log.info('执行sql语句：{}；值：{}'.format(sql, primaryValue))
-            cursor.execute(sql, [primaryValue])
-            res = cursor.fetchone()
-            if self.auto_commit:
-                self.conn.commit()
-            return res
-        except Exception as e:
-            _log.error(e)
-            self.conn.rollback()
-            raise Exception(
-                'selectByPrimaeyKey error; values:{}'.format(primaryValue))
-        finally:
-            cursor.close()
-
-    def selectByExample(self, example):
+            @return: {主键值: 行}，键为传入的主键值
+        '''
+        res, misses, cache, shape = self._primaryKeysFromCache(primaryValues, query)
+        version = cache.version if cache is not None else None
+        for chunk in _chunks(misses, chunkSize):
+            rows = self._execute(self._selectByPrimaryKeysSql(len(chunk), query), chunk, 'all',
+                                 'selectByPrimaryKeys error; values:{}', chunk)
+            self._collectPrimaryKeys(res, chunk, rows, cache, shape, version)
+        return res
+
+    def _primaryKeysFromCache(self, primaryValues, query=None):
+        ''' 去重并读取主键缓存，返回 (已命中的结果, 需要查询的主键, 缓存, 查询字段组合)
+        --
+        '''
+        cache, shape = self._pkCacheFor(query)
+        res = {}
+        misses = []
+        seen = set()
+        for primaryValue in primaryValues:
+            key = str(primaryValue)
+            if key in seen:
+                continue
+            seen.add(key)
+            if cache is not None:
+                row = cache.get((key, shape))
+                if row is not None:
+                    res[primaryValue] = dict(row)
+                    continue
+            misses.append(primaryValue)
+        return res, misses, cache, shape
+
+    def _selectByPrimaryKeysSql(self, n, query=None):
+        q = query or self
+        return self._compileSql(_SELECT_BY_KEYS_SQL, (self.tableName, self.keyProperty, n, _stateShape(q)),
+                                lambda: self._stateParts(q, keyProperty=self.keyProperty, ps=pers(n)))
+
+    def _collectPrimaryKeys(self, res, chunk, rows, cache, shape, version):
+        ''' 把查询结果按传入的主键值放入res，并写入主键缓存
+        --
+        '''
+        wanted = {str(v): v for v in chunk}
+        keyName = self.keyProperty
+        for row in rows:
+            if keyName not in row:
+                raise Exception('查询字段中没有主键{}！'.format(keyName))
+            key = str(row[keyName])
+            primaryValue = wanted.get(key, row[keyName])
+            if primaryValue in res:
+                continue
+            res[primaryValue] = row
+            if cache is not None:
+                cache.put((key, shape), dict(row), version)
+                cache.shapes.add(shape)
+
+    def selectByExample(self, example, query=None, cache=None):
         ''' 根据Example条件进行查询
         --
+            @param example: 查询条件
+            @param query: 查询条件Query，不传则使用当前Orm设置的查询状态
+            @param cache: 是否使用查询结果缓存，None表示按enableQueryCache的default
         '''
-        cursor = self.conn.cursor()
+        sql, values = self._selectByExampleSql(example, query)
+        return self._select(sql, values, 'all', cache, query, 'selectByExample error; values:{}', example)
 
-        try:
-            whereStr, values = example.whereBuilder()
-            strDict = {
-                'distinctStr': self.distinct,
-                'propertiesStr': self.properties,
-                'tableName': self.tableName,
-                'joinStr': self.joinStr,
-                'whereStr': whereStr,
-                'groupByStr': self.groupByStr,
-                'orderByStr': self.orderByStr
-            }
-            sql = '''SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} 
-                WHERE {whereStr} {groupByStr} {orderByStr}
-                '''.format(**strDict)
-            sql = self._encodeSql(sql)
-            _log.info('执行sql语句：{}；值：{}'.format(sql, values))
-            cursor.execute(sql, values)
-            res = cursor.fetchall()
-            # if res and len(res) == 1:
-            #     res = res[0]
-            if self.auto_commit:
-                self.conn.commit()
-            return res
-        except Exception as e:
-            _log.error(e)
-            self.conn.rollback()
-            raise Exception('selectByExample error; values:{}'.format(example))
-        finally:
-            cursor.close()
+    def _selectByExampleSql(self, example, query=None):
+        q = query or self
+        whereShape, values = example.whereShape()
+        sql = self._compileSql(_SELECT_BY_EXAMPLE_SQL, (self.tableName, _stateShape(q), whereShape),
+                               lambda: self._stateParts(q, whereStr=example.whereBuilder()[0]))
+        return sql, values
 
-    def selectTransactByExample(self, transactProperties, example, transactName='', transact='COUNT'):
+    def selectTransactByExample(self, transactProperties, example, transactName='', transact='COUNT', query=None, cache=None):
         ''' 根据Example条件聚合查询
         --
             @param transactProperties: 统计字段
             @param example: 条件
             @param transactName: 重命名统计字段
             @param transact: 使用哪个函数，默认COUNT。可选SUM，MAX，MIN等
+            @param query: 查询条件Query，不传则使用当前Orm设置的查询状态
+            @param cache: 是否使用查询结果缓存，None表示按enableQueryCache的default
         '''
-        cursor = self.conn.cursor()
-
-        try:
-            whereStr, values = example.whereBuilder()
-            strDict = {
-                'distinctStr': self.distinct,
-                'propertiesStr': self.properties,
-                'countStr': '{}({}) {}'.format(transact, transactProperties, transactName),
-                'tableName': self.tableName,
-                'joinStr': self.joinStr,
-                'whereStr': whereStr,
-                'groupByStr': self.groupByStr,
-                'orderByStr': self.orderByStr
-            }
-            sql = '''SELECT {distinctStr} {propertiesStr} , {countStr} FROM {tableName} {joinStr} 
-                WHERE {whereStr} {groupByStr} {orderByStr}
-                '''.format(**strDict)
-            sql = self._encodeSql(sql)
-            _log.info('执行sql语句：{}；值：{}'.format(sql, values))
-            cursor.execute(sql, values)
-            res = cursor.fetchall()
-            if self.auto_commit:
-                self.conn.commit()
-            return res
-        except Exception as e:
-            _log.error(e)
-            self.conn.rollback()
-            raise Exception(
-                'selectTransactByExample error; values:{}'.format(transactProperties))
-        finally:
-            cursor.close()
+        sql, values = self._selectTransactSql(transactProperties, example, transactName, transact, False, query)
+        return self._select(sql, values, 'all', cache, query,
+                            'selectTransactByExample error; values:{}', transactProperties)
 
-    def selectGroupHavingByExample(self, transactProperties, example, transactName='', transact='COUNT'):
+    def selectGroupHavingByExample(self, transactProperties, example, transactName='', transact='COUNT', query=None, cache=None):
         ''' 根据Example条件聚合查询
         --
             @param transactProperties: 统计字段
             @param example: 条件
             @param transactName: 重命名统计字段
             @param transact: 使用哪个函数，默认COUNT。可选SUM，MAX，MIN等
+            @param query: 查询条件Query，不传则使用当前Orm设置的查询状态
+            @param cache: 是否使用查询结果缓存，None表示按enableQueryCache的default
         '''
-        if not self.groupByStr:
+        if not (query or self).groupByStr:
             return False
 
-        cursor = self.conn.cursor()
-
-        try:
-            whereStr, values = example.whereBuilder()
-            strDict = {
-                'distinctStr': self.distinct,
-                'propertiesStr': self.properties,
-                'countStr': '{}({}) {}'.format(transact, transactProperties, transactName),
-                'tableName': self.tableName,
-                'joinStr': self.joinStr,
-                'whereStr': whereStr,
-                'groupByStr': self.groupByStr,
-                'orderByStr': self.orderByStr
-            }
-            if self.havingStr and self.havingValues:
-                strDict['havingStr'] = ' HAVING ' + self.havingStr
-                values.extend(self.havingValues)
-            sql = '''SELECT {distinctStr} {propertiesStr} , {countStr} FROM {tableName} {joinStr} 
-                WHERE {whereStr} {groupByStr} {havingStr} {orderByStr}
-                '''.format(**strDict)
-            sql = self._encodeSql(sql)
-            _log.info('执行sql语句：{}；值：{}'.format(sql, values))
-            cursor.execute(sql, values)
-            res = cursor.fetchall()
-            if self.auto_commit:
-                self.conn.commit()
-            return res
-        except Exception as e:
-            _log.error(e)
-            self.conn.rollback()
-            raise Exception(
-                'selectGroupHavingByExample error; values:{}'.format(transactProperties))
-        finally:
-            cursor.close()
+        sql, values = self._selectTransactSql(transactProperties, example, transactName, transact, True, query)
+        return self._select(sql, values, 'all', cache, query,
+                            'selectGroupHavingByExample error; values:{}', transactProperties)
 
-    def selectPageAll(self, page=1, pageNum=10):
+    def _selectTransactSql(self, transactProperties, example, transactName='', transact='COUNT', having=False, query=None):
+        ''' 生成聚合查询的sql语句和参数，having为True时带上havingByExample设置的条件
+        --
+        '''
+        q = query or self
+        whereShape, values = example.whereShape()
+        havingStr = ''
+        if having and q.havingStr and q.havingValues:
+            havingStr = ' HAVING ' + q.havingStr
+            values.extend(q.havingValues)
+        shape = (self.tableName, _stateShape(q), whereShape, transact, transactProperties, transactName, havingStr)
+        sql = self._compileSql(_SELECT_TRANSACT_SQL, shape,
+                               lambda: self._stateParts(q, transact=transact, transactProperties=transactProperties,
+                                                        transactName=transactName, havingStr=havingStr,
+                                                        whereStr=example.whereBuilder()[0]))
+        return sql, values
+
+    def selectPageAll(self, page=1, pageNum=10, query=None):
         ''' 分页查询
         --
         '''
-        cursor = self.conn.cursor()
+        return self.selectPageByExample(None, page, pageNum, query)
 
+    def selectPageByExample(self, example, page=1, pageNum=10, query=None):
+        ''' 根据Example条件分页查询，example为None则查询所有
+        --
+        '''
         startId = (page - 1) * pageNum
+        sql, values = self._countSql(example, query)
+        num = self._execute(sql, values, 'one', 'selectPageByExample error; values:{}', example)['num']
 
-        try:
-            strDict = {
-                'propertiesStr': '{}.`{}`'.format(self.tableName, self.keyProperty),
-                'tableName': self.tableName,
-                'joinStr': self.joinStr,
-                # 'groupByStr': self.groupByStr,
-                # 'orderByStr': self.orderByStr
-            }
-
-            sql = '''SELECT COUNT({propertiesStr}) num FROM {tableName} {joinStr} 
-                    '''.format(**strDict)
-            sql = self._encodeSql(sql)
-            _log.info('执行sql语句：{}'.format(sql))
-            cursor.execute(sql)
-            numRes = cursor.fetchone()
-            num = numRes['num']
-
-            if num == 0 or num < startId:
-                return num, []
-
-            strDict = {
-                'distinctStr': self.distinct,
-                'propertiesStr': self.properties,
-                'tableName': self.tableName,
-                'joinStr': self.joinStr,
-                'groupByStr': self.groupByStr,
-                'orderByStr': self.orderByStr,
-                'limitStr': self._limit(startId, pageNum)
-            }
-            sql = '''SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} 
-                    {groupByStr} {orderByStr} {limitStr}
-                    '''.format(**strDict)
-            sql = self._encodeSql(sql)
-            _log.info('执行sql语句：{}'.format(sql))
-            cursor.execute(sql)
-            res = cursor.fetchall()
-            if self.auto_commit:
-                self.conn.commit()
-            return num, res
-        except Exception as e:
-            _log.error(e)
-            self.conn.rollback()
-            raise Exception('selectPageAll error')
-        finally:
-            cursor.close()
+        if num == 0 or num < startId:
+            return num, []
+
+        sql, values = self._selectPageSql(example, startId, pageNum, query)
+        res = self._execute(sql, values, 'all', 'selectPageByExample error; values:{}', example)
+        return num, res
 
-    def selectPageByExample(self, example, page=1, pageNum=10):
-        ''' 根据Example条件分页查询
+    def _countSql(self, example=None, query=None):
+        ''' 生成统计总数的sql语句和参数，example为None则统计所有
         --
         '''
-        cursor = self.conn.cursor()
+        q = query or self
+        if not example:
+            sql = self._compileSql(_COUNT_ALL_SQL, (self.tableName, self.keyProperty, q.joinStr),
+                                   lambda: dict(tableName=self.tableName, keyProperty=self.keyProperty,
+                                                joinStr=q.joinStr))
+            return sql, []
+        whereShape, values = example.whereShape()
+        sql = self._compileSql(_COUNT_BY_EXAMPLE_SQL, (self.tableName, self.keyProperty, q.joinStr, whereShape),
+                               lambda: dict(tableName=self.tableName, keyProperty=self.keyProperty,
+                                            joinStr=q.joinStr, whereStr=example.whereBuilder()[0]))
+        return sql, values
+
+    def _selectPageSql(self, example, startId, pageNum, query=None):
+        ''' 生成分页查询的sql语句和参数，example为None则查询所有
+        --
+        '''
+        q = query or self
+        if not example:
+            sql = self._compileSql(_SELECT_PAGE_ALL_SQL, (self.tableName, _stateShape(q)),
+                                   lambda: self._stateParts(q, limitStr=self._limit()))
+            return sql, self._limitValues(startId, pageNum)
+        whereShape, values = example.whereShape()
+        sql = self._compileSql(_SELECT_PAGE_BY_EXAMPLE_SQL, (self.tableName, _stateShape(q), whereShape),
+                               lambda: self._stateParts(q, whereStr=example.whereBuilder()[0],
+                                                        limitStr=self._limit()))
+        values.extend(self._limitValues(startId, pageNum))
+        return sql, values
+
+    def selectSeekAll(self, token=None, pageNum=10, seekKey=None, clause='ASC', count=False, query=None):
+        ''' 游标（keyset）分页查询，参数和返回值同selectSeekByExample
+        --
+        '''
+        return self.selectSeekByExample(None, token, pageNum, seekKey, clause, count, query)
 
-        startId = (page - 1) * pageNum
+    def selectSeekByExample(self, example=None, token=None, pageNum=10, seekKey=None, clause='ASC', count=False, query=None):
+        ''' 根据Example条件进行游标（keyset）分页查询。按seekKey排序，用上一页最后一行的值定位下一页，不使用OFFSET，翻到多深的页都和第一页一样快。
+            排序只使用seekKey，orderByClause设置的排序不生效
+        --
+            @example
+                num, res, token = orm.selectSeekByExample(example, pageNum=20, count=True)
+                while token:
+                    num, res, token = orm.selectSeekByExample(example, token, pageNum=20, count=True)
+
+            @param example: 查询条件，为None则查询所有
+            @param token: 上一次查询返回的游标，为None则查询第一页
+            @param pageNum: 每页条数
+            @param seekKey: 排序字段，必须唯一且出现在查询字段中，默认使用主键
+            @param clause: ASC或者DESC
+            @param count: 是否统计总数。总数只在第一页查询一次，之后记录在游标中
+            @param query: 查询条件Query，不传则使用当前Orm设置的查询状态
+
+            @return: (总数, 数据, 下一页的游标)。count为False时总数为None；没有下一页时游标为None
+        '''
+        seek = _decodeToken(token)
+        num = seek.get('n')
+        if count and num is None:
+            sql, values = self._countSql(example, query)
+            num = self._execute(sql, values, 'one', 'selectSeekByExample error; values:{}', example)['num']
+
+        sql, values = self._seekSql(example, seek, pageNum, seekKey, clause, query)
+        res = self._execute(sql, values, 'all', 'selectSeekByExample error; values:{}', example)
+        return self._seekResult(res, pageNum, seekKey, num, count)
+
+    def _seekSql(self, example, seek, pageNum, seekKey=None, clause='ASC', query=None):
+        ''' 生成游标分页查询的sql语句和参数，多查一条用来判断是否还有下一页
+        --
+        '''
+        q = query or self
+        seekKey = seekKey or self.keyProperty
+        clause = clause.upper()
+
+        whereShape = None
+        values = []
+        if example:
+            whereShape, values = example.whereShape()
+        seeking = 'k' in seek
+        if seeking:
+            values.append(seek['k'])
+        values.append(int(pageNum) + 1)
+
+        def parts():
+            if '.' in seekKey:
+                seekStr = quoteKey(seekKey)
+            else:
+                seekStr = '{}.`{}`'.format(self.tableName, seekKey)
+            whereStr = ''
+            if example:
+                whereStr = ' (' + example.whereBuilder()[0] + ') '
+            if seeking:
+                seekWhere = ' {} {} %s '.format(seekStr, '<' if clause == 'DESC' else '>')
+                whereStr = whereStr + ' AND ' + seekWhere if whereStr else seekWhere
+            if not whereStr:
+                whereStr = ' 1=1 '
+            return self._stateParts(q, whereStr=whereStr, seekKey=seekStr, clause=clause)
+
+        shape = (self.tableName, _stateShape(q), whereShape, seeking, seekKey, clause)
+        return self._compileSql(_SELECT_SEEK_SQL, shape, parts), values
+
+    def _seekResult(self, res, pageNum, seekKey, num, count):
+        ''' 整理游标分页的返回值
+        --
+        '''
+        seekKey = seekKey or self.keyProperty
+        res = list(res)
+        nextToken = None
+        # 多查了一条，用来判断是否还有下一页
+        if len(res) > pageNum:
+            res = res[:pageNum]
+            # 结果中排序字段的名字
+            seekName = seekKey.split('.')[-1]
+            if seekName not in res[-1]:
+                raise Exception('查询字段中没有排序字段{}！'.format(seekKey))
+            nextToken = _encodeToken({'k': res[-1][seekName], 'n': num})
+        if not count:
+            num = None
+        return num, res, nextToken
+
+    #################################### 流式查询 ####################################
+    def iterAll(self, batchSize=ITER_BATCH_SIZE, query=None):
+        ''' 使用服务端游标逐行读取所有数据，适合全表导出等大结果集
+        --
+            @example
+                for row in orm.iterAll(5000):
+                    ...
+
+            @param batchSize: 每次从数据库读取的行数
+            @param query: 查询条件Query，不传则使用当前Orm设置的查询状态
+        '''
+        return self._iterSql(self._selectAllSql(query), None, batchSize, 'iterAll')
+
+    def iterByExample(self, example, batchSize=ITER_BATCH_SIZE, query=None):
+        ''' 根据Example条件使用服务端游标逐行读取数据
+        --
+            @param example: 查询条件
+            @param batchSize: 每次从数据库读取的行数
+            @param query: 查询条件Query，不传则使用当前Orm设置的查询状态
+        '''
+        sql, values = self._selectByExampleSql(example, query)
+        return self._iterSql(sql, values, batchSize, 'iterByExample')
+
+    def iterAllBySQL(self, sql, values=None, batchSize=ITER_BATCH_SIZE):
+        ''' 使用服务端游标逐行读取原生sql的查询结果
+        --
+            @param sql: sql语句
+            @param values: 参数
+            @param batchSize: 每次从数据库读取的行数
+        '''
+        return self._iterSql(self._encodeSql(sql), values, batchSize, 'iterAllBySQL')
 
+    def _iterSql(self, sql, values, batchSize, name):
+        ''' 流式查询生成器。生成器读取完毕或被关闭之前会一直占用当前连接，期间不要用同一个连接执行其他语句。
+            与_execute一样调用钩子、记录sql日志，事件的行数为已读取的行数
+        --
+        '''
+        error = name + ' error; sql:{} values:{}'
+        event = startEvent(self, sql, values, error) if _hooks else None
+        cursor = self._serverCursor(batchSize)
+        count = 0
         try:
-            whereStr, values = example.whereBuilder()
-            strDict = {
-                'propertiesStr': '{}.`{}`'.format(self.tableName, self.keyProperty),
-                'tableName': self.tableName,
-                'joinStr': self.joinStr,
-                'whereStr': whereStr,
-                # 'groupByStr': self.groupByStr,
-                # 'orderByStr': self.orderByStr
-            }
-
-            sql = '''SELECT COUNT({propertiesStr}) num FROM {tableName} {joinStr} 
-                    WHERE {whereStr}
-                    '''.format(**strDict)
-            sql = self._encodeSql(sql)
-            _log.info('执行sql语句：{}；值：{}'.format(sql, values))
-            cursor.execute(sql, values)
-            numRes = cursor.fetchone()
-            num = numRes['num']
-
-            if num == 0 or num < startId:
-                return num, []
-
-            strDict = {
-                'distinctStr': self.distinct,
-                'propertiesStr': self.properties,
-                'tableName': self.tableName,
-                'joinStr': self.joinStr,
-                'whereStr': whereStr,
-                'groupByStr': self.groupByStr,
-                'orderByStr': self.orderByStr,
-                'limitStr': self._limit(startId, pageNum)
-            }
-            sql = '''SELECT {distinctStr} {propertiesStr} FROM {tableName} {joinStr} 
-                    WHERE {whereStr} {groupByStr} {orderByStr} {limitStr}
-                    '''.format(**strDict)
-            sql = self._encodeSql(sql)
-            _log.info('执行sql语句：{}；值：{}'.format(sql, values))
-            cursor.execute(sql, values)
-            res = cursor.fetchall()
+            try:
+                logStart = sqlLog.before(sql, values)
+                if values:
+                    cursor.execute(sql, values)
+                else:
+                    cursor.execute(sql)
+                sqlLog.after(logStart, sql, values)
+                while True:
+                    rows = cursor.fetchmany(batchSize)
+                    if not rows:
+                        break
+                    count += len(rows)
+                    for row in rows:
+                        yield row
+            finally:
+                # 先关闭服务端游标再提交
+                cursor.close()
+            if self.auto_commit:
+                self.conn.commit()
+            if event:
+                finishEvent(event, count)
+        except GeneratorExit:
+            # 提前关闭生成器，结束服务端游标所在的事务
             if self.auto_commit:
                 self.conn.commit()
-            return num, res
+            if event:
+                finishEvent(event, count)
+            raise
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception(
-                'selectPageByExample error; values:{}'.format(example))
-        finally:
-            cursor.close()
+            if event:
+                finishEvent(event, None, e)
+            self._rollback()
+            raise Exception(error.format(sql, values))
+
+    def _serverCursor(self, batchSize):
+        ''' 创建服务端游标：mysql使用SSDictCursor，postgresql使用命名游标
+        --
+        '''
+        if self.dbType == _POSTGRE:
+            cursor = self.conn.cursor(name='pyormx_iter_{}'.format(next(_cursorIds)))
+            try:
+                cursor.itersize = batchSize
+            except Exception:
+                pass
+            return cursor
+        try:
+            from pymysql.cursors import SSDictCursor
+        except ImportError:
+            return self.conn.cursor()
+        return self.conn.cursor(SSDictCursor)
 
     #################################### 删除操作 ####################################
     def deleteByPrimaryKey(self, primaryValue):
         ''' 根据主键删除 
         '''
+        sql, values = self._deleteByPrimaryKeySql(primaryValue)
+        try:
+            return self._execute(sql, values, None, 'deleteByPrimaryKey error; values:{}', primaryValue)
+        finally:
+            self._invalidate([primaryValue])
 
+    def _deleteByPrimaryKeySql(self, primaryValue):
         if not primaryValue:
             raise Exception('未传入主键值！')
 
-        cursor = self.conn.cursor()
-        try:
-            sql = 'DELETE FROM {} WHERE `{}`=%s'.format(
-                self.tableName, self.keyProperty)
-            sql = self._encodeSql(sql)
-            _log.info('执行sql语句：{}；值：{}'.format(sql, primaryValue))
-            res = cursor.execute(sql, [primaryValue])
-            if self.auto_commit:
-                self.conn.commit()
-            return res
-        except Exception as e:
-            _log.error(e)
-            self.conn.rollback()
-            raise Exception(
-                'deleteByPrimaryKey error; values:{}'.format(primaryValue))
-        finally:
-            cursor.close()
+        sql = self._compileSql(_DELETE_BY_KEY_SQL, (self.tableName, self.keyProperty),
+                               lambda: dict(tableName=self.tableName, keyProperty=self.keyProperty))
+        return sql, [primaryValue]
 
     def deleteByExample(self, example):
         ''' 根据Example条件删除数据
         '''
+        sql, values = self._deleteByExampleSql(example)
+        try:
+            return self._execute(sql, values, None, 'deleteByExample error; values:{}', example)
+        finally:
+            self._invalidate()
+
+    def _deleteByExampleSql(self, example):
         if not example:
             raise Exception('未传入更新条件！')
 
-        cursor = self.conn.cursor()
-        try:
-            whereStr, values = example.whereBuilder()
-            sql = 'DELETE FROM {} WHERE {}'.format(self.tableName, whereStr)
-            sql = self._encodeSql(sql)
-            _log.info('执行sql语句：{}；值：{}'.format(sql, values))
-            res = cursor.execute(sql, values)
-            if self.auto_commit:
-                self.conn.commit()
-            return res
-        except Exception as e:
-            _log.error(e)
-            self.conn.rollback()
-            raise Exception('deleteByExample error; values:{}'.format(example))
-        finally:
-            cursor.close()
+        whereShape, values = example.whereShape()
+        sql = self._compileSql(_DELETE_BY_EXAMPLE_SQL, (self.tableName, whereShape),
+                               lambda: dict(tableName=self.tableName, whereStr=example.whereBuilder()[0]))
+        return sql, values
 
     #################################### 原生SQL操作 ####################################
     def selectOneBySQL(self, sql, values=None):
         ''' 查询单个
         --
         '''
-        cursor = self.conn.cursor()
-
-        try:
-            sql = self._encodeSql(sql)
-            _log.info('执行sql语句：{}；值：{}'.format(sql, values))
-            if values:
-                cursor.execute(sql, values)
-            else:
-                cursor.execute(sql)
-            res = cursor.fetchone()
-            if self.auto_commit:
-                self.conn.commit()
-            return res
-        except Exception as e:
-            _log.error(e)
-            self.conn.rollback()
-            raise Exception(
-                'selectOneBySQL error; sql:{} values:{}'.format(sql, values))
-        finally:
-            cursor.close()
+        return self._execute(self._encodeSql(sql), values, 'one',
+                             'selectOneBySQL error; sql:{} values:{}', sql, values)
 
     def selectAllBySQL(self, sql, values=None):
         ''' 查询所有
         --
         '''
-        cursor = self.conn.cursor()
-
-        try:
-            _log.info('执行sql语句：{}；值：{}'.format(sql, values))
-            if values:
-                cursor.execute(self._encodeSql(sql), values)
-            else:
-                cursor.execute(self._encodeSql(sql))
-            res = cursor.fetchall()
-            if self.auto_commit:
-                self.conn.commit()
-            return res
-        except Exception as e:
-            _log.error(e)
-            self.conn.rollback()
-            raise Exception(
-                'selectAllBySQL error; sql:{} values:{}'.format(sql, values))
-        finally:
-            cursor.close()
+        return self._execute(self._encodeSql(sql), values, 'all',
+                             'selectAllBySQL error; sql:{} values:{}', sql, values)
 
     def executeBySQL(self, sql, values=None):
         ''' 根据sql进行更新删除或者新增操作， 不能用于执行查询操作，因为不会返回查询结果，查询使用selectAllBySQL或者selectOneBySQL
@@ -914,25 +1268,8 @@ class Orm(object):
             @param values: 参数
             @rerturn: 失败返回-1
         '''
-        cursor = self.conn.cursor()
-        try:
-            _log.info('执行sql语句：{}；值：{}'.format(sql, values))
-            if values:
-                cursor.execute(self._encodeSql(sql), values)
-            else:
-                cursor.execute(self._encodeSql(sql))
-
-            res = cursor.lastrowid
-            if self.auto_commit:
-                self.conn.commit()
-            return res
-        except Exception as e:
-            _log.error(e)
-            self.conn.rollback()
-            raise Exception(
-                'executeBySQL error; sql:{} values:{}'.format(sql, values))
-        finally:
-            cursor.close()
+        return self._execute(self._encodeSql(sql), values, 'lastrowid',
+                             'executeBySQL error; sql:{} values:{}', sql, values)
 
     #################################### 子查询 ####################################
     #################################### 清空表 ####################################
@@ -940,23 +1277,117 @@ class Orm(object):
         ''' 清空表
         --
         '''
+        sql = self._encodeSql('TRUNCATE TABLE {}'.format(self.tableName))
+        try:
+            return self._execute(sql, None, None, 'truncateTable error; sql:{}', sql)
+        finally:
+            self._invalidate()
+
+    #################################### 执行语句 ####################################
+    def _execute(self, sql, values=None, fetch=None, error='', *errorArgs):
+        ''' 执行sql语句并取回结果，自动提交时提交事务，出错时回滚并抛出异常
+        --
+            @param sql: sql语句
+            @param values: 参数
+            @param fetch: 取回结果的方式。'all': 所有行；'one': 第一行；'lastrowid': cursor.lastrowid；
+                        'insertid': 主键为id时返回自增id，否则返回受影响的条数；None: 受影响的条数
+            @param error: 出错时抛出的异常信息，errorArgs为其中的格式化参数
+        '''
+        event = startEvent(self, sql, values, error) if _hooks else None
         cursor = self.conn.cursor()
-        sql = f'TRUNCATE TABLE {self.tableName}'
         try:
-            
-            _log.info('执行sql语句：{}'.format(sql))
-            res = cursor.execute(sql)
+            logStart = sqlLog.before(sql, values)
+            if values:
+                res = cursor.execute(sql, values)
+            else:
+                res = cursor.execute(sql)
+            sqlLog.after(logStart, sql, values)
+            if fetch == 'all':
+                res = cursor.fetchall()
+            elif fetch == 'one':
+                res = cursor.fetchone()
+            elif fetch == 'lastrowid':
+                res = cursor.lastrowid
+            elif fetch == 'insertid' and self.keyProperty == PRIMARY_KEY:
+                res = self._lastId(cursor, cursor.fetchone() if self.dbType == _POSTGRE else None)
             if self.auto_commit:
                 self.conn.commit()
+            if event:
+                finishEvent(event, resultRows(res, fetch, cursor))
             return res
         except Exception as e:
             _log.error(e)
-            self.conn.rollback()
-            raise Exception(
-                'selectOneBySQL error; sql:{}'.format(sql))
+            if event:
+                finishEvent(event, None, e)
+            self._rollback()
+            raise Exception(error.format(*errorArgs))
         finally:
             cursor.close()
 
+    def _lastId(self, cursor, idRow=None):
+        ''' 自增id，postgresql从RETURNING返回的行中读取
+        --
+        '''
+        lastId = cursor.lastrowid
+        if idRow:
+            lastId = idRow[self.keyProperty]
+        return lastId
+
+    def _rollback(self):
+        ''' 语句出错时回滚；在transaction()中不回滚，由事务决定
+        --
+        '''
+        if self._tx is None:
+            self.conn.rollback()
+
+    #################################### 事务 ####################################
+
+    def transaction(self, *orms):
+        ''' 开启事务，with块内当前Orm和orms共用当前连接，不再逐条提交，正常退出时提交一次，出错时回滚；嵌套时使用保存点
+        --
+            @example
+                with stuOrm.transaction(studyOrm) as tx:
+                    stuOrm.insertOne({'name': '王五', 'age': 20})
+                    studyOrm.insertOne({'sid': 3, 'cid': 1})
+                    with stuOrm.transaction():
+                        stuOrm.deleteByPrimaryKey(1)   # 出错只回滚到这里
+
+            @param orms: 一起参与事务的其他Orm（可以是其他表）
+            @return: Transaction，tx.orm(表名, 主键)可以创建使用同一连接的Orm
+        '''
+        from .transaction import Transaction
+
+        return Transaction(self.conn, self, *orms)
+
+    #################################### 并发执行 ####################################
+
+    def submit(self, method, *args, **kw):
+        ''' 把当前Orm的操作提交到连接池对应的线程池中执行，返回concurrent.futures.Future。
+            任务使用连接池中的独立连接，并复制当前的查询状态（连接、排序、分组、查询字段等），提交后再修改当前Orm不影响任务
+        --
+            @example
+                stuOrm = Orm(pool.connection(), 'student', 'sid')
+                futures = [stuOrm.submit('selectByPrimaeyKey', i) for i in range(1, 100)]
+                res = [f.result() for f in futures]
+                # asyncio中
+                res = await asyncio.wrap_future(stuOrm.submit(stuOrm.selectAll))
+
+            当前Orm自己占用连接池的一个连接，线程池默认最多使用maxconnections-1个线程，见OrmExecutor
+
+            @param method: 方法名或者当前Orm的方法
+            @param args: 方法参数
+            @param kw: 方法的关键字参数
+        '''
+        from .executor import getExecutor, ormState
+
+        pool = getattr(self.conn, '_pool', None)
+        if pool is None:
+            raise Exception('submit只支持连接池中的连接！')
+        if callable(method):
+            method = method.__name__
+        return getExecutor(pool).submit(self.tableName, method, *args, keyProperty=self.keyProperty,
+                                        state=ormState(self), **kw)
+
     #################################### 清除关闭 ####################################
 
     def autoCommit(self, auto_commit=True):
@@ -991,6 +1422,232 @@ class Orm(object):
         '''
         self.conn.close()
 
+    #################################### 执行钩子 ####################################
+    @staticmethod
+    def addHook(hook):
+        ''' 注册执行钩子，对所有Orm生效。没有注册钩子时不会产生任何额外开销
+        --
+            @example
+                stats = QueryStats()
+                Orm.addHook(stats)
+                Orm.addHook(lambda event: print(event.fingerprint, event.duration, event.rows))
+
+            @param hook: QueryHook对象（before/after方法），或者函数（执行后调用）。
+                        参数QueryEvent包含：tableName、method、sql、values、fingerprint、duration、rows、poolWait、error
+        '''
+        addHook(hook)
+
+    @staticmethod
+    def removeHook(hook):
+        ''' 移除执行钩子
+        --
+        '''
+        removeHook(hook)
+
+    @staticmethod
+    def clearHooks():
+        ''' 移除所有执行钩子
+        --
+        '''
+        clearHooks()
+
+    #################################### 主键缓存 ####################################
+    def enablePrimaryKeyCache(self, maxsize=1024, ttl=60):
+        ''' 开启当前表的主键查询缓存，同一张表的所有Orm实例共享。selectByPrimaeyKey先读缓存，
+            updateByPrimaryKey/deleteByPrimaryKey按主键失效，updateByExample/deleteByExample/truncateTable、
+            带replace/update的insertOne和insertBulk使整张表失效。
+            executeBySQL等原生sql的修改不会自动失效，需要自己调用clearPrimaryKeyCache。
+            事务中以及手动提交的Orm不读写缓存
+        --
+            @param maxsize: 最多缓存的行数
+            @param ttl: 过期秒数，None表示不过期
+        '''
+        with _pkCachesLock:
+            cache = _pkCaches.get((self.dbType, self.tableName))
+            if cache is None:
+                cache = _pkCaches[(self.dbType, self.tableName)] = TTLCache(maxsize, ttl)
+                # 缓存过的查询字段组合，按主键失效时逐个删除
+                cache.shapes = set()
+            else:
+                cache.resize(maxsize)
+                cache.ttl = ttl
+        return self
+
+    def disablePrimaryKeyCache(self):
+        ''' 关闭并清空当前表的主键查询缓存
+        --
+        '''
+        with _pkCachesLock:
+            _pkCaches.pop((self.dbType, self.tableName), None)
+        return self
+
+    def clearPrimaryKeyCache(self, primaryValue=None):
+        ''' 清除主键缓存
+        --
+            @param primaryValue: 主键值，为None则清除整张表
+        '''
+        self._invalidate(None if primaryValue is None else [primaryValue])
+        return self
+
+    def primaryKeyCacheInfo(self):
+        ''' 当前表的主键缓存统计，未开启时返回None
+        --
+            @return: {'hits', 'misses', 'hitRatio': 命中率, 'expired': 过期次数, 'size', 'maxsize', 'ttl', 'memory': 估算字节数}
+        '''
+        cache = _pkCaches.get((self.dbType, self.tableName))
+        return cache.info() if cache is not None else None
+
+    def _pkCacheFor(self, query=None):
+        ''' 返回 (缓存, 查询字段组合)，未开启缓存、有多表连接或者有未提交的修改时缓存为None
+        --
+        '''
+        if not _pkCaches or self._uncommitted():
+            return None, None
+        q = query or self
+        if q.joinStr:
+            return None, None
+        cache = _pkCaches.get((self.dbType, self.tableName))
+        return cache, (self.keyProperty, q.distinct, q.properties, q.groupByStr)
+
+    def _uncommitted(self):
+        ''' 在事务中或者手动提交时，连接可能读到未提交的数据，也看不到其他连接刚提交的数据，不读写共享的缓存
+        --
+        '''
+        return self._tx is not None or not self.auto_commit
+
+    def _invalidate(self, primaryValues=None):
+        ''' 写操作之后使缓存失效：查询结果缓存按表失效；主键缓存按主键失效
+        --
+            @param primaryValues: 主键值列表，为None则整张表失效，为空列表则主键缓存不受影响（如普通insert）
+        '''
+        if _queryCache is not None:
+            _queryCache.invalidate(*tableNames(self.tableName))
+        if not _pkCaches:
+            return
+        cache = _pkCaches.get((self.dbType, self.tableName))
+        if cache is None:
+            return
+        if primaryValues is None:
+            cache.invalidate()
+            return
+        shapes = tuple(cache.shapes)
+        for primaryValue in primaryValues:
+            if primaryValue is not None:
+                for shape in shapes:
+                    cache.pop((str(primaryValue), shape))
+
+    #################################### 查询结果缓存 ####################################
+    @staticmethod
+    def enableQueryCache(backend=None, ttl=30, default=False):
+        ''' 开启查询结果缓存，对所有Orm生效。以 (sql语句, 参数) 为键缓存selectAll/selectByExample/
+            selectTransactByExample/selectGroupHavingByExample的结果；通过Orm对涉及的表（包括join的表）的写操作会使缓存失效，
+            executeBySQL等原生sql的修改不会自动失效。同一个查询同时只有一个线程访问数据库。
+            事务中以及手动提交的Orm不使用缓存
+        --
+            @example
+                Orm.enableQueryCache(ttl=10)
+                stuOrm.selectByExample(example, cache=True)
+
+            @param backend: 存储，CacheBackend对象，默认进程内的LocalBackend
+            @param ttl: 过期秒数
+            @param default: 为True时所有支持的查询默认使用缓存（可以传cache=False跳过），为False时只有传cache=True才使用缓存
+            @return: QueryCache
+        '''
+        global _queryCache, _queryCacheDefault
+        _queryCache = QueryCache(backend, ttl)
+        _queryCacheDefault = default
+        return _queryCache
+
+    @staticmethod
+    def disableQueryCache():
+        ''' 关闭查询结果缓存
+        --
+        '''
+        global _queryCache
+        _queryCache = None
+
+    @staticmethod
+    def queryCacheInfo():
+        ''' 查询结果缓存的统计，未开启时返回None
+        --
+        '''
+        return _queryCache.info() if _queryCache is not None else None
+
+    def _select(self, sql, values, fetch, cache, query, error, *errorArgs):
+        ''' 执行查询，开启了查询结果缓存并且本次查询使用缓存时先读缓存；事务中以及手动提交时直接查询数据库
+        --
+        '''
+        queryCache = _queryCache
+        if queryCache is None or not (_queryCacheDefault if cache is None else cache) or self._uncommitted():
+            return self._execute(sql, values, fetch, error, *errorArgs)
+        tables = tableNames(self.tableName, (query or self).joinStr)
+        return queryCache.load(tables, sql, values, lambda: self._execute(sql, values, fetch, error, *errorArgs))
+
+    #################################### sql日志 ####################################
+    @staticmethod
+    def setSqlLog(level=logging.INFO, sample=1, slowThreshold=None, maxValues=20, maxValueLen=200, maxSqlLen=2000):
+        ''' 设置sql语句日志，对所有Orm生效。日志级别没有开启时不会格式化sql和参数
+        --
+            @example
+                # 每100条语句记录1条
+                Orm.setSqlLog(sample=100)
+                # 只记录执行超过0.5秒的语句
+                Orm.setSqlLog(logging.WARNING, slowThreshold=0.5)
+
+            @param level: 日志级别
+            @param sample: 采样，每sample条语句记录1条，1表示全部记录
+            @param slowThreshold: 慢查询阈值（秒），设置后只记录执行时间超过阈值的语句
+            @param maxValues: 最多记录的参数个数，超出部分只记录总数
+            @param maxValueLen: 每个参数最多记录的字符数
+            @param maxSqlLen: sql语句最多记录的字符数
+        '''
+        sqlLog.configure(level, sample, slowThreshold, maxValues, maxValueLen, maxSqlLen)
+
+    #################################### sql缓存 ####################################
+    @staticmethod
+    def sqlCacheInfo():
+        ''' 查看sql语句缓存的命中情况
+        --
+            @return: {'hits': 命中次数, 'misses': 未命中次数, 'size': 当前条目数, 'maxsize': 最大条目数}
+        '''
+        return _sqlCache.info()
+
+    @staticmethod
+    def setSqlCacheSize(maxsize):
+        ''' 设置sql语句缓存的最大条数，0表示关闭缓存
+        --
+        '''
+        _sqlCache.resize(maxsize)
+
+    @staticmethod
+    def clearSqlCache():
+        ''' 清空sql语句缓存
+        --
+        '''
+        _sqlCache.clear()
+
+    def _compileSql(self, template, shape, parts):
+        ''' 根据模板生成sql语句。以查询结构为键缓存，结构相同的语句直接从缓存中读取，命中时不拼接任何片段
+        --
+            @param template: sql模板
+            @param shape: 查询结构（表名、Example指纹、字段名、查询状态等），可哈希，能唯一确定生成的语句
+            @param parts: 未命中时调用，返回模板中的各个片段（字典）
+        '''
+        key = (self.dbType, template, shape)
+        sql = _sqlCache.get(key)
+        if sql is None:
+            sql = self._encodeSql(template.format(**parts()))
+            _sqlCache.put(key, sql)
+        return sql
+
+    def _stateParts(self, q, **parts):
+        ''' 查询语句中来自查询状态（Orm或Query）的片段，加上parts
+        --
+        '''
+        parts.update(distinctStr=q.distinct, propertiesStr=q.properties, tableName=self.tableName,
+                     joinStr=q.joinStr, groupByStr=q.groupByStr, orderByStr=q.orderByStr)
+        return parts
+
     ###################################解决postgresql的兼容性问题#####################################
 
     def _encodeSql(self, sql):
@@ -1005,7 +1662,250 @@ class Orm(object):
             return new_sql
         return sql
 
-    def _limit(self, startId, pageNum):
+    def _limit(self):
+        ''' 分页的LIMIT语句，偏移量和条数作为参数传入（见_limitValues），所有页共用一条缓存的sql语句
+        --
+        '''
         if self.dbType == _POSTGRE:
-            return 'LIMIT {} offset {}'.format(pageNum, startId)
-        return 'LIMIT {}, {}'.format(startId, pageNum)
+            return 'LIMIT %s offset %s'
+        return 'LIMIT %s, %s'
+
+    def _limitValues(self, startId, pageNum):
+        if self.dbType == _POSTGRE:
+            return [int(pageNum), int(startId)]
+        return [int(startId), int(pageNum)]
+
+
+class _CopyStream(object):
+    ''' 把逐行生成的COPY文本包装成copy_expert可以读取的文件对象
+    --
+    '''
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._buffer = ''
+        self.lines = 0
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                line = next(self._lines)
+            except StopIteration:
+                break
+            self._buffer += line
+            self.lines += 1
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        if self._buffer:
+            data, self._buffer = self._buffer, ''
+            return data
+        try:
+            line = next(self._lines)
+        except StopIteration:
+            return ''
+        self.lines += 1
+        return line
+
+
+def _bulkSqlChunks(head, tail, dataList, columnNum, maxParams, maxBytes):
+    ''' 逐块生成批量写入的 (sql语句, 参数, 行数)
+    --
+    '''
+    ps = '(' + pers(columnNum) + ')'
+    sqls = {}
+    for chunk in _chunkRows(dataList, columnNum, maxParams, maxBytes):
+        n = len(chunk)
+        sql = sqls.get(n)
+        if sql is None:
+            sql = sqls[n] = head + ', '.join([ps] * n) + tail
+        yield sql, [v for row in chunk for v in row], n
+
+
+def _copyBatches(rows, columns, batchSize):
+    ''' copyIn分批写入时，把rows逐批转换成insertBulk需要的二维数组
+    --
+    '''
+    batch = []
+    for row in rows:
+        if isinstance(row, dict):
+            row = [row.get(k) for k in columns]
+        batch.append([None if v is None else dataToStr(v) for v in row])
+        if len(batch) >= batchSize:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _writeInfile(rows, columns):
+    ''' 把rows逐行写入LOAD DATA用的临时文件，返回 (文件路径, 行数)
+    --
+    '''
+    fd, path = tempfile.mkstemp(suffix='.tsv')
+    lines = 0
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            for line in copyLines(rows, columns):
+                f.write(line)
+                lines += 1
+    except Exception:
+        os.remove(path)
+        raise
+    return path, lines
+
+
+def _stateShape(q):
+    ''' Orm或Query的查询状态，作为sql语句缓存键的一部分
+    --
+    '''
+    return (q.distinct, q.properties, q.joinStr, q.groupByStr, q.orderByStr)
+
+
+def _dbType(conn):
+    ''' 判断连接的数据库类型，按连接类型（连接池连接按驱动模块）缓存结果
+    --
+    '''
+    pool = getattr(conn, '_pool', None)
+    creator = getattr(pool, '_creator', None)
+    key = (type(conn), getattr(creator, '__name__', None))
+    dbType = _dbTypes.get(key)
+    if dbType is not None:
+        return dbType
+
+    name = str(type(conn))
+    if not ('psycopg2' in name or 'mysql' in name):
+        if key[1] is None:
+            raise Exception('数据库类型暂不支持！')
+        name = key[1]
+    if 'psycopg2' in name:
+        dbType = _POSTGRE
+    elif 'mysql' in name:
+        dbType = _MYSQL
+    else:
+        raise Exception('数据库类型暂不支持！')
+    _dbTypes[key] = dbType
+    return dbType
+
+
+def _upsertUpdateKeys(keys, conflictKeys, updateKeys=None):
+    ''' 冲突时更新的字段：只保留写入了的字段，默认为除冲突字段以外的所有字段
+    --
+    '''
+    if updateKeys is None:
+        return [k for k in keys if k not in conflictKeys]
+    return [k for k in updateKeys if k in keys]
+
+
+def _pick(data, keys):
+    ''' 只保留data中keys指定的字段
+    --
+    '''
+    data2 = {}
+    for k in keys:
+        if k in data:
+            data2[k] = data[k]
+    return data2
+
+
+def _chunks(values, size):
+    ''' 把列表按size切块
+    --
+    '''
+    size = max(int(size or len(values) or 1), 1)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _chunkRows(rows, columnNum, maxParams, maxBytes):
+    ''' 把数据按参数个数和字节数切成多块
+    --
+    '''
+    maxRows = max(1, maxParams // max(columnNum, 1)) if maxParams else len(rows)
+    chunk = []
+    size = 0
+    for row in rows:
+        if maxBytes:
+            rowSize = sum(len(v) if isinstance(v, str) else 8 for v in row)
+            if chunk and size + rowSize > maxBytes:
+                yield chunk
+                chunk = []
+                size = 0
+            size += rowSize
+        chunk.append(row)
+        if len(chunk) >= maxRows:
+            yield chunk
+            chunk = []
+            size = 0
+    if chunk:
+        yield chunk
+
+
+def _encodeToken(seek):
+    ''' 把游标分页的位置编码成不透明的字符串
+    --
+    '''
+    seek['k'] = _encodeSeekValue(seek['k'])
+    data = json.dumps(seek, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def _decodeToken(token):
+    ''' 解码游标分页的位置，token为空返回空字典
+    --
+    '''
+    if not token:
+        return {}
+    try:
+        seek = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        if 'k' in seek:
+            seek['k'] = _decodeSeekValue(seek['k'])
+        return seek
+    except Exception:
+        raise Exception('无效的分页游标：{}'.format(token))
+
+
+def _encodeSeekValue(value):
+    ''' 游标中的排序字段值。json不能表示的类型带上类型标签，解码时还原，下一页与数据库比较时类型不变
+    --
+        @example
+            _encodeSeekValue(Decimal('1.50'))
+        return: {'t': 'decimal', 'v': '1.50'}
+    '''
+    if isinstance(value, Decimal):
+        return {'t': 'decimal', 'v': str(value)}
+    if isinstance(value, datetime.datetime):
+        return {'t': 'datetime', 'v': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'t': 'date', 'v': value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {'t': 'time', 'v': value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        # mysql的TIME字段
+        return {'t': 'timedelta', 'v': [value.days, value.seconds, value.microseconds]}
+    if isinstance(value, (bytes, bytearray)):
+        return {'t': 'bytes', 'v': base64.b64encode(value).decode('ascii')}
+    return dataToJson(value)
+
+
+def _decodeSeekValue(value):
+    if not isinstance(value, dict):
+        return value
+    t, v = value['t'], value['v']
+    if t == 'decimal':
+        return Decimal(v)
+    if t == 'datetime':
+        return datetime.datetime.fromisoformat(v)
+    if t == 'date':
+        return datetime.date.fromisoformat(v)
+    if t == 'time':
+        return datetime.time.fromisoformat(v)
+    if t == 'timedelta':
+        return datetime.timedelta(*v)
+    if t == 'bytes':
+        return base64.b64decode(v)
+    raise ValueError(t)
@@ -0,0 +1,139 @@
+from .sql_utils import quoteKey, propertiesStr
+
+__all__ = ['Query']
+
+# Query的字段，名字和Orm上的查询状态一致，Orm的sql生成方法可以直接从Query读取
+_FIELDS = ('joinStr', 'properties', 'orderByStr', 'groupByStr', 'havingStr', 'havingValues', 'distinct')
+_DEFAULTS = ('', ' * ', '', '', '', (), '')
+
+
+class Query(object):
+    __slots__ = _FIELDS
+
+    def __init__(self, joinStr='', properties=' * ', orderByStr='', groupByStr='',
+                 havingStr='', havingValues=(), distinct=''):
+        ''' 不可变的查询条件（多表连接/查询字段/排序/分组/HAVING/去重），每个设置方法都返回一个新的Query，原对象不变。
+            可以在多个线程和多个Orm之间共享，传给Orm的查询方法代替Orm自身的查询状态
+        --
+            @example
+                q = Query().setSelectProperties(['sid', 'name']).orderByClause('age')
+                stuOrm.selectByExample(example, query=q)
+                stuOrm.selectAll(query=q.setDistinct())
+        '''
+        set_ = object.__setattr__
+        set_(self, 'joinStr', joinStr)
+        set_(self, 'properties', properties)
+        set_(self, 'orderByStr', orderByStr)
+        set_(self, 'groupByStr', groupByStr)
+        set_(self, 'havingStr', havingStr)
+        set_(self, 'havingValues', tuple(havingValues))
+        set_(self, 'distinct', distinct)
+
+    @classmethod
+    def fromOrm(cls, orm):
+        ''' 用Orm当前的查询状态创建Query
+        --
+        '''
+        return cls(*(getattr(orm, k) for k in _FIELDS))
+
+    def orderByClause(self, key, clause='DESC'):
+        ''' ORDER BY key clause
+        --
+            @param key 排序字段
+            @param clause DESC或者ASC
+        '''
+        key = quoteKey(key)
+        if not self.orderByStr:
+            return self._replace(orderByStr=' ORDER BY ' + key + ' ' + clause + ' ')
+        return self._replace(orderByStr=self.orderByStr + ' , ' + key + ' ' + clause + ' ')
+
+    def groupByClause(self, key):
+        ''' GROUP BY key clause
+        --
+            @param key 分组字段
+        '''
+        key = quoteKey(key)
+        if not self.groupByStr:
+            return self._replace(groupByStr=' GROUP BY ' + key + ' ')
+        return self._replace(groupByStr=self.groupByStr + ' , ' + key)
+
+    def havingByExample(self, example):
+        ''' HAVING
+        --
+        '''
+        havingStr, havingValues = example.whereBuilder()
+        return self._replace(havingStr=havingStr, havingValues=tuple(havingValues))
+
+    def join(self, tName, onStr):
+        ''' 多表连接查询，内连接
+        --
+            @param tName: 表名
+            @param onStr: 条件
+        '''
+        return self._replace(joinStr=self.joinStr + ' JOIN ' + tName + ' ON ' + onStr + ' ')
+
+    def leftJoin(self, tName, onStr):
+        ''' 多表连接查询，左连接
+        --
+            @param tName: 表名
+            @param onStr: 条件
+        '''
+        return self._replace(joinStr=self.joinStr + ' LEFT JOIN ' + tName + ' ON ' + onStr + ' ')
+
+    def rightJoin(self, tName, onStr):
+        ''' 多表连接查询，右连接
+        --
+            @param tName: 表名
+            @param onStr: 条件
+        '''
+        return self._replace(joinStr=self.joinStr + ' RIGHT JOIN ' + tName + ' ON ' + onStr + ' ')
+
+    def setDistinct(self):
+        ''' 设置去重
+        '''
+        return self._replace(distinct=' DISTINCT ')
+
+    def setSelectProperties(self, properties):
+        ''' 设置查询的列名，格式同Orm.setSelectProperties
+        --
+        '''
+        properties = propertiesStr(properties)
+        if properties is None:
+            return self
+        return self._replace(properties=properties)
+
+    def clear(self):
+        ''' 返回一个空的Query
+        --
+        '''
+        return Query()
+
+    def key(self):
+        ''' 所有字段组成的元组，可以用作缓存的键
+        --
+        '''
+        return tuple(getattr(self, k) for k in _FIELDS)
+
+    def _replace(self, **kw):
+        values = dict(zip(_FIELDS, self.key()))
+        values.update(kw)
+        return Query(**values)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Query不可修改，请使用返回的新对象')
+
+    def __delattr__(self, name):
+        raise AttributeError('Query不可修改，请使用返回的新对象')
+
+    def __eq__(self, other):
+        return isinstance(other, Query) and self.key() == other.key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        parts = ['{}={!r}'.format(k, v) for k, v, d in zip(_FIELDS, self.key(), _DEFAULTS) if v != d]
+        return 'Query({})'.format(', '.join(parts))
@@ -0,0 +1,292 @@
+import pickle
+import random
+import re
+import threading
+import time
+from .cache import TTLCache
+
+__all__ = ['QueryCache', 'CacheBackend', 'LocalBackend', 'PickleBackend', 'tableNames']
+
+# joinStr中的表名
+_JOIN_TABLE = re.compile(r'\bJOIN\s+([`"\w.]+)', re.I)
+
+
+class CacheBackend(object):
+    ''' 查询缓存的存储接口，接入memcached/redis等共享缓存时实现这五个方法。
+        表的版本号也保存在这里，共用同一个存储的进程之间写操作互相可见
+    --
+    '''
+
+    def get(self, key):
+        ''' 读取，不存在或已过期返回None
+        '''
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        ''' 写入，ttl为过期秒数
+        '''
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def incr(self, key, initial):
+        ''' 原子地加一并返回新值，不过期；不存在时写入initial并返回（redis: SET NX + INCR；memcached: add + incr）
+        '''
+        raise NotImplementedError
+
+
+class LocalBackend(CacheBackend):
+    def __init__(self, maxsize=1024):
+        ''' 进程内缓存（默认），读取时返回结果的副本，调用方修改结果不影响缓存
+        --
+            @param maxsize: 最多缓存的结果数
+        '''
+        self._cache = TTLCache(maxsize)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        value = _unexpired(self._cache, key)
+        return None if value is None else _copyResult(value)
+
+    def set(self, key, value, ttl=None):
+        self._cache.put(key, (_expireAt(ttl), _copyResult(value)))
+
+    def delete(self, key):
+        self._cache.pop(key)
+
+    def clear(self):
+        self._cache.invalidate()
+
+    def incr(self, key, initial):
+        with self._lock:
+            value = _unexpired(self._cache, key)
+            value = initial if value is None else value + 1
+            self._cache.put(key, (None, value))
+            return value
+
+    def info(self):
+        return self._cache.info()
+
+
+class PickleBackend(CacheBackend):
+    def __init__(self, maxsize=1024):
+        ''' 共享缓存的本地替身：和memcached/redis一样按pickle序列化保存，用于开发和测试时验证结果能否放进共享缓存
+        --
+            @param maxsize: 最多缓存的结果数
+        '''
+        self._cache = TTLCache(maxsize)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        data = _unexpired(self._cache, _keyStr(key))
+        return None if data is None else pickle.loads(data)
+
+    def set(self, key, value, ttl=None):
+        self._cache.put(_keyStr(key), (_expireAt(ttl), pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+
+    def delete(self, key):
+        self._cache.pop(_keyStr(key))
+
+    def clear(self):
+        self._cache.invalidate()
+
+    def incr(self, key, initial):
+        key = _keyStr(key)
+        with self._lock:
+            data = _unexpired(self._cache, key)
+            value = initial if data is None else pickle.loads(data) + 1
+            self._cache.put(key, (None, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+            return value
+
+    def info(self):
+        return self._cache.info()
+
+
+class QueryCache(object):
+    def __init__(self, backend=None, ttl=30):
+        ''' 查询结果缓存，以 (sql语句, 参数) 为键。
+            每张表有一个版本号，写操作使版本号加一，缓存键中带上查询涉及的所有表的版本号，旧结果自然失效。
+            版本号保存在backend中，使用memcached/redis等共享存储时，一个进程的写操作也会使其他进程的缓存失效。
+            同一个键同时只有一个线程查询数据库，其他线程等待结果（single-flight）
+        --
+            @param backend: 存储，CacheBackend对象，默认LocalBackend
+            @param ttl: 过期秒数
+        '''
+        self.backend = backend if backend is not None else LocalBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def load(self, tables, sql, values, loader):
+        ''' 读取缓存，不存在则调用loader查询并写入缓存
+        --
+            @param tables: 查询涉及的表名
+            @param sql: sql语句
+            @param values: 参数
+            @param loader: 查询数据库的函数
+        '''
+        versions = self._versions(tables)
+        key = (sql, _freeze(values), tables, versions)
+        res = self.backend.get(key)
+        if res is not None:
+            with self._lock:
+                self.hits += 1
+            return res
+
+        with self._lock:
+            flight = self._loading.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._loading[key] = _Flight()
+                self.misses += 1
+            else:
+                self.waits += 1
+        if not leader:
+            return _copyResult(flight.wait())
+
+        try:
+            res = loader()
+            flight.result = res
+            # 查询期间表被修改过，结果可能是旧的，不写缓存
+            stale = versions != self._versions(tables)
+            if res is not None and not stale:
+                self.backend.set(key, res, self.ttl)
+            return res
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            flight.done.set()
+
+    def invalidate(self, *tables):
+        ''' 表被修改后调用，使涉及这些表的缓存失效
+        --
+        '''
+        for t in tables:
+            self.backend.incr(_versionKey(t), _initialVersion())
+
+    def _versions(self, tables):
+        ''' 从backend读取表的版本号
+        --
+        '''
+        versions = []
+        for t in tables:
+            key = _versionKey(t)
+            version = self.backend.get(key)
+            if version is None:
+                # 首次使用或被淘汰：从随机值开始，不会对上之前缓存的结果
+                version = self.backend.incr(key, _initialVersion())
+            versions.append(version)
+        return tuple(versions)
+
+    def clear(self):
+        ''' 清空缓存
+        --
+        '''
+        self.backend.clear()
+
+    def info(self):
+        ''' 统计信息
+        --
+            @return: {'hits': 命中次数, 'misses': 查询数据库次数, 'waits': 等待其他线程查询结果的次数, 'hitRatio': 命中率, 'backend': 存储的统计}
+        '''
+        with self._lock:
+            total = self.hits + self.misses + self.waits
+            info = {'hits': self.hits, 'misses': self.misses, 'waits': self.waits,
+                    'hitRatio': (self.hits + self.waits) / total if total else 0.0}
+        if hasattr(self.backend, 'info'):
+            info['backend'] = self.backend.info()
+        return info
+
+
+class _Flight(object):
+    ''' 正在进行的一次查询，其他线程等待它的结果
+    --
+    '''
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def tableNames(tableName, joinStr=''):
+    ''' 查询涉及的表名（去掉引号），包括joinStr中连接的表
+    --
+        @example
+            tableNames('`student`', ' LEFT JOIN study ON study.sid=student.sid ')
+        return: ('student', 'study')
+    '''
+    tables = [_unquote(tableName)]
+    if joinStr:
+        for t in _JOIN_TABLE.findall(joinStr):
+            t = _unquote(t)
+            if t not in tables:
+                tables.append(t)
+    return tuple(tables)
+
+
+def _unquote(name):
+    return name.replace('`', '').replace('"', '')
+
+
+def _freeze(values):
+    if values is None:
+        return None
+    try:
+        values = tuple(values)
+        hash(values)
+        return values
+    except TypeError:
+        return repr(values)
+
+
+def _versionKey(table):
+    return ('pyormx_version', table)
+
+
+def _initialVersion():
+    return random.getrandbits(48)
+
+
+def _expireAt(ttl):
+    return time.monotonic() + ttl if ttl else None
+
+
+def _unexpired(cache, key):
+    item = cache.get(key)
+    if item is None:
+        return None
+    expireAt, value = item
+    if expireAt is not None and expireAt <= time.monotonic():
+        cache.pop(key)
+        return None
+    return value
+
+
+def _keyStr(key):
+    return repr(key)
+
+
+def _copyResult(res):
+    if isinstance(res, list):
+        return [dict(r) if isinstance(r, dict) else r for r in res]
+    if isinstance(res, dict):
+        return dict(res)
+    return res
@@ -1,9 +1,22 @@
+import datetime
 import json
+import uuid
+from collections import OrderedDict
+from decimal import Decimal
 
 __all__ = ['joinList', 'pers', 'fieldStrFromList',
-           'fieldStr', 'fieldStrAndPer',
-           'fieldSplit', 'toJson', 'dataToJson',
-           'dataToStr', 'dataToFloat']
+           'fieldStr', 'fieldStrAndPer', 'fieldShapeAndPer', 'fieldStrFromShape',
+           'fieldSplit', 'fieldColumns', 'toJson', 'dataToJson',
+           'dataToStr', 'dataToFloat', 'dataToCopy', 'copyLines',
+           'columnConverter', 'rowsToStr', 'quoteKey', 'propertiesStr']
+
+# dataToStr会原样返回的类型
+_PLAIN_TYPES = frozenset((int, float, bool, str))
+_PLAIN_OR_NONE_TYPES = _PLAIN_TYPES | {type(None)}
+# 转换结果一定是str(data)的类型（这些类型的值永远为真）
+_STR_TYPES = frozenset((datetime.date, datetime.datetime, datetime.time, uuid.UUID))
+# 转换结果一定是json字符串的类型
+_JSON_TYPES = frozenset((list, dict))
 
 def joinList(arr, prefix = '`', suffix = '`', delimiter=' , '):
     """ 用指定的分隔符连接数组，可以加上特定前缀和后缀
@@ -23,6 +36,47 @@ def joinList(arr, prefix = '`', suffix = '`', delimiter=' , '):
     """
     return delimiter.join(prefix + dataToStr(a) + suffix for a in arr)
 
+def quoteKey(key):
+    """ 给字段名加上反引号，支持【表名.字段名】形式
+    --
+        @example
+            quoteKey('user.name')
+        return: `user`.`name`
+    """
+    if '.' in key:
+        keys = key.split('.')
+        return '`' + keys[0] + '`.`' + keys[1] + '`'
+    return '`' + key + '`'
+
+def propertiesStr(properties):
+    """ 把查询的列转换成SELECT后面的字段字符串，不修改传入的参数
+    --
+        @example
+            propertiesStr(['name', ('user.age', 'user_age')])
+        return: `name` ,  `user`.`age` `user_age` 
+
+        @example
+            propertiesStr({'user':['name', ('age', 'user_age')]})
+        return: `user`.`name` , `user`.`age` `user_age`
+    """
+    arr = []
+    if isinstance(properties, list):
+        for v in properties:
+            if isinstance(v, tuple):
+                arr.append(' {} `{}` '.format(quoteKey(v[0]), v[1]))
+            else:
+                arr.append(quoteKey(v))
+    elif isinstance(properties, dict):
+        for k, v1 in properties.items():
+            for v2 in v1:
+                if isinstance(v2, tuple):
+                    arr.append('`{}`.`{}` `{}`'.format(k, v2[0], v2[1]))
+                else:
+                    arr.append('`{}`.`{}`'.format(k, v2))
+    else:
+        return None
+    return joinList(arr, prefix='', suffix='')
+
 def pers(n):
     """ 返回指定数量的%s，中间用逗号隔开
     --
@@ -69,25 +123,40 @@ def fieldStrAndPer(d):
             fieldStrAndPer({'name':'张三', 'age':18})
         return: (' `name`=%s  ,  `age`=%s ', ['张三', '18'])
     """
-    l1 = []
-    lper = []
+    shape, values = fieldShapeAndPer(d)
+    return fieldStrFromShape(shape), values
+
+def fieldShapeAndPer(d):
+    """ 把字典中所有非空字段拆成结构 ((k1, 运算符), ...) 和 [v1, v2...]，不拼接字符串。
+        值为 +1、-1、*2、/2 形式的字符串时运算符为第一个字符（在原值上运算），否则为''
+    --
+        @example
+            fieldShapeAndPer({'name':'张三', 'age':'+1'})
+        return: ((('name', ''), ('age', '+')), ['张三', 1.0])
+    """
+    shape = []
     l2 = []
     for k, v in d.items():
         if v != None:
-            l1.append(k)
-            noAppend = True # 标记lper和l2还未赋值
-            if isinstance(v, str):
-                if v.startswith('+') or v.startswith('-') or v.startswith('*') or v.startswith('/'):
-                    vv = dataToFloat(v[1:])
-                    if vv:
-                        noAppend = False
-                        lper.append('{}{}%s'.format(k, v[:1]))
-                        l2.append(vv)
-            if noAppend:
-                lper.append('%s')
-                l2.append(dataToStr(v))
-
-    return fieldStrFromList(l1, lper, vPrefix='', vSuffix=''), l2
+            if isinstance(v, str) and v[:1] in ('+', '-', '*', '/'):
+                vv = dataToFloat(v[1:])
+                if vv:
+                    shape.append((k, v[:1]))
+                    l2.append(vv)
+                    continue
+            shape.append((k, ''))
+            l2.append(dataToStr(v))
+    return tuple(shape), l2
+
+def fieldStrFromShape(shape):
+    """ 把fieldShapeAndPer返回的结构拼成 `k1`=%s, `k2`=k2+%s... 形式的字符串
+    --
+        @example
+            fieldStrFromShape((('name', ''), ('age', '+')))
+        return: ' `name`=%s  ,  `age`=age+%s '
+    """
+    arr = [' `' + str(k) + '`=' + (str(k) + op if op else '') + '%s ' for k, op in shape]
+    return joinList(arr, prefix = '', suffix = '')
 
 def fieldSplit(d):
     """ 把字典中所有非空字段拼成 "`k1`,`k2`..."","%s, %s..." 两个字符串 和 "v1","v2"... 列表
@@ -96,14 +165,23 @@ def fieldSplit(d):
         	fieldSplit({'name':'张三', 'age':None, 'aaa':'bbb'})
         return: ("`name`, `aaa`", "%s, %s", ["张三", "bbb"])
     """
+    keys, values = fieldColumns(d)
+    return joinList(keys), pers(len(values)), values
+
+def fieldColumns(d):
+    """ 字典中所有非空字段的字段名和值
+    --
+        @example
+            fieldColumns({'name':'张三', 'age':None, 'aaa':'bbb'})
+        return: (('name', 'aaa'), ['张三', 'bbb'])
+    """
     l1 = []
     l2 = []
     for k, v in d.items():
         if v != None:
             l1.append(k)
             l2.append(dataToStr(v))
-
-    return joinList(l1), pers(len(l2)), l2
+    return tuple(l1), l2
 
 def toJson(data):
     """ json强制转化方法
@@ -120,10 +198,8 @@ def dataToJson(data):
 
         @return list, dict 或 str类型
     """
-    from collections import OrderedDict
     if isinstance(data, OrderedDict):
         data = dict(data)
-    from decimal import Decimal
     if data == None or isinstance(data, int) or isinstance(data, float) or isinstance(data, bool):
         return data
     elif isinstance(data, str):
@@ -154,6 +230,9 @@ def dataToStr(data):
 
         @return 如果是对象转换成json字符串，其他类型转换成str
     """
+    if type(data) in _PLAIN_TYPES:
+        return data
+
     if isinstance(data, list) or isinstance(data, dict):
         return json.dumps(dataToJson(data))
     
@@ -170,3 +249,77 @@ def dataToFloat(data):
         return float(data)
     except Exception as e:
         return False
+
+def _noneToStr(data):
+    return '' if data is None else data
+
+def _jsonStr(data):
+    return json.dumps(dataToJson(data))
+
+def columnConverter(values):
+    """ 根据一列数据的类型推断这一列的转换方法，转换结果与dataToStr相同
+    --
+        @return 不需要转换时返回None，否则返回转换方法
+    """
+    types = set(map(type, values))
+    if types <= _PLAIN_TYPES:
+        return None
+    if types <= _PLAIN_OR_NONE_TYPES:
+        return _noneToStr
+    if types <= _STR_TYPES:
+        return str
+    if types <= _JSON_TYPES:
+        return _jsonStr
+    return dataToStr
+
+def rowsToStr(rows):
+    """ 按列转换二维数组中的数据：每列只推断一次转换方法，再作用于整列，结果与逐个调用dataToStr相同
+    --
+        @example
+            rowsToStr([['张三', None], ['李四', {'a': 1}]])
+        return: [('张三', ''), ('李四', '{"a": 1}')]
+
+        @param rows: 二维数组
+        @return 不需要转换时原样返回rows，否则返回元组列表
+    """
+    if not rows:
+        return rows
+    n = len(rows[0])
+    if any(len(row) != n for row in rows):
+        return [[dataToStr(v) for v in row] for row in rows]
+
+    columns = list(zip(*rows))
+    converted = False
+    for i, column in enumerate(columns):
+        converter = columnConverter(column)
+        if converter is not None:
+            columns[i] = list(map(converter, column))
+            converted = True
+    if not converted:
+        return rows
+    return list(zip(*columns))
+
+def dataToCopy(data):
+    """ 把数据转换成COPY文本格式（postgresql COPY和mysql LOAD DATA通用）中的一个字段，转换规则同dataToStr，None转换成\\N
+    --
+        @example
+            dataToCopy(None)
+        return: \\N
+    """
+    if data is None:
+        return '\\N'
+    data = dataToStr(data)
+    if not isinstance(data, str):
+        return str(data)
+    return data.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+def copyLines(rows, columns):
+    """ 把数据逐行转换成COPY文本格式，每行以\\n结尾。rows可以是任意可迭代对象，不会一次性读入内存
+    --
+        @param rows: 字典（按columns取值）或者元组、列表（与columns一一对应）
+        @param columns: 字段名列表
+    """
+    for row in rows:
+        if isinstance(row, dict):
+            row = [row.get(k) for k in columns]
+        yield '\t'.join([dataToCopy(v) for v in row]) + '\n'
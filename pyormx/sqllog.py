@@ -0,0 +1,94 @@
+import itertools
+import logging
+import time
+
+__all__ = ['SqlLog', 'sqlLog']
+
+_log = logging.getLogger()
+
+
+class _Truncated(object):
+    ''' 日志参数，只在日志真正输出时才转换成字符串，并截断过长的内容
+    --
+    '''
+    __slots__ = ('data', 'maxItems', 'maxLen')
+
+    def __init__(self, data, maxItems, maxLen):
+        self.data = data
+        self.maxItems = maxItems
+        self.maxLen = maxLen
+
+    def __str__(self):
+        data = self.data
+        if isinstance(data, (list, tuple)) and self.maxItems and len(data) > self.maxItems:
+            items = [_cut(repr(v), self.maxLen) for v in data[:self.maxItems]]
+            return '[{}, ...共{}个]'.format(', '.join(items), len(data))
+        if isinstance(data, (list, tuple)):
+            return '[{}]'.format(', '.join(_cut(repr(v), self.maxLen) for v in data))
+        return _cut(str(data), self.maxLen * max(self.maxItems, 1))
+
+
+def _cut(s, maxLen):
+    if maxLen and len(s) > maxLen:
+        return s[:maxLen] + '...({}字符)'.format(len(s))
+    return s
+
+
+class SqlLog(object):
+    def __init__(self, level=logging.INFO, sample=1, slowThreshold=None,
+                 maxValues=20, maxValueLen=200, maxSqlLen=2000):
+        ''' sql语句日志。只有日志级别开启时才会格式化，参数过多或过长时截断
+        --
+            @param level: 日志级别
+            @param sample: 采样，每sample条语句记录1条，1表示全部记录
+            @param slowThreshold: 慢查询阈值（秒），设置后只记录执行时间超过阈值的语句
+            @param maxValues: 最多记录的参数个数
+            @param maxValueLen: 每个参数最多记录的字符数
+            @param maxSqlLen: sql语句最多记录的字符数
+        '''
+        self.configure(level, sample, slowThreshold, maxValues, maxValueLen, maxSqlLen)
+        self._counter = itertools.count()
+
+    def configure(self, level=logging.INFO, sample=1, slowThreshold=None,
+                  maxValues=20, maxValueLen=200, maxSqlLen=2000):
+        ''' 修改配置，参数同__init__
+        --
+        '''
+        self.level = level
+        self.sample = max(int(sample or 1), 1)
+        self.slowThreshold = slowThreshold
+        self.maxValues = maxValues
+        self.maxValueLen = maxValueLen
+        self.maxSqlLen = maxSqlLen
+
+    def before(self, sql, values=None):
+        ''' 执行前调用。慢查询模式返回开始时间，交给after判断是否记录；否则按级别和采样直接记录
+        --
+        '''
+        if not _log.isEnabledFor(self.level):
+            return None
+        if self.slowThreshold is not None:
+            return time.perf_counter()
+        if self.sample == 1 or next(self._counter) % self.sample == 0:
+            _log.log(self.level, '执行sql语句：%s；值：%s', self._sql(sql), self._values(values))
+        return None
+
+    def after(self, start, sql, values=None):
+        ''' 执行后调用，start为before的返回值，只在慢查询模式下记录
+        --
+        '''
+        if start is None:
+            return
+        cost = time.perf_counter() - start
+        if cost >= self.slowThreshold:
+            _log.log(self.level, '慢查询，耗时%.3f秒：%s；值：%s', cost, self._sql(sql), self._values(values))
+
+    def _sql(self, sql):
+        return _Truncated(sql, 1, self.maxSqlLen)
+
+    def _values(self, values):
+        return _Truncated(values, self.maxValues, self.maxValueLen)
+
+
+# 所有Orm共享的sql日志
+sqlLog = SqlLog()
@@ -0,0 +1,234 @@
+import itertools
+from .constant import PRIMARY_KEY
+from .orm import Orm
+from .async_orm import AsyncOrm, _maybeAwait
+from .PooledDB import PooledDB
+from .AsyncPooledDB import AsyncPooledDB
+from .Pools import Pool
+
+__all__ = ['Transaction', 'AsyncTransaction']
+
+# 保存点名称序号
+_savepointIds = itertools.count()
+
+# 正在进行的事务 {id(连接): Transaction}，同一连接上再开启事务时使用保存点
+_active = {}
+
+
+class Transaction(object):
+    def __init__(self, conn, *orms):
+        ''' 事务（工作单元）：with块内参与的Orm共用一个连接，不再逐条提交，正常退出时提交一次，出错时回滚。
+            同一连接上嵌套的事务使用保存点，出错只回滚到保存点。
+            事务期间参与的Orm不读写主键缓存和查询结果缓存，提交或回滚后使涉及的缓存失效
+        --
+            @example
+                with stuOrm.transaction(studyOrm) as tx:
+                    stuOrm.insertOne({'name': '王五', 'age': 20})
+                    studyOrm.insertOne({'sid': 3, 'cid': 1})
+                    tx.orm('course', 'cid').updateByPrimaryKey({'cid': 1, 'name': '数学'})
+
+                with Transaction(pool) as tx:
+                    tx.orm('student', 'sid').deleteByPrimaryKey(1)
+
+            @param conn: 数据库连接，或者PooledDB连接池、Pool对象（从中取一个独立连接，退出时归还）。
+                        PooledDB中的连接请使用pool.connection(False)，共享连接不能用于事务
+            @param orms: 参与事务的Orm，事务期间改为使用conn
+        '''
+        self.conn = conn
+        self.orms = list(orms)
+        self.parent = None
+        self.savepoint = None
+        self._ownConn = False
+        # [(orm, 原连接, 原auto_commit, 原事务)]
+        self._saved = []
+        # 参与过事务的Orm，提交或回滚后使它们的缓存失效
+        self._touched = []
+
+    def orm(self, tableName, keyProperty=PRIMARY_KEY):
+        ''' 创建一个使用事务连接的Orm
+        --
+            @param tableName: 表名
+            @param keyProperty: 主键字段名
+        '''
+        orm = self._ormClass()(self.conn, tableName, keyProperty, False)
+        self._join(orm)
+        return orm
+
+    def join(self, *orms):
+        ''' 让已有的Orm加入事务
+        --
+        '''
+        for orm in orms:
+            self._join(orm)
+        return self
+
+    def _ormClass(self):
+        return Orm
+
+    def autoCommitOf(self, orm):
+        ''' orm加入事务前的auto_commit
+        --
+        '''
+        tx = self
+        autoCommit = orm.auto_commit
+        while tx is not None:
+            prev = None
+            for o, _, a, t in tx._saved:
+                if o is orm:
+                    autoCommit, prev = a, t
+                    break
+            tx = prev
+        return autoCommit
+
+    def _join(self, orm):
+        if any(o is orm for o, _, _, _ in self._saved):
+            return
+        self._saved.append((orm, orm.conn, orm.auto_commit, orm._tx))
+        orm.conn = self.conn
+        orm.auto_commit = False
+        orm._tx = self
+        self._root()._touched.append(orm)
+
+    def _restore(self):
+        while self._saved:
+            orm, conn, autoCommit, tx = self._saved.pop()
+            orm.conn = conn
+            orm.auto_commit = autoCommit
+            orm._tx = tx
+
+    def _root(self):
+        tx = self
+        while tx.parent is not None:
+            tx = tx.parent
+        return tx
+
+    def _invalidateTouched(self, orms):
+        for orm in orms:
+            orm._invalidate()
+
+    def __enter__(self):
+        if isinstance(self.conn, PooledDB):
+            self.conn = self.conn.connection(False)
+            self._ownConn = True
+        elif isinstance(self.conn, Pool):
+            self.conn = self.conn.conn()
+            self._ownConn = True
+        self.parent = _active.get(id(self.conn))
+        if self.parent is None:
+            begin = getattr(self.conn, 'begin', None)
+            if begin is not None:
+                # SteadyDB连接据此在事务期间不再透明重连
+                begin()
+        else:
+            self.savepoint = 'pyormx_sp_{}'.format(next(_savepointIds))
+            _executeSql(self.conn, 'SAVEPOINT ' + self.savepoint)
+        _active[id(self.conn)] = self
+        self.join(*self.orms)
+        return self
+
+    def __exit__(self, excType, exc, tb):
+        orms = [o for o, _, _, _ in self._saved]
+        try:
+            if self.parent is not None:
+                if excType is None:
+                    _executeSql(self.conn, 'RELEASE SAVEPOINT ' + self.savepoint)
+                else:
+                    _executeSql(self.conn, 'ROLLBACK TO SAVEPOINT ' + self.savepoint)
+                    self._invalidateTouched(orms)
+            elif excType is None:
+                try:
+                    self.conn.commit()
+                except Exception:
+                    self.conn.rollback()
+                    raise
+                finally:
+                    # 语句执行时已使缓存失效，但提交前其他线程可能又缓存了旧数据
+                    self._invalidateTouched(self._touched)
+            else:
+                self.conn.rollback()
+                self._invalidateTouched(self._touched)
+        finally:
+            self._restore()
+            if self.parent is None:
+                _active.pop(id(self.conn), None)
+            else:
+                _active[id(self.conn)] = self.parent
+            if self._ownConn:
+                self.conn.close()
+        return False
+
+
+class AsyncTransaction(Transaction):
+    def __init__(self, conn, *orms):
+        ''' Transaction的异步版本，参数同Transaction，conn可以是AsyncPooledDB连接池
+        --
+            @example
+                async with stuOrm.transaction() as tx:
+                    await stuOrm.insertOne({'name': '王五', 'age': 20})
+        '''
+        super().__init__(conn, *orms)
+
+    def _ormClass(self):
+        return AsyncOrm
+
+    async def __aenter__(self):
+        if isinstance(self.conn, AsyncPooledDB):
+            self.conn = await self.conn.connection()
+            self._ownConn = True
+        self.parent = _active.get(id(self.conn))
+        if self.parent is None:
+            begin = getattr(self.conn, 'begin', None)
+            if begin is not None:
+                await _maybeAwait(begin())
+        else:
+            self.savepoint = 'pyormx_sp_{}'.format(next(_savepointIds))
+            await _executeSqlAsync(self.conn, 'SAVEPOINT ' + self.savepoint)
+        _active[id(self.conn)] = self
+        self.join(*self.orms)
+        return self
+
+    async def __aexit__(self, excType, exc, tb):
+        orms = [o for o, _, _, _ in self._saved]
+        try:
+            if self.parent is not None:
+                if excType is None:
+                    await _executeSqlAsync(self.conn, 'RELEASE SAVEPOINT ' + self.savepoint)
+                else:
+                    await _executeSqlAsync(self.conn, 'ROLLBACK TO SAVEPOINT ' + self.savepoint)
+                    self._invalidateTouched(orms)
+            elif excType is None:
+                try:
+                    await _maybeAwait(self.conn.commit())
+                except Exception:
+                    await _maybeAwait(self.conn.rollback())
+                    raise
+                finally:
+                    self._invalidateTouched(self._touched)
+            else:
+                await _maybeAwait(self.conn.rollback())
+                self._invalidateTouched(self._touched)
+        finally:
+            self._restore()
+            if self.parent is None:
+                _active.pop(id(self.conn), None)
+            else:
+                _active[id(self.conn)] = self.parent
+            if self._ownConn:
+                await _maybeAwait(self.conn.close())
+        return False
+
+
+def _executeSql(conn, sql):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql)
+    finally:
+        cursor.close()
+
+
+async def _executeSqlAsync(conn, sql):
+    cursor = await _maybeAwait(conn.cursor())
+    try:
+        await cursor.execute(sql)
+    finally:
+        await _maybeAwait(cursor.close())
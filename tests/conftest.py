@@ -0,0 +1,27 @@
+import os
+import sys
+import pytest
+
+# 不安装也能直接运行pytest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import fake_mysql  # noqa: E402
+from pyormx import orm as ormModule  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    db = fake_mysql.Database()
+    db.create('student', 'sid', [{'sid': 1, 'name': 'old', 'age': 18}, {'sid': 2, 'name': 'other', 'age': 19}])
+    return db
+
+
+@pytest.fixture(autouse=True)
+def resetCaches():
+    ''' 主键缓存和查询结果缓存是模块级的，每个测试前后清空
+    '''
+    ormModule._pkCaches.clear()
+    ormModule.Orm.disableQueryCache()
+    yield
+    ormModule._pkCaches.clear()
+    ormModule.Orm.disableQueryCache()
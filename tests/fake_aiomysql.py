@@ -0,0 +1,62 @@
+''' 测试用的异步驱动，包装fake_mysql，方法与aiomysql一样需要await
+--
+'''
+import asyncio
+import fake_mysql
+
+
+class Cursor(object):
+    def __init__(self, con, cursor):
+        self._con = con
+        self._cursor = cursor
+
+    async def execute(self, sql, values=None):
+        # 和真实连接一样，同一个连接上不能同时执行两条语句
+        if self._con.busy:
+            raise fake_mysql.InternalError('连接上已有语句在执行')
+        self._con.busy = True
+        try:
+            if self._con.executeDelay:
+                await asyncio.sleep(self._con.executeDelay)
+            return self._cursor.execute(sql, values)
+        finally:
+            self._con.busy = False
+
+    async def fetchall(self):
+        return self._cursor.fetchall()
+
+    async def fetchone(self):
+        return self._cursor.fetchone()
+
+    async def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    async def close(self):
+        self._cursor.close()
+
+
+class Connection(object):
+    def __init__(self, con):
+        self._con = con
+        # rollback和execute等待的秒数，模拟网络往返
+        self.rollbackDelay = 0
+        self.executeDelay = 0
+        self.busy = False
+
+    def cursor(self, *args):
+        return Cursor(self, self._con.cursor())
+
+    async def commit(self):
+        self._con.commit()
+
+    async def rollback(self):
+        if self.rollbackDelay:
+            await asyncio.sleep(self.rollbackDelay)
+        self._con.rollback()
+
+    def close(self):
+        self._con.close()
+
+
+async def connect(db=None, **kw):
+    return Connection(fake_mysql.connect(db))
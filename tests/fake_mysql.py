@@ -0,0 +1,162 @@
+''' 测试用的内存数据库驱动（DB-API），只理解pyormx生成的简单语句。
+    所有连接共用一个Database，每个连接的修改在commit之前只有自己可见
+--
+'''
+import re
+import threading
+import time
+
+threadsafety = 1
+
+
+class Error(Exception):
+    pass
+
+
+class OperationalError(Error):
+    pass
+
+
+class InternalError(Error):
+    pass
+
+
+_UPDATE = re.compile(r'UPDATE\s+`?(\w+)`?\s+SET\s+(.*?)\s+WHERE\s+(.*)$', re.S)
+_SELECT = re.compile(r'SELECT\s.*?\sFROM\s+`?(\w+)`?(.*)$', re.S)
+_WHERE = re.compile(r'\sWHERE\s(.*?)(?:\sLIMIT\s|\sORDER\s|$)', re.S)
+_COND = re.compile(r'(?:`?\w+`?\.)?`(\w+)`\s*(?:(=|>|<)\s*%s|IN\s*\(([%s, ]*)\))')
+
+
+class Database(object):
+    def __init__(self, delay=0):
+        ''' 共享的表数据 {表名: (主键名, {主键值: 行})}
+        --
+            @param delay: 每条语句执行的秒数，模拟慢查询
+        '''
+        self.tables = {}
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.connects = 0
+
+    def create(self, table, key, rows):
+        self.tables[table] = (key, {r[key]: dict(r) for r in rows})
+
+
+class Connection(object):
+    def __init__(self, db):
+        self.db = db
+        self.pending = {}
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+        self.executed = []
+
+    def cursor(self, *args, **kw):
+        return Cursor(self)
+
+    def commit(self):
+        with self.db.lock:
+            for table, rows in self.pending.items():
+                self.db.tables[table][1].update(rows)
+        self.pending = {}
+        self.commits += 1
+
+    def rollback(self):
+        self.pending = {}
+        self.rollbacks += 1
+
+    def ping(self, *args):
+        return True
+
+    def close(self):
+        self.closed = True
+
+    def _rows(self, table):
+        key, rows = self.db.tables[table]
+        with self.db.lock:
+            rows = {k: dict(r) for k, r in rows.items()}
+        rows.update(self.pending.get(table, {}))
+        return key, rows
+
+
+class Cursor(object):
+    def __init__(self, con):
+        self.con = con
+        self.rows = []
+        self.lastrowid = None
+
+    def execute(self, sql, values=None):
+        if self.con.db.delay:
+            time.sleep(self.con.db.delay)
+        values = list(values or [])
+        self.con.executed.append(sql.strip())
+        m = _UPDATE.match(sql.strip())
+        if m:
+            return self._update(m.group(1), _conditions(m.group(2)), _conditions(m.group(3)), values)
+        m = _SELECT.match(sql.strip())
+        if m:
+            where = _WHERE.search(m.group(2))
+            self.rows = self._match(m.group(1), _conditions(where.group(1)) if where else [], values)
+            return len(self.rows)
+        # SAVEPOINT等语句不处理
+        return 0
+
+    def _match(self, table, conditions, values):
+        _, rows = self.con._rows(table)
+        tests = []
+        for column, op, n in conditions:
+            tests.append((column, op, values[:n] if op == 'IN' else values[0]))
+            values = values[n:]
+        return [dict(r) for r in rows.values() if all(_test(r.get(c), op, v) for c, op, v in tests)]
+
+    def _update(self, table, setConditions, whereConditions, values):
+        key = self.con.db.tables[table][0]
+        changes = {c: v for (c, _, _), v in zip(setConditions, values)}
+        rows = self._match(table, whereConditions, values[len(setConditions):])
+        pending = self.con.pending.setdefault(table, {})
+        for row in rows:
+            row.update(changes)
+            pending[row[key]] = row
+        return len(rows)
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+def _conditions(sql):
+    ''' where语句中的条件 [(字段, 操作符, 参数个数)]
+    --
+    '''
+    res = []
+    for column, op, ps in _COND.findall(sql):
+        if op:
+            res.append((column, op, 1))
+        else:
+            res.append((column, 'IN', ps.count('%s')))
+    return res
+
+
+def _test(value, op, arg):
+    if op == '=':
+        return value == arg
+    if op == '>':
+        return value > arg
+    if op == '<':
+        return value < arg
+    return value in arg
+
+
+def connect(db=None, **kw):
+    db.connects += 1
+    return Connection(db)
@@ -0,0 +1,52 @@
+import asyncio
+import pytest
+import fake_aiomysql
+from pyormx import AsyncOrm
+from pyormx.AsyncPooledDB import AsyncPooledDB
+
+
+def test_submit_runs_on_own_pooled_connections(db):
+    async def main():
+        pool = AsyncPooledDB(fake_aiomysql, maxconnections=2, db=db)
+        conn = await pool.connection()
+        orm = AsyncOrm(conn, 'student', 'sid')
+        orm.setSelectProperties(['sid', 'name'])
+        tasks = [orm.submit('selectByPrimaeyKey', i % 2 + 1) for i in range(5)]
+        orm.setSelectProperties(['sid'])
+        rows = await asyncio.gather(*tasks)
+        await conn.close()
+        return pool, rows
+
+    pool, rows = asyncio.run(main())
+    assert [r['name'] for r in rows] == ['old', 'other', 'old', 'other', 'old']
+    assert pool._connections == 0
+
+
+def test_submit_rejects_unpooled_connection(db):
+    async def main():
+        orm = AsyncOrm(await fake_aiomysql.connect(db), 'student', 'sid')
+        with pytest.raises(Exception, match='AsyncPooledDB'):
+            orm.submit('selectAll')
+
+    asyncio.run(main())
+
+
+def test_cancelled_return_frees_the_slot(db):
+    async def main():
+        pool = AsyncPooledDB(fake_aiomysql, maxconnections=1, db=db)
+        conn = await pool.connection()
+        conn._con.rollbackDelay = 0.05
+        waiter = asyncio.get_running_loop().create_task(pool.connection())
+        closing = asyncio.get_running_loop().create_task(conn.close())
+        await asyncio.sleep(0.01)
+        closing.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await closing
+        # the waiting task gets the freed slot instead of hanging
+        conn2 = await asyncio.wait_for(waiter, 1)
+        await conn2.close()
+        return pool
+
+    pool = asyncio.run(main())
+    assert pool._connections == 0
+    assert pool.waiting() == 0
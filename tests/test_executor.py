@@ -0,0 +1,46 @@
+import pytest
+import fake_mysql
+from pyormx import Orm
+from pyormx.PooledDB import PooledDB, TooManyConnections
+from pyormx.executor import OrmExecutor
+
+
+def _pool(db, **kw):
+    return PooledDB(fake_mysql, maxconnections=2, db=db, **kw)
+
+
+def test_submit_at_pool_limit_non_blocking(db):
+    db.delay = 0.05
+    pool = _pool(db, blocking=False)
+    orm = Orm(pool.connection(False), 'student', 'sid')
+    futures = [orm.submit('selectAll') for _ in range(2)]
+    assert [len(f.result()) for f in futures] == [2, 2]
+    assert pool._ormExecutor.maxWorkers == 1
+    assert pool._ormExecutor.stats()['failed'] == 0
+
+
+def test_submit_at_pool_limit_blocking(db):
+    db.delay = 0.02
+    pool = _pool(db, blocking=True)
+    orm = Orm(pool.connection(False), 'student', 'sid')
+    futures = [orm.submit('selectByPrimaeyKey', i % 2 + 1) for i in range(6)]
+    assert [f.result(5)['sid'] for f in futures] == [1, 2, 1, 2, 1, 2]
+    assert pool.stats()['waiting'] == 0
+
+
+def test_explicit_workers_over_limit_fail_fast(db):
+    db.delay = 0.05
+    pool = _pool(db, blocking=False)
+    held = pool.connection(False)
+    with OrmExecutor(pool, maxWorkers=2) as executor:
+        futures = [executor.submit('student', 'selectAll', keyProperty='sid') for _ in range(2)]
+        errors = [f.exception() for f in futures]
+    held.close()
+    assert sum(isinstance(e, TooManyConnections) for e in errors) == 1
+
+
+def test_unlimited_pool_uses_default_workers(db):
+    pool = PooledDB(fake_mysql, db=db)
+    with OrmExecutor(pool) as executor:
+        assert executor.maxWorkers is None
+        assert executor.submit('student', 'selectByPrimaeyKey', 2, keyProperty='sid').result()['name'] == 'other'
@@ -0,0 +1,36 @@
+import asyncio
+import fake_aiomysql
+import fake_mysql
+from pyormx.loader import Loaders
+
+
+def test_sync_loader_batches(db):
+    conn = fake_mysql.connect(db)
+    loaders = Loaders(conn)
+    a = loaders.get('student', 'sid').load(1)
+    b = loaders.get('student', 'sid').load(2)
+    assert (a.result()['name'], b.result()['name']) == ('old', 'other')
+    assert len(conn.executed) == 1
+
+
+def test_async_loaders_share_connection_serially(db):
+    async def main():
+        conn = await fake_aiomysql.connect(db)
+        conn.executeDelay = 0.01
+        loaders = Loaders(conn, asyncMode=True)
+        bySid = loaders.get('student', 'sid')
+        byAge = loaders.get('student', 'age')
+        first = await asyncio.gather(bySid.load(1), byAge.load(19), bySid.load(2))
+        # 第一轮查询进行中再加入的键在下一轮查询
+        late = asyncio.gather(bySid.load(2), byAge.load(18))
+        await asyncio.sleep(0)
+        second = await asyncio.gather(late, byAge.loadBy('name', 'old'))
+        await asyncio.sleep(0)
+        return first, second, loaders
+
+    first, second, loaders = asyncio.run(main())
+    assert [r['sid'] for r in first] == [1, 2, 2]
+    assert [r['sid'] for r in second[0]] == [2, 1]
+    assert [r['sid'] for r in second[1]] == [1]
+    for loader in loaders._loaders.values():
+        assert not loader._tasks
@@ -0,0 +1,38 @@
+import threading
+import fake_mysql
+from pyormx.PooledDB import PooledDB
+
+
+def test_concurrent_checkouts_stay_within_limit(db):
+    pool = PooledDB(fake_mysql, maxconnections=4, blocking=True, db=db)
+    lock = threading.Lock()
+    inUse = [0, 0]
+
+    def work():
+        for _ in range(200):
+            con = pool.connection(False)
+            with lock:
+                inUse[0] += 1
+                inUse[1] = max(inUse)
+            with lock:
+                inUse[0] -= 1
+            con.close()
+
+    workers = [threading.Thread(target=work) for _ in range(16)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    stats = pool.stats()
+    assert inUse[1] <= 4
+    assert db.connects <= 4
+    assert (stats['in_use'], stats['waiting']) == (0, 0)
+    assert stats['idle'] == db.connects
+
+
+def test_idle_cache_is_lifo(db):
+    pool = PooledDB(fake_mysql, mincached=2, db=db)
+    first = pool.connection(False)
+    raw = first._con
+    first.close()
+    assert pool.connection(False)._con is raw
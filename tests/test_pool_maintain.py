@@ -0,0 +1,43 @@
+import threading
+import time
+import pytest
+import fake_mysql
+from pyormx.PooledDB import PooledDB, TooManyConnections
+
+
+def _blockPings(monkeypatch):
+    pinging = threading.Semaphore(0)
+    release = threading.Event()
+
+    def ping(self, *args):
+        pinging.release()
+        release.wait(5)
+        return True
+
+    monkeypatch.setattr(fake_mysql.Connection, 'ping', ping)
+    return pinging, release
+
+
+def test_pinged_connections_hold_their_slots(db, monkeypatch):
+    pool = PooledDB(fake_mysql, mincached=2, maxconnections=2, blocking=True, db=db)
+    assert db.connects == 2
+    pinging, release = _blockPings(monkeypatch)
+    maintenance = threading.Thread(target=pool.maintain)
+    maintenance.start()
+    assert pinging.acquire(timeout=5)
+    assert pool.stats()['in_use'] == 2
+    with pytest.raises(TooManyConnections):
+        pool.connection(False, timeout=0.01)
+
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.connection(False)))
+    waiter.start()
+    while pool.stats()['waiting'] != 1:
+        time.sleep(0.001)
+    release.set()
+    maintenance.join(5)
+    waiter.join(5)
+    assert db.connects == 2
+    got[0].close()
+    stats = pool.stats()
+    assert (stats['in_use'], stats['idle']) == (0, 2)
@@ -0,0 +1,92 @@
+import importlib
+import threading
+import time
+import pytest
+import fake_mysql
+from pyormx.PooledDB import PooledDB, InvalidConnection, TooManyConnections
+
+pooledModule = importlib.import_module('pyormx.PooledDB')
+
+
+class Interrupted(Exception):
+    pass
+
+
+def _pool(db):
+    return PooledDB(fake_mysql, maxconnections=1, blocking=True, db=db)
+
+
+def _waitFor(pool, n):
+    while len(pool._waiters) != n:
+        time.sleep(0.001)
+
+
+def _inThread(target):
+    res = []
+
+    def run():
+        try:
+            res.append(target())
+        except BaseException as e:
+            res.append(e)
+
+    t = threading.Thread(target=run)
+    t.start()
+    return t, res
+
+
+def test_interrupted_waiter_leaves_the_queue(db, monkeypatch):
+    class InterruptedCondition(threading.Condition):
+        def wait(self, timeout=None):
+            raise Interrupted()
+
+    pool = _pool(db)
+    held = pool.connection(False)
+    monkeypatch.setattr(pooledModule, 'Condition', InterruptedCondition)
+    with pytest.raises(Interrupted):
+        pool.connection(False)
+    monkeypatch.undo()
+    assert not pool._waiters
+    assert pool.stats()['waiting'] == 0
+    held.close()
+    pool.connection(False, timeout=1).close()
+
+
+def test_waiter_interrupted_after_grant_passes_the_slot_on(db, monkeypatch):
+    class LateInterruptedCondition(threading.Condition):
+        def wait(self, timeout=None):
+            super().wait(timeout)
+            raise Interrupted()
+
+    pool = _pool(db)
+    held = pool.connection(False)
+    monkeypatch.setattr(pooledModule, 'Condition', LateInterruptedCondition)
+    t, res = _inThread(lambda: pool.connection(False))
+    _waitFor(pool, 1)
+    monkeypatch.undo()
+    held.close()
+    t.join(1)
+    assert isinstance(res[0], Interrupted)
+    assert pool._connections == 0
+    pool.connection(False, timeout=1).close()
+
+
+def test_close_wakes_waiters(db):
+    pool = _pool(db)
+    held = pool.connection(False)
+    t, res = _inThread(lambda: pool.connection(False))
+    _waitFor(pool, 1)
+    pool.close()
+    t.join(1)
+    assert not t.is_alive()
+    assert isinstance(res[0], InvalidConnection)
+    held.close()
+
+
+def test_waiter_timeout(db):
+    pool = _pool(db)
+    held = pool.connection(False)
+    with pytest.raises(TooManyConnections):
+        pool.connection(False, timeout=0.01)
+    assert not pool._waiters
+    held.close()
@@ -0,0 +1,33 @@
+import fake_mysql
+from pyormx import Orm
+
+
+def _orm(db):
+    db.create('student', 'sid', [{'sid': i, 'name': 'n%d' % i, 'age': 18} for i in range(1, 11)])
+    return Orm(fake_mysql.connect(db), 'student', 'sid')
+
+
+def test_dedupes_and_chunks(db):
+    orm = _orm(db)
+    res = orm.selectByPrimaryKeys([1, 2, 2, 3, 4, 5, 99], chunkSize=2)
+    assert sorted(res) == [1, 2, 3, 4, 5]
+    assert res[3]['name'] == 'n3'
+    assert len(orm.conn.executed) == 3
+
+
+def test_only_misses_hit_the_database(db):
+    orm = _orm(db).enablePrimaryKeyCache()
+    orm.selectByPrimaeyKey(1)
+    orm.selectByPrimaryKeys([1, 2])
+    assert orm.conn.executed[-1].count('%s') == 1
+    count = len(orm.conn.executed)
+    assert sorted(orm.selectByPrimaryKeys([1, 2])) == [1, 2]
+    assert len(orm.conn.executed) == count
+
+
+def test_update_invalidates_key(db):
+    orm = _orm(db).enablePrimaryKeyCache()
+    assert orm.selectByPrimaeyKey(1)['name'] == 'n1'
+    orm.updateByPrimaryKey({'sid': 1, 'name': 'changed'})
+    assert orm.selectByPrimaeyKey(1)['name'] == 'changed'
+    assert orm.selectByPrimaryKeys([1])[1]['name'] == 'changed'
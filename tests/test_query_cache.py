@@ -0,0 +1,75 @@
+import threading
+import time
+import pytest
+from pyormx.query_cache import QueryCache, LocalBackend, PickleBackend, tableNames
+
+
+@pytest.mark.parametrize('backendClass', [LocalBackend, PickleBackend])
+def test_invalidate_through_shared_backend(backendClass):
+    backend = backendClass()
+    a, b = QueryCache(backend), QueryCache(backend)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return [{'sid': len(loads)}]
+
+    assert a.load(('student',), 'q', [1], loader) == [{'sid': 1}]
+    assert b.load(('student',), 'q', [1], loader) == [{'sid': 1}]
+    b.invalidate('student')
+    assert a.load(('student',), 'q', [1], loader) == [{'sid': 2}]
+    # 其他表的修改不影响
+    a.invalidate('course')
+    assert b.load(('student',), 'q', [1], loader) == [{'sid': 2}]
+    assert len(loads) == 2
+
+
+def test_result_changed_during_load_is_not_cached():
+    cache = QueryCache()
+
+    def loader():
+        cache.invalidate('student')
+        return [{'sid': 1}]
+
+    cache.load(('student',), 'q', None, loader)
+    cache.load(('student',), 'q', None, loader)
+    assert cache.info()['misses'] == 2
+
+
+def test_single_flight():
+    cache = QueryCache()
+    started = threading.Event()
+    release = threading.Event()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        started.set()
+        release.wait(5)
+        return [{'sid': 1}]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.load(('student',), 'q', None, loader)))
+               for _ in range(5)]
+    threads[0].start()
+    started.wait(5)
+    for t in threads[1:]:
+        t.start()
+    while cache.info()['waits'] < 4:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert len(loads) == 1
+    assert results == [[{'sid': 1}]] * 5
+
+
+def test_results_are_copies():
+    cache = QueryCache()
+    cache.load(('student',), 'q', None, lambda: [{'sid': 1}])
+    cache.load(('student',), 'q', None, lambda: None)[0]['sid'] = 2
+    assert cache.load(('student',), 'q', None, lambda: None) == [{'sid': 1}]
+
+
+def test_table_names():
+    assert tableNames('`student`', ' LEFT JOIN study ON study.sid=student.sid ') == ('student', 'study')
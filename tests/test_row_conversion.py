@@ -0,0 +1,32 @@
+import datetime
+import uuid
+from decimal import Decimal
+import pytest
+from pyormx.sql_utils import rowsToStr, dataToStr, columnConverter
+
+_COLUMNS = {
+    'plain': [1, 'a', 1.5, True],
+    'none': [None, 1, 'a'],
+    'date': [datetime.date(2020, 1, 2), datetime.datetime(2020, 1, 2, 3, 4, 5)],
+    'uuid': [uuid.UUID(int=1)],
+    'decimal': [Decimal('1.50'), None],
+    'json': [{'k': 1}, [1, 2], {'d': Decimal('2.5')}],
+    'mixed': [None, {'k': 1}, datetime.date(2020, 1, 2), 3, 'x', b'b'],
+}
+
+
+@pytest.mark.parametrize('name', sorted(_COLUMNS))
+def test_column_matches_per_value(name):
+    values = _COLUMNS[name]
+    rows = [[v, i] for i, v in enumerate(values)]
+    assert [list(r) for r in rowsToStr(rows)] == [[dataToStr(v), i] for i, v in enumerate(values)]
+
+
+def test_plain_rows_are_returned_as_is():
+    rows = [[1, 'a'], [2, 'b']]
+    assert rowsToStr(rows) is rows
+    assert columnConverter([1, 2.5, 'a', True]) is None
+
+
+def test_empty():
+    assert rowsToStr([]) == []
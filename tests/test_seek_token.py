@@ -0,0 +1,44 @@
+import datetime
+from decimal import Decimal
+import pytest
+import fake_mysql
+from pyormx import Orm
+from pyormx.orm import _encodeToken, _decodeToken
+
+_KEYS = [
+    1,
+    'abc',
+    1.5,
+    Decimal('12.50'),
+    datetime.datetime(2024, 5, 6, 7, 8, 9, 123456),
+    datetime.datetime(2024, 5, 6, 7, 8, 9, tzinfo=datetime.timezone(datetime.timedelta(hours=8))),
+    datetime.date(2024, 5, 6),
+    datetime.time(7, 8, 9),
+    datetime.timedelta(days=-1, seconds=5, microseconds=7),
+    b'\x00\xff',
+]
+
+
+@pytest.mark.parametrize('key', _KEYS, ids=lambda k: type(k).__name__)
+def test_token_round_trip_keeps_type(key):
+    seek = _decodeToken(_encodeToken({'k': key, 'n': 3}))
+    assert seek == {'k': key, 'n': 3}
+    assert type(seek['k']) is type(key)
+
+
+def test_seek_sql_binds_restored_value(db):
+    orm = Orm(fake_mysql.connect(db), 'student', 'sid')
+    token = _encodeToken({'k': Decimal('0.10'), 'n': None})
+    sql, values = orm._seekSql(None, _decodeToken(token), 10, 'score')
+    assert values == [Decimal('0.10'), 11]
+    assert isinstance(values[0], Decimal)
+    assert '`student`.`score` > %s' in sql
+
+
+def test_invalid_token():
+    with pytest.raises(Exception, match='无效的分页游标'):
+        _decodeToken('not a token')
+
+
+def test_empty_token():
+    assert _decodeToken(None) == {}
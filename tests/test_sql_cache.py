@@ -0,0 +1,42 @@
+from decimal import Decimal
+import fake_mysql
+from pyormx import Orm, Example
+from pyormx.orm import _encodeToken, _decodeToken
+
+
+def _orm(db):
+    return Orm(fake_mysql.connect(db), 'student', 'sid')
+
+
+def test_pages_share_one_statement(db):
+    orm = _orm(db)
+    example = Example().andEqualTo({'name': 'old'})
+    sqls = set()
+    for startId in (0, 10, 20, 30):
+        sql, values = orm._selectPageSql(example, startId, 10)
+        sqls.add(sql)
+        assert values == ['old', startId, 10]
+        sql, values = orm._selectPageSql(None, startId, 10)
+        sqls.add(sql)
+        assert values == [startId, 10]
+    assert len(sqls) == 2
+
+
+def test_seek_pages_share_one_statement(db):
+    orm = _orm(db)
+    first = orm._seekSql(None, {}, 10)
+    seek = _decodeToken(_encodeToken({'k': Decimal('3.5'), 'n': None}))
+    sqls = {orm._seekSql(None, seek, n)[0] for n in (10, 20, 50)}
+    assert first[1] == [11]
+    assert orm._seekSql(None, seek, 20)[1] == [Decimal('3.5'), 21]
+    assert len(sqls) == 1
+
+
+def test_same_shape_reuses_cached_sql(db):
+    orm = _orm(db)
+    before = Orm.sqlCacheInfo()
+    for name in ('a', 'b', 'c'):
+        orm._selectByExampleSql(Example().andEqualTo({'name': name}))
+    info = Orm.sqlCacheInfo()
+    assert info['misses'] - before['misses'] <= 1
+    assert info['hits'] - before['hits'] >= 2
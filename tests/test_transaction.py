@@ -0,0 +1,52 @@
+import pytest
+import fake_mysql
+from pyormx import Orm
+from pyormx.PooledDB import PooledDB
+from pyormx.transaction import Transaction
+
+
+def test_commit_once(db):
+    conn = fake_mysql.connect(db)
+    orm = Orm(conn, 'student', 'sid')
+    with orm.transaction():
+        orm.updateByPrimaryKey({'sid': 1, 'name': 'a'})
+        orm.updateByPrimaryKey({'sid': 2, 'name': 'b'})
+    assert (conn.commits, conn.rollbacks) == (1, 0)
+    assert orm.auto_commit and orm._tx is None
+    assert Orm(fake_mysql.connect(db), 'student', 'sid').selectByPrimaeyKey(2)['name'] == 'b'
+
+
+def test_rollback_on_error(db):
+    conn = fake_mysql.connect(db)
+    orm = Orm(conn, 'student', 'sid')
+    with pytest.raises(RuntimeError):
+        with orm.transaction():
+            orm.updateByPrimaryKey({'sid': 1, 'name': 'a'})
+            raise RuntimeError()
+    assert (conn.commits, conn.rollbacks) == (0, 1)
+    assert orm.selectByPrimaeyKey(1)['name'] == 'old'
+
+
+def test_nested_transaction_uses_savepoint(db):
+    conn = fake_mysql.connect(db)
+    orm = Orm(conn, 'student', 'sid')
+    with orm.transaction():
+        with pytest.raises(RuntimeError):
+            with Transaction(conn, orm):
+                raise RuntimeError()
+        with Transaction(conn, orm) as inner:
+            assert inner.parent is not None
+        assert orm._tx is not None
+    statements = [s.split()[0] for s in conn.executed if 'SAVEPOINT' in s]
+    assert statements == ['SAVEPOINT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE']
+    assert (conn.commits, conn.rollbacks) == (1, 0)
+
+
+def test_orm_joined_from_pool_gets_restored(db):
+    pool = PooledDB(fake_mysql, db=db)
+    outside = Orm(fake_mysql.connect(db), 'student', 'sid')
+    with Transaction(pool, outside) as tx:
+        assert outside.conn is tx.conn
+        assert tx.orm('student', 'sid').auto_commit is False
+    assert outside.conn is not tx.conn
+    assert outside.auto_commit
@@ -0,0 +1,64 @@
+import pytest
+import fake_mysql
+from pyormx import Orm, Example
+
+
+def _orms(db):
+    a = Orm(fake_mysql.connect(db), 'student', 'sid')
+    b = Orm(fake_mysql.connect(db), 'student', 'sid')
+    a.enablePrimaryKeyCache()
+    Orm.enableQueryCache()
+    return a, b
+
+
+def _byName(orm, name):
+    return orm.selectByExample(Example().andEqualTo({'name': name}), cache=True)
+
+
+def test_transaction_sees_own_write_after_other_connection_caches(db):
+    a, b = _orms(db)
+    with a.transaction():
+        a.updateByPrimaryKey({'sid': 1, 'name': 'new'})
+        assert b.selectByPrimaeyKey(1)['name'] == 'old'
+        assert _byName(b, 'old')
+        assert a.selectByPrimaeyKey(1)['name'] == 'new'
+        assert a.selectByPrimaryKeys([1, 2])[1]['name'] == 'new'
+        assert _byName(a, 'old') == []
+    assert b.selectByPrimaeyKey(1)['name'] == 'new'
+    assert _byName(b, 'old') == []
+
+
+def test_uncommitted_rows_are_not_cached(db):
+    a, b = _orms(db)
+    with pytest.raises(RuntimeError):
+        with a.transaction():
+            a.updateByPrimaryKey({'sid': 1, 'name': 'new'})
+            assert a.selectByPrimaeyKey(1)['name'] == 'new'
+            assert a.selectByPrimaryKeys([1])[1]['name'] == 'new'
+            assert _byName(a, 'new')
+            assert b.selectByPrimaeyKey(1)['name'] == 'old'
+            assert _byName(b, 'new') == []
+            raise RuntimeError()
+    assert b.selectByPrimaeyKey(1)['name'] == 'old'
+    assert b.selectByPrimaryKeys([1])[1]['name'] == 'old'
+    assert _byName(b, 'new') == []
+
+
+def test_manual_commit_orm_bypasses_cache(db):
+    a, b = _orms(db)
+    a.autoCommit(False)
+    a.updateByPrimaryKey({'sid': 1, 'name': 'new'})
+    assert a.selectByPrimaeyKey(1)['name'] == 'new'
+    assert b.selectByPrimaeyKey(1)['name'] == 'old'
+    a.conn.rollback()
+    assert b.selectByPrimaeyKey(1)['name'] == 'old'
+
+
+def test_committed_reads_use_cache(db):
+    a, b = _orms(db)
+    b.selectByPrimaeyKey(1)
+    b.selectByPrimaeyKey(1)
+    assert a.primaryKeyCacheInfo()['hits'] == 1
+    _byName(b, 'old')
+    _byName(b, 'old')
+    assert Orm.queryCacheInfo()['hits'] == 1